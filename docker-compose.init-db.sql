@@ -22,6 +22,9 @@ GRANT ALL PRIVILEGES ON DATABASE jsinfo TO jsinfo;
 -- Connect to jsinfo database and create schema
 \c jsinfo jsinfo;
 
+-- per statement timings, read by tests/query_endpoints/sql_attribution.py
+CREATE EXTENSION IF NOT EXISTS pg_stat_statements;
+
 CREATE TABLE IF NOT EXISTS "agg_consumer_alltime_relay_payments" (
 	"consumer" text,
 	"spec_id" text,
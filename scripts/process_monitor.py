@@ -1,52 +1,1859 @@
 #!/usr/bin/env python3 -u
 
-import subprocess
-import time
+# jsinfo/scripts/process_monitor.py
+#
+# Runs a command and kills it when it stops producing output.
+#
+#   python3 -u scripts/process_monitor.py 600 "bun run dist/src/indexer.js"
+#
+# With --restart the monitor stays alive and relaunches the command with a
+# jittered exponential backoff instead of relying on an outer shell loop:
+#
+#   python3 -u scripts/process_monitor.py --restart 600 "bun run dist/src/indexer.js"
+#
+# The child's process tree can be sampled from /proc and restarted when it
+# stays over a memory or CPU ceiling:
+#
+#   python3 -u scripts/process_monitor.py --restart --max-rss-mb 4096 \
+#       --stats-jsonl /tmp/query.jsonl --stats-prom /tmp/query.prom 0 "bun run dist/src/query.js"
+#
+# For the indexer, liveness can follow block heights in the log instead of
+# any output, with blocks/sec and lag served on a local /metrics endpoint:
+#
+#   python3 -u scripts/process_monitor.py --restart --progress-timeout 1800 \
+#       --metrics-port 9464 600 "bun run dist/src/indexer.js"
+#
+# Before the monitor stops a stuck child it can ask it for diagnostics
+# (SIGUSR2 makes indexer.js and query.js write a heap snapshot) and keeps the
+# snapshot together with the last lines of output:
+#
+#   python3 -u scripts/process_monitor.py --restart --diag-dir /tmp/jsinfo-diagnostics \
+#       600 "bun run dist/src/indexer.js"
+#
+# Several children (the indexer plus a pool of query workers) can be run from
+# one TOML or JSON config, each with its own timeout, restart policy, CPU
+# pinning and environment, see scripts/process_monitor.example.toml:
+#
+#   python3 -u scripts/process_monitor.py --config scripts/process_monitor.example.toml
+#
+# Query workers can be replaced without dropping requests: the replacement is
+# started next to the old worker (sharing the port with JSINFO_QUERY_REUSE_PORT),
+# probed and warmed through its own loopback port, and only then is the old
+# worker drained. Rolls happen on ceilings, after --max-uptime and on SIGHUP:
+#
+#   JSINFO_QUERY_REUSE_PORT=true python3 -u scripts/process_monitor.py --rolling \
+#       --direct-port 18081 --max-rss-mb 4096 0 "bun run dist/src/query.js"
+#
+# A child that still logs but no longer answers can be caught over HTTP: the
+# monitor polls /health and /islatest on a kept-alive connection and restarts
+# (or with --probe-action alert only reports) after consecutive failures:
+#
+#   python3 -u scripts/process_monitor.py --restart --probe-port 8081 --probe-interval 5 \
+#       0 "bun run dist/src/query.js"
+#
+# The Supervisor class can also be imported and driven from other tooling:
+#
+#   from process_monitor import Supervisor
+#   exit_code = asyncio.run(Supervisor("bun run dist/src/query.js", 600).run())
+
+import argparse
+import asyncio
+import bisect
+import collections
+import fcntl
+import itertools
+import json
 import os
+import random
+import re
 import signal
+import subprocess
 import sys
-import threading
+import time
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11, JSON configs still work
+    tomllib = None
+
+READ_CHUNK_SIZE = 256 * 1024
+# Linux F_SETPIPE_SZ, grows the stdout pipes so writers rarely block between reads
+F_SETPIPE_SZ = 1031
+PIPE_SIZE = 1024 * 1024
+OUTPUT_BUFFER_BYTES = 16 * 1024 * 1024
+# Linux IOV_MAX
+MAX_WRITEV_CHUNKS = 1024
+# how long a stopping monitor waits for buffered output to reach stdout
+OUTPUT_DRAIN_TIMEOUT = 5
+# SIGTERM to SIGKILL grace when the monitor decides to restart a child
+KILL_GRACE_SECONDS = 10
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+# block heights in the indexer.js log stream (indexerFillupBlocks.ts)
+INDEXER_HEIGHT_REGEX = r'doBatch: Inserted block (\d+) into DB'
+INDEXER_CHAIN_HEIGHT_REGEX = r'retrieved latest blockchain height: (\d+)'
+# longest partial line kept between reads while looking for progress lines
+PROGRESS_TAIL_BYTES = 4096
+# output kept in memory for diagnostics captures
+LOG_TAIL_BYTES = 1024 * 1024
+# tells the child where to write artifacts when it gets the diagnostics signal
+DIAGNOSTICS_DIR_ENV = 'JSINFO_DIAGNOSTICS_DIR'
+DIAGNOSTICS_POLL_SECONDS = 1.0
+# longest partial line held back when several children share stdout
+PARTIAL_LINE_BYTES = 64 * 1024
+RESTART_POLICIES = ('always', 'on-failure', 'never')
+# query.js listens on this loopback port too (queryConsts.ts), only the monitor uses it
+DIRECT_PORT_ENV = 'JSINFO_QUERY_DIRECT_PORT'
+# cacheLinksHandler.ts does not count requests carrying this header
+WARMUP_HEADER = 'X-Jsinfo-Warmup'
+# upper bounds of the probe latency histogram buckets, in seconds
+PROBE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Supervisors waiting for SIGCHLD, only used where pidfd_open is unavailable
+_sigchld_supervisors = set()
+
+_default_output = None
+
+
+def default_output():
+    """The OutputForwarder for this process's stdout, shared by all supervisors."""
+    global _default_output
+    if _default_output is None:
+        _default_output = OutputForwarder(sys.stdout.fileno())
+    return _default_output
+
+
+def _log(*args):
+    line = ' '.join(str(arg) for arg in (time.strftime('%Y-%m-%d %H:%M:%S'), '- process_monitor::') + args)
+    default_output().write(line.encode('utf-8', errors='replace') + b'\n')
+
+
+def _exit_code(returncode):
+    # Popen reports "killed by signal N" as -N, the shell convention is 128 + N
+    if returncode is None:
+        return 1
+    if returncode < 0:
+        return 128 - returncode
+    return returncode
+
+
+def _grow_pipe(fd):
+    # best effort: fails for non-pipes and above /proc/sys/fs/pipe-max-size
+    try:
+        fcntl.fcntl(fd, F_SETPIPE_SZ, PIPE_SIZE)
+    except OSError:
+        pass
+
+
+def _on_sigchld():
+    for supervisor in list(_sigchld_supervisors):
+        supervisor._check_exit()
+
+
+def _session_stats(session_id):
+    # yields (pid, stat fields after comm) for every live process in the session
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % entry, 'rb') as f:
+                stat = f.read()
+            # comm may contain spaces and parentheses, fields start after the last ')'
+            fields = stat[stat.rindex(b')') + 2:].split()
+            # zombies are gone already, they just wait for init to reap them
+            if int(fields[3]) != session_id or fields[0] == b'Z':
+                continue
+        except (OSError, ValueError, IndexError):
+            # the process exited while we were looking at it
+            continue
+        yield int(entry), fields
+
+
+def session_leaves(session_id):
+    """Pids in the session that have no children of their own.
+
+    These are the processes doing the work; the shell that started them
+    would just die from a signal it does not handle.
+    """
+    parents = {}
+    for pid, fields in _session_stats(session_id):
+        parents[pid] = int(fields[1])
+    return sorted(set(parents) - set(parents.values()))
+
+
+def sample_process_tree(session_id):
+    """Sums /proc counters over every live process in the given session.
+
+    Children run in their own session, so this covers everything the shell
+    started, including processes that were reparented after their parent died.
+    """
+    sample = {'processes': 0, 'rss_bytes': 0, 'cpu_seconds': 0.0, 'open_fds': 0, 'threads': 0}
+    for pid, fields in _session_stats(session_id):
+        try:
+            fds = len(os.listdir('/proc/%d/fd' % pid))
+        except OSError:
+            continue
+        sample['processes'] += 1
+        sample['cpu_seconds'] += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        sample['threads'] += int(fields[17])
+        sample['rss_bytes'] += int(fields[21]) * PAGE_SIZE
+        sample['open_fds'] += fds
+    sample['cpu_seconds'] = round(sample['cpu_seconds'], 3)
+    return sample
+
+
+class MetricsRegistry:
+    """Latest metric values, rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def set(self, name, value, labels=None, kind='gauge', help=''):
+        """Sets a value; a callable is evaluated on every render, None is skipped."""
+        metric = self._metrics.setdefault(name, {'kind': kind, 'help': help, 'values': {}})
+        metric['values'][tuple(sorted((labels or {}).items()))] = value
+
+    def get(self, name, labels=None):
+        metric = self._metrics.get(name)
+        if metric is None:
+            return None
+        return metric['values'].get(tuple(sorted((labels or {}).items())))
+
+    def observe(self, name, value, labels=None, buckets=PROBE_BUCKETS, help=''):
+        """Adds value to a histogram with the given bucket upper bounds."""
+        metric = self._metrics.setdefault(name, {'kind': 'histogram', 'help': help, 'values': {}, 'buckets': buckets})
+        key = tuple(sorted((labels or {}).items()))
+        counts = metric['values'].get(key)
+        if counts is None:
+            # one count per bucket plus +Inf, then sum and count
+            counts = metric['values'][key] = [0] * (len(metric['buckets']) + 1) + [0.0, 0]
+        counts[bisect.bisect_left(metric['buckets'], value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def render(self):
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append('# HELP %s %s' % (name, metric['help']))
+            lines.append('# TYPE %s %s' % (name, metric['kind']))
+            if metric['kind'] == 'histogram':
+                for labels, counts in sorted(metric['values'].items()):
+                    lines.extend(_render_histogram(name, labels, metric['buckets'], counts))
+                continue
+            for labels, value in sorted(metric['values'].items()):
+                if callable(value):
+                    value = value()
+                if value is None:
+                    continue
+                label_text = ','.join('%s="%s"' % (key, _escape_label(val)) for key, val in labels)
+                lines.append('%s{%s} %s' % (name, label_text, value) if label_text else '%s %s' % (name, value))
+        return '\n'.join(lines) + '\n'
+
+
+def _render_histogram(name, labels, buckets, counts):
+    label_text = ''.join('%s="%s",' % (key, _escape_label(val)) for key, val in labels)
+    cumulative = 0
+    for bound, count in zip(list(buckets) + ['+Inf'], counts):
+        cumulative += count
+        yield '%s_bucket{%sle="%s"} %d' % (name, label_text, bound, cumulative)
+    label_text = label_text.rstrip(',')
+    suffix = '{%s}' % label_text if label_text else ''
+    yield '%s_sum%s %s' % (name, suffix, round(counts[-2], 6))
+    yield '%s_count%s %d' % (name, suffix, counts[-1])
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = MetricsRegistry()
+
+
+class ResourceWatch:
+    """Resource sampling and ceilings shared by every run of a child.
+
+    Each sample is appended to jsonl_path, published to the metrics registry
+    and, when prom_path is set, written there atomically for a node_exporter
+    textfile collector. A child whose RSS or CPU stays above a ceiling for
+    ceiling_samples consecutive samples is restarted.
+    """
+
+    def __init__(self, interval=15.0, max_rss_bytes=None, max_cpu_percent=None, ceiling_samples=3,
+                 jsonl_path=None, prom_path=None, registry=None):
+        self.interval = interval
+        self.max_rss_bytes = max_rss_bytes
+        self.max_cpu_percent = max_cpu_percent
+        self.ceiling_samples = ceiling_samples
+        self.prom_path = prom_path
+        self.registry = registry or metrics
+        self._jsonl = open(jsonl_path, 'a', buffering=1) if jsonl_path else None
+
+    def record(self, name, sample):
+        if self._jsonl is not None:
+            self._jsonl.write(json.dumps(dict(sample, ts=round(time.time(), 3), child=name)) + '\n')
+
+        labels = {'child': name}
+        self.registry.set('process_monitor_processes', sample['processes'], labels, help='Processes in the child process tree.')
+        self.registry.set('process_monitor_rss_bytes', sample['rss_bytes'], labels, help='Resident set size of the child process tree.')
+        self.registry.set('process_monitor_cpu_seconds_total', sample['cpu_seconds'], labels, kind='counter',
+                          help='User and system CPU time of the live processes in the child process tree.')
+        self.registry.set('process_monitor_cpu_percent', sample['cpu_percent'], labels,
+                          help='CPU usage of the child process tree since the previous sample, 100 is one core.')
+        self.registry.set('process_monitor_open_fds', sample['open_fds'], labels, help='Open file descriptors in the child process tree.')
+        self.registry.set('process_monitor_threads', sample['threads'], labels, help='Threads in the child process tree.')
+
+        if self.prom_path:
+            tmp_path = self.prom_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(self.registry.render())
+            os.replace(tmp_path, self.prom_path)
+
+    def exceeded(self, sample):
+        """Names the ceiling the sample is over, if any."""
+        if self.max_rss_bytes and sample['rss_bytes'] > self.max_rss_bytes:
+            return 'rss'
+        if self.max_cpu_percent and sample['cpu_percent'] > self.max_cpu_percent:
+            return 'cpu'
+        return None
+
+
+class ProgressWatch:
+    """Block-height progress detection shared by every run of a child.
+
+    height_regex and chain_height_regex are matched against the raw output
+    bytes, their first group is the height. A child whose height has not
+    advanced for timeout seconds is restarted.
+    """
+
+    def __init__(self, height_regex=INDEXER_HEIGHT_REGEX, chain_height_regex=INDEXER_CHAIN_HEIGHT_REGEX,
+                 timeout=None, rate_window=60.0, registry=None):
+        self.height_regex = re.compile(height_regex.encode())
+        self.chain_height_regex = re.compile(chain_height_regex.encode()) if chain_height_regex else None
+        self.timeout = timeout
+        self.rate_window = rate_window
+        self.registry = registry or metrics
+
+
+class ProgressTracker:
+    """Progress of a single run: latest height, blocks/sec and lag behind the chain."""
+
+    def __init__(self, watch, name, started_at):
+        self.watch = watch
+        self.height = None
+        self.chain_height = None
+        self.last_advance_at = started_at
+        self._advances = collections.deque()
+        self._tail = b''
+
+        labels = {'child': name}
+        registry = watch.registry
+        registry.set('process_monitor_progress_height', lambda: self.height, labels,
+                     help='Highest block height seen in the child output.')
+        registry.set('process_monitor_progress_chain_height', lambda: self.chain_height, labels,
+                     help='Latest chain height reported in the child output.')
+        registry.set('process_monitor_progress_lag_blocks', self.lag, labels,
+                     help='Blocks between the reported chain height and the highest processed height.')
+        registry.set('process_monitor_progress_blocks_per_second', self.blocks_per_second, labels,
+                     help='Height advance rate over the progress rate window.')
+        registry.set('process_monitor_progress_seconds_since_advance', self.seconds_since_advance, labels,
+                     help='Seconds since the height last advanced (or since the child started).')
+
+    def feed(self, chunk):
+        data = self._tail + chunk
+        end = data.rfind(b'\n') + 1
+        self._tail = data[end:][-PROGRESS_TAIL_BYTES:]
+        if not end:
+            return
+        lines = data[:end]
+
+        heights = [int(match.group(1)) for match in self.watch.height_regex.finditer(lines)]
+        if heights and (self.height is None or max(heights) > self.height):
+            now = time.monotonic()
+            self.height = max(heights)
+            self.last_advance_at = now
+            self._advances.append((now, self.height))
+        if self.watch.chain_height_regex is not None:
+            for match in self.watch.chain_height_regex.finditer(lines):
+                self.chain_height = int(match.group(1))
+
+    def lag(self):
+        if self.height is None or self.chain_height is None:
+            return None
+        return max(self.chain_height - self.height, 0)
+
+    def blocks_per_second(self):
+        now = time.monotonic()
+        while len(self._advances) > 1 and now - self._advances[0][0] > self.watch.rate_window:
+            self._advances.popleft()
+        if len(self._advances) < 2:
+            return 0.0
+        (first_at, first_height), (last_at, last_height) = self._advances[0], self._advances[-1]
+        return round((last_height - first_height) / max(now - first_at, last_at - first_at, 1e-6), 3)
+
+    def seconds_since_advance(self):
+        return round(time.monotonic() - self.last_advance_at, 3)
+
+
+class HealthProbe:
+    """HTTP liveness checks shared by every run of a child.
+
+    Every interval seconds each of paths is requested over one kept-alive
+    connection, each request bounded by timeout. Latencies go into a
+    histogram. A path that fails (error, timeout or non-200) failures times
+    in a row makes the child unhealthy: it is restarted with action
+    'restart', with 'alert' it is only logged and flagged in the metrics.
+    Failures during the first start_period seconds of a run do not count.
+
+    port None means the child's JSINFO_QUERY_DIRECT_PORT, as set by
+    RollingRestart.
+    """
+
+    def __init__(self, port=None, host='127.0.0.1', paths=('/health', '/islatest'), interval=10.0, timeout=5.0,
+                 failures=3, action='restart', start_period=120.0, registry=None):
+        if action not in ('restart', 'alert'):
+            raise ValueError('unknown probe action %r' % action)
+        self.port = port
+        self.host = host
+        self.paths = paths
+        self.interval = interval
+        self.timeout = timeout
+        self.failures = failures
+        self.action = action
+        self.start_period = start_period
+        self.registry = registry or metrics
+
+    async def watch(self, supervisor, port):
+        """Probes the child until it exits or, with action 'restart', until it is stopped as unhealthy.
+
+        With an on_unhealthy owner the child may be kept running (a rolling
+        replacement that never got ready), so probing goes on and another
+        run of failures asks again.
+        """
+        client = HttpClient(self.host, port, self.timeout)
+        failed = dict.fromkeys(self.paths, 0)
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                for path in self.paths:
+                    error = await self._check(client, supervisor.name, path)
+                    starting = time.monotonic() - supervisor.started_at < self.start_period
+                    if error is None:
+                        if failed[path] >= self.failures:
+                            supervisor._log('Probe %s recovered' % path)
+                        failed[path] = 0
+                        continue
+                    if starting:
+                        continue
+                    failed[path] += 1
+                    if failed[path] != self.failures:
+                        continue
+                    supervisor._log('Probe %s failed %d times in a row (%s).%s' % (
+                        path, failed[path], error, ' Restarting command.' if self.action == 'restart' else ''))
+                    if self.action == 'restart':
+                        supervisor._unhealthy('probe')
+                        if supervisor.on_unhealthy is None:
+                            return
+                        failed[path] = 0
+        finally:
+            client.close()
+
+    async def _check(self, client, name, path):
+        # returns None when the path answered 200, otherwise what went wrong
+        labels = {'child': name, 'path': path}
+        started = time.monotonic()
+        try:
+            status, _, body = await client.get(path)
+            error = None if status == 200 else 'status %d' % status
+        except asyncio.TimeoutError:
+            status, body, error = None, b'', 'timeout after %ss' % self.timeout
+        except (OSError, ValueError) as e:
+            status, body, error = None, b'', repr(e)
+        self.registry.observe('process_monitor_probe_duration_seconds', time.monotonic() - started, labels,
+                              help='Latency of the HTTP liveness probes, including failed ones.')
+        self.registry.set('process_monitor_probe_up', int(error is None), labels,
+                          help='1 when the last HTTP probe of the path answered 200.')
+        if error is not None:
+            failures = self.registry.get('process_monitor_probe_failures_total', labels) or 0
+            self.registry.set('process_monitor_probe_failures_total', failures + 1, labels, kind='counter',
+                              help='HTTP probes that failed, timed out or did not answer 200.')
+
+        if path.startswith('/islatest') and status in (200, 400):
+            try:
+                datetime_ms = json.loads(body)['datetime']
+                self.registry.set('process_monitor_latest_block_age_seconds', round(time.time() - datetime_ms / 1000, 3),
+                                  {'child': name}, help='Age of the latest indexed block as reported by /islatest.')
+            except (ValueError, KeyError, TypeError):
+                pass
+        return error
+
+
+class LogTail:
+    """The last max_bytes of a child's output, kept as the chunks that were read."""
+
+    def __init__(self, max_bytes=LOG_TAIL_BYTES):
+        self.max_bytes = max_bytes
+        self._chunks = collections.deque()
+        self._size = 0
+
+    def feed(self, chunk):
+        self._chunks.append(chunk)
+        self._size += len(chunk)
+        while self._size - len(self._chunks[0]) >= self.max_bytes:
+            self._size -= len(self._chunks.popleft())
+
+    def lines(self, count):
+        return b''.join(self._chunks).splitlines()[-count:]
+
+
+class Diagnostics:
+    """Asks a child for diagnostics before the monitor stops it.
+
+    The signal goes to the leaf processes of the child's session and the
+    child is expected to write its artifacts into directory, which it finds
+    in JSINFO_DIAGNOSTICS_DIR. Files that show up there before the wait runs
+    out are moved into a directory per capture, next to the last tail_lines
+    lines of output and a summary of the run.
+    """
+
+    def __init__(self, directory, sig=signal.SIGUSR2, wait=30.0, tail_lines=500, tail_bytes=LOG_TAIL_BYTES):
+        self.directory = directory
+        self.signal = sig
+        self.wait = wait
+        self.tail_lines = tail_lines
+        self.tail_bytes = tail_bytes
+        self.captures = 0
+        os.makedirs(directory, exist_ok=True)
+
+    async def capture(self, supervisor, reason):
+        """Signals the child, collects what it writes and returns the capture directory."""
+        capture_dir = os.path.join(self.directory, '%s-%s-%s' % (
+            re.sub(r'[^A-Za-z0-9_.-]+', '_', supervisor.name)[:64], time.strftime('%Y%m%d-%H%M%S'), reason))
+        os.makedirs(capture_dir, exist_ok=True)
+
+        before = self._artifacts()
+        signalled = []
+        for pid in session_leaves(supervisor.process.pid):
+            try:
+                os.kill(pid, self.signal)
+                signalled.append(pid)
+            except ProcessLookupError:
+                pass
+        supervisor._log('Sent %s to %s, waiting up to %ds for diagnostics' % (
+            signal.Signals(self.signal).name, signalled, self.wait))
+
+        artifacts = await self._wait_for_artifacts(supervisor, before)
+        for artifact in artifacts:
+            os.replace(os.path.join(self.directory, artifact), os.path.join(capture_dir, artifact))
+
+        with open(os.path.join(capture_dir, 'output.log'), 'wb') as f:
+            for line in supervisor.log_tail.lines(self.tail_lines):
+                f.write(line + b'\n')
+        summary = {
+            'name': supervisor.name,
+            'cmd': supervisor.cmd,
+            'reason': reason,
+            'pid': supervisor.process.pid,
+            'signalled': signalled,
+            'uptime': round(time.monotonic() - supervisor.started_at, 3),
+            'seconds_since_output': round(time.monotonic() - supervisor.last_output_at, 3),
+            'height': supervisor.tracker.height if supervisor.tracker else None,
+            'last_sample': supervisor.last_sample,
+            'artifacts': artifacts,
+            'exited_during_capture': supervisor.returncode is not None,
+        }
+        with open(os.path.join(capture_dir, 'summary.json'), 'w') as f:
+            json.dump(summary, f, indent=2)
+
+        self.captures += 1
+        metrics.set('process_monitor_diagnostics_captures_total', self.captures, {'child': supervisor.name},
+                    kind='counter', help='Diagnostics captures taken before the monitor stopped the child.')
+        supervisor._log('Saved diagnostics to %s (%d artifacts)' % (capture_dir, len(artifacts)))
+        return capture_dir
+
+    def _artifacts(self):
+        # name -> size of the finished files in the directory; writers use a .tmp name until done
+        artifacts = {}
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                artifacts[entry.name] = entry.stat().st_size
+        return artifacts
+
+    def _new_artifacts(self, before):
+        return {name: size for name, size in self._artifacts().items() if before.get(name) != size}
+
+    async def _wait_for_artifacts(self, supervisor, before):
+        # done once new files stop changing between two polls, the child exits or the wait runs out
+        deadline = time.monotonic() + self.wait
+        previous = None
+        while time.monotonic() < deadline and supervisor.returncode is None:
+            try:
+                await asyncio.wait_for(asyncio.shield(supervisor._exited), DIAGNOSTICS_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            current = self._new_artifacts(before)
+            if current and current == previous:
+                break
+            previous = current
+        return sorted(self._new_artifacts(before))
+
+
+class OutputForwarder:
+    """Copies child output to a file descriptor without ever blocking the loop.
+
+    Writes go into a bounded in-memory buffer that is flushed with writev once
+    per loop iteration, and from a writer callback while the descriptor is
+    full. When the buffer is over max_buffer_bytes the oldest chunks are
+    dropped and counted, so a slow log consumer costs log lines instead of
+    back-pressuring the child through its stdout pipe.
+    """
+
+    def __init__(self, fd, max_buffer_bytes=OUTPUT_BUFFER_BYTES):
+        self.fd = fd
+        self.max_buffer_bytes = max_buffer_bytes
+        self.buffered_bytes = 0
+        self.written_bytes = 0
+        self.dropped_bytes = 0
+        self.dropped_chunks = 0
+        self._chunks = collections.deque()
+        self._loop = None
+        self._flush_scheduled = False
+        self._waiting_writable = False
+        self._reported_dropped_bytes = 0
+        self._drained = None
+
+    def write(self, data):
+        if not data:
+            return
+        self._chunks.append(data)
+        self.buffered_bytes += len(data)
+        while self.buffered_bytes > self.max_buffer_bytes and len(self._chunks) > 1:
+            dropped = self._chunks.popleft()
+            self.buffered_bytes -= len(dropped)
+            self.dropped_bytes += len(dropped)
+            self.dropped_chunks += 1
+        self._schedule_flush()
+
+    async def drain(self):
+        """Waits until everything buffered so far has been written."""
+        if not self._chunks:
+            return
+        if self._drained is None or self._drained.done():
+            self._drained = asyncio.get_running_loop().create_future()
+        await self._drained
+
+    def close(self):
+        if self._loop is not None:
+            if self._waiting_writable:
+                self._loop.remove_writer(self.fd)
+                self._waiting_writable = False
+            os.set_blocking(self.fd, True)
+            self._loop = None
+
+    def _schedule_flush(self):
+        if self._loop is None:
+            try:
+                self._loop = asyncio.get_running_loop()
+            except RuntimeError:
+                # no loop yet (or any more): write synchronously
+                self._flush()
+                return
+            os.set_blocking(self.fd, False)
+            _grow_pipe(self.fd)
+        if not self._flush_scheduled and not self._waiting_writable:
+            self._flush_scheduled = True
+            self._loop.call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        while self._chunks:
+            batch = list(itertools.islice(self._chunks, MAX_WRITEV_CHUNKS))
+            try:
+                written = os.writev(self.fd, batch)
+            except BlockingIOError:
+                written = 0
+            except BrokenPipeError:
+                self._chunks.clear()
+                self.buffered_bytes = 0
+                break
+            self._consume(written)
+            if written < sum(len(chunk) for chunk in batch) and self._loop is not None:
+                # the descriptor is full, continue once it is writable again
+                break
+        self._update_writer()
+
+    def _consume(self, written):
+        self.written_bytes += written
+        self.buffered_bytes -= written
+        while written:
+            head = self._chunks[0]
+            if written < len(head):
+                self._chunks[0] = head[written:]
+                return
+            self._chunks.popleft()
+            written -= len(head)
+
+    def _update_writer(self):
+        if self._loop is None:
+            return
+        if self._chunks:
+            if not self._waiting_writable:
+                self._loop.add_writer(self.fd, self._flush)
+                self._waiting_writable = True
+            return
+        if self._waiting_writable:
+            self._loop.remove_writer(self.fd)
+            self._waiting_writable = False
+        if self.dropped_bytes > self._reported_dropped_bytes:
+            self._reported_dropped_bytes = self.dropped_bytes
+            _log('Dropped %d bytes (%d chunks) of output so far while stdout was blocked' % (
+                self.dropped_bytes, self.dropped_chunks))
+        if self._drained is not None and not self._drained.done():
+            self._drained.set_result(None)
+
+
+class Supervisor:
+    """Runs a single child command and watches it for output stalls.
+
+    Everything happens on the running asyncio loop. The child's stdout pipe
+    is a reader callback, the stall deadline is a timer that is only re-armed
+    when it fires, and the exit is picked up from a pidfd (or SIGCHLD on
+    kernels without pidfds), so an idle supervisor sleeps in epoll. With a
+    ResourceWatch the child's process tree is also sampled on a timer, and
+    with a ProgressWatch the output is scanned for block heights. A
+    HealthProbe polls the child over HTTP.
+
+    When the supervisor itself stops the child (stall, ceiling, no progress)
+    it sends SIGTERM and only SIGKILLs after kill_grace seconds, capturing
+    Diagnostics first if they are configured.
+
+    cpus pins the child (and everything it starts) to those CPUs. With a
+    prefix, output is forwarded in whole lines, each starting with it, so
+    children sharing one stdout do not interleave mid-line.
+
+    on_unhealthy(supervisor, reason), when given, is called instead of
+    stopping the child, so the owner can replace it first.
+    """
+
+    def __init__(self, cmd, timeout, name=None, env=None, output=None, resources=None, progress=None,
+                 diagnostics=None, kill_grace=KILL_GRACE_SECONDS, cpus=None, prefix=None, on_unhealthy=None,
+                 probe=None):
+        self.cmd = cmd
+        self.timeout = timeout
+        self.name = name or cmd
+        self.env = env
+        self.cpus = cpus
+        self.on_unhealthy = on_unhealthy
+        self.prefix = prefix.encode() if isinstance(prefix, str) else prefix
+        self.output = output or default_output()
+        self.resources = resources
+        self.progress = progress
+        self.diagnostics = diagnostics
+        self.kill_grace = kill_grace
+        self.probe = probe
+        self.tracker = None
+        self.log_tail = LogTail(diagnostics.tail_bytes) if diagnostics is not None else None
+        self.output_bytes = 0
+        self.process = None
+        self.returncode = None
+        self.stop_reason = None
+        self.last_sample = None
+        self.started_at = None
+        self.first_output_at = None
+        self.last_output_at = None
+        self._loop = None
+        self._exited = None
+        self._stdout_fd = None
+        self._pidfd = None
+        self._stall_timer = None
+        self._sample_timer = None
+        self._progress_timer = None
+        self._probe_task = None
+        self._terminating = None
+        self._over_ceiling = 0
+        self._partial_line = b''
+
+    async def run(self):
+        """Starts the child and returns its exit code once it is gone."""
+        self._loop = asyncio.get_running_loop()
+        self._exited = self._loop.create_future()
+
+        env = self.env
+        if self.diagnostics is not None:
+            env = dict(os.environ if env is None else env)
+            env[DIAGNOSTICS_DIR_ENV] = os.path.abspath(self.diagnostics.directory)
+
+        self.process = subprocess.Popen(
+            self.cmd,
+            shell=True,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=env,
+            # own process group, so a kill also reaches whatever the shell spawned
+            start_new_session=True,
+            # set before exec so no process of the child ever runs unpinned
+            preexec_fn=(lambda: os.sched_setaffinity(0, self.cpus)) if self.cpus else None,
+        )
+        self.started_at = self.last_output_at = time.monotonic()
+        if self.progress is not None:
+            self.tracker = ProgressTracker(self.progress, self.name, self.started_at)
+
+        self._stdout_fd = self.process.stdout.fileno()
+        os.set_blocking(self._stdout_fd, False)
+        _grow_pipe(self._stdout_fd)
+        self._loop.add_reader(self._stdout_fd, self._on_stdout_readable)
+
+        self._watch_exit()
+        self._arm_stall_timer(self.timeout)
+        if self.resources is not None:
+            self._sample_timer = self._loop.call_later(self.resources.interval, self._on_sample_timer)
+        if self.progress is not None and self.progress.timeout:
+            self._progress_timer = self._loop.call_later(self.progress.timeout, self._on_progress_timer)
+        if self.probe is not None:
+            port = self.probe.port or int((os.environ if env is None else env).get(DIRECT_PORT_ENV, 0))
+            self._probe_task = self._loop.create_task(self.probe.watch(self, port))
+
+        try:
+            await self._exited
+            if self._terminating is not None:
+                # let a diagnostics capture finish writing after an early exit
+                await self._terminating
+        finally:
+            self._cleanup()
+        return self.returncode
+
+    @property
+    def stalled(self):
+        return self.stop_reason == 'stall'
+
+    @property
+    def time_to_first_output(self):
+        if self.first_output_at is None:
+            return None
+        return self.first_output_at - self.started_at
+
+    def stop(self, sig=signal.SIGTERM):
+        """Sends sig to the child's process group."""
+        if self.process is None or self.returncode is not None:
+            return
+        try:
+            os.killpg(self.process.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def terminate(self, reason):
+        """Stops the child on the monitor's behalf, recording reason as the stop_reason."""
+        if self.stop_reason is not None or self.returncode is not None:
+            return
+        self.stop_reason = reason
+        self._terminating = self._loop.create_task(self._staged_stop(reason))
+
+    async def _staged_stop(self, reason):
+        if self.diagnostics is not None:
+            try:
+                await self.diagnostics.capture(self, reason)
+            except OSError as e:
+                self._log('Diagnostics capture failed:', e)
+        self.stop(signal.SIGTERM)
+        deadline = time.monotonic() + self.kill_grace
+        try:
+            await asyncio.wait_for(asyncio.shield(self._exited), self.kill_grace)
+        except asyncio.TimeoutError:
+            pass
+        # the shell can exit on SIGTERM while something it started ignores it
+        while session_leaves(self.process.pid) and time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+        if session_leaves(self.process.pid):
+            self._log('Still running %ds after SIGTERM. Sending SIGKILL.' % self.kill_grace)
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
 
-def monitor_command(cmd, timeout):
-    # Start the command
-    process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=1, universal_newlines=True)
+    def _unhealthy(self, reason):
+        if self.on_unhealthy is not None:
+            self.on_unhealthy(self, reason)
+        else:
+            self.terminate(reason)
 
-    last_output_time = time.time()
+    def _watch_exit(self):
+        try:
+            self._pidfd = os.pidfd_open(self.process.pid)
+        except (AttributeError, OSError):
+            self._pidfd = None
 
-    def check_output():
-        nonlocal last_output_time
+        if self._pidfd is not None:
+            self._loop.add_reader(self._pidfd, self._check_exit)
+        else:
+            if not _sigchld_supervisors:
+                self._loop.add_signal_handler(signal.SIGCHLD, _on_sigchld)
+            _sigchld_supervisors.add(self)
+        # the child may have exited before the watcher was in place
+        self._check_exit()
+
+    def _check_exit(self):
+        if self._exited.done() or self.process.poll() is None:
+            return
+        self.returncode = self.process.returncode
+        if self._pidfd is not None:
+            # an exited pidfd stays readable
+            self._loop.remove_reader(self._pidfd)
+        # forward whatever the child wrote right before exiting
+        self._drain_stdout()
+        self._exited.set_result(self.returncode)
+
+    def _on_stdout_readable(self):
+        # one large read per wakeup, so a fast child cannot starve the output writer
+        self._read_stdout()
+
+    def _drain_stdout(self):
+        while self._read_stdout():
+            pass
+
+    def _read_stdout(self):
+        if self._stdout_fd is None:
+            return False
+        try:
+            chunk = os.read(self._stdout_fd, READ_CHUNK_SIZE)
+        except BlockingIOError:
+            return False
+        if not chunk:
+            self._close_stdout()
+            return False
+        # stall detection works on raw byte activity, not on complete lines
+        self.last_output_at = time.monotonic()
+        if self.first_output_at is None:
+            self.first_output_at = self.last_output_at
+        self.output_bytes += len(chunk)
+        self._forward(chunk)
+        if self.log_tail is not None:
+            self.log_tail.feed(chunk)
+        if self.tracker is not None:
+            self.tracker.feed(chunk)
+        return True
+
+    def _log(self, *args):
+        # children sharing stdout are told apart by their prefix
+        if self.prefix is not None:
+            args = (self.prefix.decode(errors='replace').strip(),) + args
+        _log(*args)
+
+    def _forward(self, chunk):
+        if self.prefix is None:
+            self.output.write(chunk)
+            return
+        data = self._partial_line + chunk
+        end = data.rfind(b'\n') + 1
+        if not end and len(data) < PARTIAL_LINE_BYTES:
+            self._partial_line = data
+            return
+        if not end:
+            end = len(data)
+        self._partial_line = data[end:]
+        lines = data[:end - 1] if data[end - 1:end] == b'\n' else data[:end]
+        self.output.write(self.prefix + lines.replace(b'\n', b'\n' + self.prefix) + b'\n')
+
+    def _close_stdout(self):
+        self._loop.remove_reader(self._stdout_fd)
+        self.process.stdout.close()
+        self._stdout_fd = None
+        if self._partial_line:
+            self._forward(b'\n')
+
+    def _arm_stall_timer(self, delay):
+        if self.timeout:
+            self._stall_timer = self._loop.call_later(delay, self._on_stall_timer)
+
+    def _on_stall_timer(self):
+        remaining = self.last_output_at + self.timeout - time.monotonic()
+        if remaining > 0:
+            self._arm_stall_timer(remaining)
+            return
+        self._log('No output for', self.timeout, 'seconds. Stopping command.')
+        self._unhealthy('stall')
+        # the owner may keep the child running, keep watching it
+        if self.on_unhealthy is not None:
+            self._arm_stall_timer(self.timeout)
+
+    def _on_progress_timer(self):
+        remaining = self.tracker.last_advance_at + self.progress.timeout - time.monotonic()
+        if remaining > 0:
+            self._progress_timer = self._loop.call_later(remaining, self._on_progress_timer)
+            return
+        self._log('No progress for %d seconds (height: %s). Restarting command.' % (self.progress.timeout, self.tracker.height))
+        self._unhealthy('progress')
+        if self.on_unhealthy is not None:
+            self._progress_timer = self._loop.call_later(self.progress.timeout, self._on_progress_timer)
+
+    def _on_sample_timer(self):
+        sample = sample_process_tree(self.process.pid)
+        previous = self.last_sample
+        if previous is None:
+            cpu_percent = 100 * sample['cpu_seconds'] / max(time.monotonic() - self.started_at, 1e-6)
+        else:
+            cpu_percent = 100 * (sample['cpu_seconds'] - previous['cpu_seconds']) / max(time.monotonic() - previous['at'], 1e-6)
+        sample['cpu_percent'] = round(max(cpu_percent, 0.0), 2)
+        sample['pid'] = self.process.pid
+        self.resources.record(self.name, sample)
+        sample['at'] = time.monotonic()
+        self.last_sample = sample
+
+        ceiling = self.resources.exceeded(sample)
+        self._over_ceiling = self._over_ceiling + 1 if ceiling else 0
+        if ceiling and self._over_ceiling >= self.resources.ceiling_samples:
+            self._log('%s over its %s ceiling for %d samples (rss: %dMB, cpu: %.0f%%). Restarting command.' % (
+                self.name, ceiling, self._over_ceiling, sample['rss_bytes'] // (1024 * 1024), sample['cpu_percent']))
+            self._unhealthy(ceiling)
+        self._sample_timer = self._loop.call_later(self.resources.interval, self._on_sample_timer)
+
+    def _cleanup(self):
+        for handle in (self._stall_timer, self._sample_timer, self._progress_timer, self._probe_task, self._terminating):
+            if handle is not None:
+                handle.cancel()
+        if self._stdout_fd is not None:
+            self._close_stdout()
+        if self._pidfd is not None:
+            self._loop.remove_reader(self._pidfd)
+            os.close(self._pidfd)
+            self._pidfd = None
+        _sigchld_supervisors.discard(self)
+        if not _sigchld_supervisors and self._loop is not None:
+            self._loop.remove_signal_handler(signal.SIGCHLD)
+
+
+class Backoff:
+    """Exponential backoff with equal jitter: half the delay is fixed, half random."""
+
+    def __init__(self, initial=1.0, maximum=60.0, factor=2.0):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.attempt = 0
+
+    def next_delay(self):
+        delay = min(self.maximum, self.initial * self.factor ** self.attempt)
+        self.attempt += 1
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def reset(self):
+        self.attempt = 0
+
+
+RestartRecord = collections.namedtuple(
+    'RestartRecord', ['run', 'exit_code', 'stop_reason', 'uptime', 'time_to_first_output', 'crash_loop']
+)
+
+
+class RestartLoop:
+    """Keeps a command running, relaunching it in-process after every exit.
+
+    A run that lasted at least stable_after seconds resets the backoff. When
+    crash_loop_restarts runs end within crash_loop_window seconds the loop
+    is considered crash looping and waits the maximum backoff between runs
+    until a run becomes stable again.
+
+    policy is one of RESTART_POLICIES: 'on-failure' ends the loop after a
+    clean exit and 'never' after the first run.
+
+    supervisor_options are passed to every Supervisor the loop creates.
+    """
+
+    def __init__(self, cmd, timeout, backoff=None, stable_after=300.0,
+                 crash_loop_restarts=5, crash_loop_window=300.0, policy='always', **supervisor_options):
+        if policy not in RESTART_POLICIES:
+            raise ValueError('unknown restart policy %r' % policy)
+        self.cmd = cmd
+        self.timeout = timeout
+        self.policy = policy
+        self.backoff = backoff or Backoff()
+        self.stable_after = stable_after
+        self.crash_loop_restarts = crash_loop_restarts
+        self.crash_loop_window = crash_loop_window
+        self.supervisor_options = supervisor_options
+        self.history = []
+        self.supervisor = None
+        self.crash_looping = False
+        self._recent_exits = collections.deque()
+        self._stopping = False
+        self._wakeup = None
+
+    async def run(self):
+        """Runs until stop() is called and returns the last exit code."""
+        self._wakeup = asyncio.Event()
+        while not self._stopping:
+            self.supervisor = Supervisor(self.cmd, self.timeout, **self.supervisor_options)
+            self.supervisor._log('Starting', repr(self.cmd), '(run %d)' % (len(self.history) + 1))
+            await self.supervisor.run()
+            if self._stopping:
+                break
+            if self.policy == 'never' or (self.policy == 'on-failure' and self.supervisor.returncode == 0
+                                          and self.supervisor.stop_reason is None):
+                self._record_exit(self.supervisor)
+                break
+
+            delay = self._record_exit(self.supervisor)
+            self.supervisor._log('Restarting in %.1fs' % delay)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        return self.supervisor.returncode if self.supervisor else None
+
+    def stop(self, sig=signal.SIGTERM):
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if self.supervisor is not None:
+            self.supervisor.stop(sig)
+
+    def _record_exit(self, supervisor):
+        now = time.monotonic()
+        uptime = now - supervisor.started_at
+
+        if uptime >= self.stable_after:
+            self.backoff.reset()
+            self._recent_exits.clear()
+            self.crash_looping = False
+        else:
+            self._recent_exits.append(now)
+            while self._recent_exits and now - self._recent_exits[0] > self.crash_loop_window:
+                self._recent_exits.popleft()
+            crash_looping = len(self._recent_exits) >= self.crash_loop_restarts
+            if crash_looping and not self.crash_looping:
+                supervisor._log('Crash loop detected: %d exits within %ds' % (len(self._recent_exits), self.crash_loop_window))
+            self.crash_looping = crash_looping
+
+        record = RestartRecord(
+            run=len(self.history) + 1,
+            exit_code=_exit_code(supervisor.returncode),
+            stop_reason=supervisor.stop_reason or 'exit',
+            uptime=uptime,
+            time_to_first_output=supervisor.time_to_first_output,
+            crash_loop=self.crash_looping,
+        )
+        self.history.append(record)
+
+        labels = {'child': supervisor.name}
+        metrics.set('process_monitor_restarts_total', len(self.history), labels, kind='counter',
+                    help='Times the child exited and was restarted by the monitor.')
+        metrics.set('process_monitor_time_to_first_output_seconds', record.time_to_first_output, labels,
+                    help='Seconds from start to first output in the last finished run.')
+
+        first_output = '-' if record.time_to_first_output is None else '%.2fs' % record.time_to_first_output
+        supervisor._log('Run %d exited with code %d after %.1fs (reason: %s, time to first output: %s, crash loop: %s)' % (
+            record.run, record.exit_code, record.uptime, record.stop_reason, first_output, record.crash_loop))
+
+        delay = self.backoff.next_delay()
+        if self.crash_looping:
+            delay = max(delay, self.backoff.maximum)
+        return delay
+
+
+class HttpClient:
+    """A small HTTP/1.1 client that keeps its connection alive between requests.
+
+    Requests go out one at a time. Any failure closes the connection and
+    the next request reconnects; a kept-alive connection the server has
+    closed in the meantime is retried once on a fresh one.
+    """
+
+    def __init__(self, host, port, timeout=10.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+
+    async def get(self, path, headers=None, timeout=None):
+        """Returns (status, headers, body); headers keys are lower case bytes."""
+        try:
+            return await asyncio.wait_for(self._get(path, headers or {}), timeout or self.timeout)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _get(self, path, headers):
+        request = 'GET %s HTTP/1.1\r\nHost: %s:%d\r\n%s\r\n' % (
+            path, self.host, self.port, ''.join('%s: %s\r\n' % item for item in headers.items()))
+        reused = self._writer is not None
+        try:
+            return await self._request(request.encode())
+        except (ConnectionError, asyncio.IncompleteReadError):
+            if not reused:
+                raise
+        self.close()
+        return await self._request(request.encode())
+
+    async def _request(self, request):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._writer.write(request)
+        await self._writer.drain()
+
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionResetError('connection closed by %s:%d' % (self.host, self.port))
+        parts = status_line.split(None, 2)
+        if len(parts) < 2 or not parts[1].isdigit():
+            raise ValueError('bad status line %r' % status_line)
+        response_headers = {}
         while True:
-            if process.poll() is not None:
-                os.kill(os.getpid(), signal.SIGTERM)
-            output = process.stdout.readline().strip()
-            if output:
-                print(output)
-                last_output_time = time.time()
-
-    def check_timeout():
-        nonlocal last_output_time
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.partition(b':')
+            response_headers[key.strip().lower()] = value.strip()
+
+        if response_headers.get(b'transfer-encoding', b'').lower() == b'chunked':
+            body = await self._read_chunked()
+        elif b'content-length' in response_headers:
+            body = await self._reader.readexactly(int(response_headers[b'content-length']))
+        else:
+            body = await self._reader.read()
+            self.close()
+        if response_headers.get(b'connection', b'').lower() == b'close':
+            self.close()
+        return int(parts[1]), response_headers, body
+
+    async def _read_chunked(self):
+        chunks = []
         while True:
-            if time.time() - last_output_time > timeout:
-                print('No output for', timeout, 'seconds. Killing command.')
-                os.kill(process.pid, signal.SIGKILL)
-                os.kill(os.getpid(), signal.SIGTERM)
-            time.sleep(1)
-
-    # Start the threads
-    thread_output = threading.Thread(target=check_output)
-    thread_output.start()
-    thread_timeout = threading.Thread(target=check_timeout)
-    thread_timeout.start()
-
-    # Wait for the threads to finish
-    thread_output.join()
-    thread_timeout.join()
+            size = int((await self._reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                # trailers end with an empty line
+                while (await self._reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self._reader.readexactly(size))
+            await self._reader.readline()
 
-if __name__ == '__main__':
-    if len(sys.argv) != 3:
-        print('Usage: ./monitor_command.py <timeout_in_seconds> "<command>"')
-        sys.exit(1)
 
-    timeout = int(sys.argv[1])
-    cmd = sys.argv[2]
-    monitor_command(cmd, timeout)
\ No newline at end of file
+_Worker = collections.namedtuple('_Worker', ['supervisor', 'task', 'port'])
+
+
+class RollingRestart:
+    """Keeps a query worker serving while it is being replaced.
+
+    Each worker gets JSINFO_QUERY_DIRECT_PORT, a loopback port only the
+    monitor talks to, alternating between direct_port and direct_port + 1
+    so the old and the new worker can be told apart while both listen on
+    the public port. A roll starts the replacement, waits until it answers
+    every ready_paths with 200, replays the old worker's /cacheLinks
+    against it and only then stops the old worker, which drains its
+    in-flight requests on SIGTERM. A replacement that never gets ready is
+    stopped and the old worker keeps serving.
+
+    Rolls happen when a ceiling or progress check fails, after max_uptime
+    seconds and on roll(). A worker that exits by itself is restarted
+    with backoff, crash loop detection and restart policy, like in
+    RestartLoop.
+    """
+
+    def __init__(self, cmd, timeout, direct_port, backoff=None, stable_after=300.0, max_uptime=None,
+                 ready_paths=('/health', '/islatest'), ready_timeout=180.0, probe_timeout=5.0,
+                 warm_limit=200, warm_concurrency=4, warm_timeout=120.0, env=None,
+                 crash_loop_restarts=5, crash_loop_window=300.0, policy='always', **supervisor_options):
+        if policy not in RESTART_POLICIES:
+            raise ValueError('unknown restart policy %r' % policy)
+        self.cmd = cmd
+        self.timeout = timeout
+        self.direct_port = direct_port
+        self.policy = policy
+        self.backoff = backoff or Backoff()
+        self.stable_after = stable_after
+        self.crash_loop_restarts = crash_loop_restarts
+        self.crash_loop_window = crash_loop_window
+        self.crash_looping = False
+        self.max_uptime = max_uptime
+        self.ready_paths = ready_paths
+        self.ready_timeout = ready_timeout
+        self.probe_timeout = probe_timeout
+        self.warm_limit = warm_limit
+        self.warm_concurrency = warm_concurrency
+        self.warm_timeout = warm_timeout
+        self.env = env
+        self.supervisor_options = supervisor_options
+        self.name = supervisor_options.get('name') or cmd
+        self.current = None
+        self.returncode = None
+        self.rolls = 0
+        self._workers = set()
+        self._next_slot = 0
+        self._roll = None
+        self._roll_reason = None
+        self._recent_exits = collections.deque()
+        self._wakeup = None
+        self._stopping = False
+
+    async def run(self):
+        """Runs until stop() is called and returns the last exit code."""
+        self._roll = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        while not self._stopping:
+            worker = self._start()
+            if await self._wait_ready(worker):
+                await self._warm(worker, worker)
+            else:
+                self._log(worker, 'Worker not ready after %ds, serving anyway' % self.ready_timeout)
+            self.current = worker
+
+            while not self._stopping:
+                reason = await self._serve(worker)
+                if reason is None:
+                    break
+                replacement = await self._replace(worker, reason)
+                if replacement is not None:
+                    worker = self.current = replacement
+            await worker.task
+            self.returncode = worker.supervisor.returncode
+            if self._stopping:
+                break
+
+            uptime = time.monotonic() - worker.supervisor.started_at
+            if self.policy == 'never' or (self.policy == 'on-failure' and self.returncode == 0
+                                          and worker.supervisor.stop_reason is None):
+                self._log(worker, 'Worker exited with code %d after %.1fs (reason: %s), not restarting (policy: %s)' % (
+                    _exit_code(self.returncode), uptime, worker.supervisor.stop_reason or 'exit', self.policy))
+                break
+            delay = self._restart_delay(worker, uptime)
+            self._log(worker, 'Worker exited with code %d after %.1fs (reason: %s, crash loop: %s), restarting in %.1fs' % (
+                _exit_code(self.returncode), uptime, worker.supervisor.stop_reason or 'exit', self.crash_looping, delay))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        return self.returncode
+
+    def _restart_delay(self, worker, uptime):
+        # the backoff and crash loop bookkeeping of RestartLoop._record_exit
+        now = time.monotonic()
+        if uptime >= self.stable_after:
+            self.backoff.reset()
+            self._recent_exits.clear()
+            self.crash_looping = False
+        else:
+            self._recent_exits.append(now)
+            while self._recent_exits and now - self._recent_exits[0] > self.crash_loop_window:
+                self._recent_exits.popleft()
+            crash_looping = len(self._recent_exits) >= self.crash_loop_restarts
+            if crash_looping and not self.crash_looping:
+                self._log(worker, 'Crash loop detected: %d exits within %ds' % (len(self._recent_exits), self.crash_loop_window))
+            self.crash_looping = crash_looping
+        delay = self.backoff.next_delay()
+        if self.crash_looping:
+            delay = max(delay, self.backoff.maximum)
+        return delay
+
+    def roll(self, reason='requested'):
+        """Replaces the current worker, unless a roll is already under way."""
+        if self._roll is not None and not self._roll.is_set():
+            self._roll_reason = reason
+            self._roll.set()
+
+    def stop(self, sig=signal.SIGTERM):
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+            self._roll.set()
+        for worker in self._workers:
+            worker.supervisor.stop(sig)
+
+    def _start(self):
+        port = self.direct_port + self._next_slot
+        self._next_slot ^= 1
+        env = dict(os.environ if self.env is None else self.env)
+        env[DIRECT_PORT_ENV] = str(port)
+        supervisor = Supervisor(self.cmd, self.timeout, env=env, on_unhealthy=self._on_unhealthy,
+                                **self.supervisor_options)
+        task = asyncio.ensure_future(supervisor.run())
+        worker = _Worker(supervisor, task, port)
+        self._workers.add(worker)
+        task.add_done_callback(lambda _: self._workers.discard(worker))
+        self._log(worker, 'Starting', repr(self.cmd), 'on direct port %d' % port)
+        return worker
+
+    def _on_unhealthy(self, supervisor, reason):
+        if self.current is not None and supervisor is self.current.supervisor and not self._stopping:
+            self.roll(reason)
+        else:
+            supervisor.terminate(reason)
+
+    async def _serve(self, worker):
+        # returns the reason for a roll, or None once the worker has exited
+        timeout = None
+        if self.max_uptime:
+            timeout = max(0.0, worker.supervisor.started_at + self.max_uptime - time.monotonic())
+        roll_requested = asyncio.ensure_future(self._roll.wait())
+        try:
+            done, _ = await asyncio.wait({worker.task, roll_requested}, timeout=timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            roll_requested.cancel()
+        if worker.task in done or self._stopping:
+            return None
+        reason = self._roll_reason or 'max-uptime'
+        self._roll_reason = None
+        return reason
+
+    async def _replace(self, old, reason):
+        started = time.monotonic()
+        self._log(old, 'Rolling restart (reason: %s)' % reason)
+        new = self._start()
+        if not await self._wait_ready(new):
+            self._log(new, 'Replacement not ready after %ds, keeping the running worker' % self.ready_timeout)
+            new.supervisor.terminate('not-ready')
+            await new.task
+            self._roll.clear()
+            return None
+
+        warmed = await self._warm(new, old)
+        old.supervisor.terminate('rolled')
+        await old.task
+        self._roll.clear()
+
+        self.rolls += 1
+        labels = {'child': self.name}
+        metrics.set('process_monitor_rolls_total', self.rolls, labels, kind='counter',
+                    help='Workers replaced by a rolling restart.')
+        metrics.set('process_monitor_roll_seconds', round(time.monotonic() - started, 3), labels,
+                    help='Duration of the last rolling restart, from start of the replacement to exit of the old worker.')
+        metrics.set('process_monitor_warmed_urls', warmed, labels,
+                    help='URLs replayed against the replacement before the last roll.')
+        self._log(new, 'Rolled over in %.1fs, %d URLs warmed' % (time.monotonic() - started, warmed))
+        return new
+
+    async def _wait_ready(self, worker):
+        client = HttpClient('127.0.0.1', worker.port, self.probe_timeout)
+        deadline = time.monotonic() + self.ready_timeout
+        try:
+            while time.monotonic() < deadline and not worker.task.done():
+                for path in self.ready_paths:
+                    try:
+                        status, _, _ = await client.get(path)
+                    except (OSError, asyncio.TimeoutError, ValueError):
+                        status = None
+                    if status != 200:
+                        break
+                else:
+                    return True
+                await asyncio.wait({worker.task}, timeout=1.0)
+        finally:
+            client.close()
+        return False
+
+    async def _warm(self, worker, source):
+        """Replays source's /cacheLinks against worker and returns how many answered 200."""
+        client = HttpClient('127.0.0.1', source.port, self.probe_timeout)
+        try:
+            _, _, body = await client.get('/cacheLinks?limit=%d' % self.warm_limit)
+            urls = json.loads(body)['urls'][:self.warm_limit]
+        except (OSError, asyncio.TimeoutError, ValueError, KeyError, TypeError) as e:
+            self._log(worker, 'Could not read /cacheLinks from direct port %d: %r' % (source.port, e))
+            return 0
+        finally:
+            client.close()
+
+        pending = collections.deque(urls)
+        warmed = 0
+
+        async def warm_urls():
+            nonlocal warmed
+            warm_client = HttpClient('127.0.0.1', worker.port)
+            try:
+                while pending:
+                    try:
+                        status, _, _ = await warm_client.get(pending.popleft(), {WARMUP_HEADER: '1'})
+                        warmed += status == 200
+                    except (OSError, asyncio.TimeoutError, ValueError):
+                        pass
+            finally:
+                warm_client.close()
+
+        tasks = [asyncio.ensure_future(warm_urls()) for _ in range(self.warm_concurrency)]
+        _, unfinished = await asyncio.wait(tasks, timeout=self.warm_timeout)
+        for task in unfinished:
+            task.cancel()
+        return warmed
+
+    def _log(self, worker, *args):
+        worker.supervisor._log(*args)
+
+
+class ChildGroup:
+    """Runs several RestartLoops on one loop, e.g. the indexer and a pool of query workers.
+
+    The group ends when every loop has ended and returns the highest exit
+    code; stop() stops all of them.
+    """
+
+    def __init__(self, runners):
+        self.runners = runners
+
+    async def run(self):
+        returncodes = await asyncio.gather(*(runner.run() for runner in self.runners))
+        return max(_exit_code(returncode) for returncode in returncodes)
+
+    def stop(self, sig=signal.SIGTERM):
+        for runner in self.runners:
+            runner.stop(sig)
+
+    def roll(self):
+        for runner in self.runners:
+            if isinstance(runner, RollingRestart):
+                runner.roll()
+
+
+def load_config(path):
+    """Reads a supervisor config, TOML unless the file name ends with .json.
+
+    [monitor] holds metrics_host, metrics_port and output_buffer_mb,
+    [defaults] applies to every child and [children.<name>] defines one
+    child with cmd and the long command line options (timeout, max_rss_mb,
+    progress_timeout, ...) plus restart, cpus, env and workers.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if path.endswith('.json'):
+        return json.loads(data)
+    if tomllib is None:
+        raise SystemExit('%s: TOML configs need Python 3.11 or newer, use a .json config' % path)
+    return tomllib.loads(data.decode())
+
+
+def runners_from_config(config):
+    """One RestartLoop per configured child, workers = N expands into N children named <name>-<i>.
+
+    Within cmd, env values and file paths "{name}" and "{worker}" are
+    replaced by the child's name and worker index. A worker is pinned to
+    one CPU of the child's cpus list, round robin, and rolling workers get
+    their own direct_port pair.
+    """
+    defaults = config.get('defaults', {})
+    children = config.get('children', {})
+    if not children:
+        raise ValueError('the config defines no [children]')
+    prefix_output = len(children) > 1 or any(child.get('workers') for child in children.values())
+
+    available_cpus = os.sched_getaffinity(0)
+    runners = []
+    for base_name, child in children.items():
+        options = dict(defaults, **child)
+        options['env'] = dict(defaults.get('env', {}), **child.get('env', {}))
+        missing_cpus = set(options.get('cpus') or ()) - available_cpus
+        if missing_cpus:
+            raise ValueError('%s: cpus %s are not available, this process may use %s' % (
+                base_name, sorted(missing_cpus), sorted(available_cpus)))
+        workers = options.pop('workers', None)
+        for worker in range(workers or 1):
+            name = base_name if workers is None else '%s-%d' % (base_name, worker)
+            worker_options = dict(options)
+            if workers is not None and options.get('cpus'):
+                worker_options['cpus'] = [options['cpus'][worker % len(options['cpus'])]]
+            if workers is not None and options.get('direct_port'):
+                # every worker needs its own pair of direct ports
+                worker_options['direct_port'] = options['direct_port'] + 2 * worker
+            runners.append(_runner_from_options(
+                name, worker, worker_options, '[%s] ' % name if prefix_output else None))
+    return runners
+
+
+def _runner_from_options(name, worker, options, prefix):
+    placeholders = {'name': name, 'worker': worker}
+    if 'cmd' not in options:
+        raise ValueError('%s: cmd is required' % name)
+    cmd = options.pop('cmd').format(**placeholders)
+    timeout = options.pop('timeout', 0)
+    env = dict(os.environ, **{key: str(value).format(**placeholders) for key, value in options.pop('env').items()})
+    cpus = options.pop('cpus', None)
+    restart = options.pop('restart', 'always')
+    policy = {True: 'always', False: 'never'}.get(restart, restart)
+
+    args = _parse_args(['--name', name, str(timeout), cmd])
+    for key, value in options.items():
+        if key in ('name', 'restart', 'config') or not hasattr(args, key):
+            raise ValueError('%s: unknown option %r' % (name, key))
+        if key == 'diag_signal':
+            value = _signal_arg(str(value))
+        elif key in ('stats_jsonl', 'stats_prom', 'diag_dir') and value:
+            value = value.format(**placeholders)
+        setattr(args, key, value)
+    _imply_progress(args)
+    if args.probe and not (args.probe_port or args.rolling):
+        raise ValueError('%s: probe needs probe_port unless the child is rolling' % name)
+    if args.rolling:
+        if not args.direct_port:
+            raise ValueError('%s: rolling needs direct_port' % name)
+        return _rolling_restart_from_args(args, env=env, policy=policy, cpus=cpus, prefix=prefix,
+                                          **_supervisor_options(args))
+
+    return RestartLoop(
+        cmd,
+        timeout,
+        backoff=Backoff(initial=args.backoff_initial, maximum=args.backoff_max),
+        stable_after=args.stable_after,
+        crash_loop_restarts=args.crash_loop_restarts,
+        crash_loop_window=args.crash_loop_window,
+        policy=policy,
+        env=env,
+        cpus=cpus,
+        prefix=prefix,
+        **_supervisor_options(args),
+    )
+
+
+async def serve_metrics(host, port, registry=None):
+    """Serves the registry as Prometheus text on http://host:port/metrics."""
+    registry = registry or metrics
+
+    async def handle(reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)).strip():
+                pass
+            parts = request_line.split()
+            path = parts[1].split(b'?')[0] if len(parts) > 1 else b''
+            if path == b'/metrics':
+                status, body = '200 OK', registry.render().encode()
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            writer.write((
+                'HTTP/1.1 %s\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                'Content-Length: %d\r\nConnection: close\r\n\r\n' % (status, len(body))
+            ).encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+async def _run_forwarding_signals(runner, metrics_address=None):
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, runner.stop, sig)
+    if hasattr(runner, 'roll'):
+        loop.add_signal_handler(signal.SIGHUP, runner.roll)
+    server = None
+    if metrics_address:
+        server = await serve_metrics(*metrics_address)
+        _log('Serving metrics on http://%s:%d/metrics' % metrics_address)
+    try:
+        return await runner.run()
+    finally:
+        if server is not None:
+            server.close()
+        output = default_output()
+        try:
+            await asyncio.wait_for(output.drain(), OUTPUT_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        output.close()
+
+
+def monitor_command(cmd, timeout, metrics_address=None, **supervisor_options):
+    supervisor = Supervisor(cmd, timeout, **supervisor_options)
+    asyncio.run(_run_forwarding_signals(supervisor, metrics_address))
+    return _exit_code(supervisor.returncode)
+
+
+def _signal_arg(value):
+    if value.isdigit():
+        return signal.Signals(int(value))
+    name = value.upper()
+    try:
+        return signal.Signals[name if name.startswith('SIG') else 'SIG' + name]
+    except KeyError:
+        raise argparse.ArgumentTypeError('unknown signal %r' % value)
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description='Run a command and kill it when it stops producing output.')
+    parser.add_argument('timeout', type=int, nargs='?', help='seconds without output before the command is killed (0 disables)')
+    parser.add_argument('cmd', nargs='?', help='shell command to run')
+    parser.add_argument('--config', help='supervise the children defined in this TOML or JSON file instead of cmd')
+    parser.add_argument('--name', help='name used in logs and metrics, defaults to the command')
+    parser.add_argument('--restart', action='store_true', help='relaunch the command after it exits')
+    parser.add_argument('--output-buffer-mb', type=float, default=OUTPUT_BUFFER_BYTES / 1024 / 1024,
+                        help='output kept in memory while stdout is blocked, older output is dropped beyond it')
+    parser.add_argument('--backoff-initial', type=float, default=1.0, help='first restart delay in seconds')
+    parser.add_argument('--backoff-max', type=float, default=60.0, help='maximum restart delay in seconds')
+    parser.add_argument('--stable-after', type=float, default=300.0, help='uptime in seconds after which the backoff resets')
+    parser.add_argument('--crash-loop-restarts', type=int, default=5, help='exits within the crash loop window that count as a crash loop')
+    parser.add_argument('--crash-loop-window', type=float, default=300.0, help='crash loop window in seconds')
+    parser.add_argument('--sample-interval', type=float, default=15.0, help='seconds between /proc resource samples')
+    parser.add_argument('--max-rss-mb', type=float, help='restart when the child tree RSS stays above this')
+    parser.add_argument('--max-cpu-percent', type=float, help='restart when the child tree CPU stays above this (100 = one core)')
+    parser.add_argument('--ceiling-samples', type=int, default=3, help='consecutive samples over a ceiling before restarting')
+    parser.add_argument('--stats-jsonl', help='append every resource sample to this file as JSON lines')
+    parser.add_argument('--stats-prom', help='keep the latest samples in this file in Prometheus text format')
+    parser.add_argument('--progress', action='store_true', help='track block heights in the output (implied by the other --progress options)')
+    parser.add_argument('--progress-regex', default=INDEXER_HEIGHT_REGEX,
+                        help='regex whose first group is a processed block height, defaults to the indexer log line')
+    parser.add_argument('--chain-height-regex', default=INDEXER_CHAIN_HEIGHT_REGEX,
+                        help='regex whose first group is the latest chain height, used for lag')
+    parser.add_argument('--progress-timeout', type=float, help='restart when the height has not advanced for this many seconds')
+    parser.add_argument('--progress-rate-window', type=float, default=60.0, help='seconds of history used for blocks/sec')
+    parser.add_argument('--metrics-port', type=int, help='serve Prometheus metrics on this port at /metrics')
+    parser.add_argument('--metrics-host', default='127.0.0.1', help='address for the metrics endpoint')
+    parser.add_argument('--kill-grace', type=float, default=KILL_GRACE_SECONDS,
+                        help='seconds between SIGTERM and SIGKILL when the monitor stops the command')
+    parser.add_argument('--diag-dir', help='capture diagnostics into this directory before stopping the command')
+    parser.add_argument('--diag-signal', type=_signal_arg, default=signal.SIGUSR2,
+                        help='signal that asks the command for diagnostics, by name or number')
+    parser.add_argument('--diag-wait', type=float, default=30.0, help='seconds to wait for the diagnostics artifacts')
+    parser.add_argument('--diag-tail-lines', type=int, default=500, help='lines of recent output saved with a capture')
+    parser.add_argument('--rolling', action='store_true',
+                        help='replace the query worker by starting, probing and warming a new one before stopping the old')
+    parser.add_argument('--direct-port', type=int, help='loopback port for the worker (and +1 for its replacement), required with --rolling')
+    parser.add_argument('--max-uptime', type=float, help='roll the worker after this many seconds')
+    parser.add_argument('--ready-path', action='append', dest='ready_paths',
+                        help='path that must answer 200 before a worker is ready, repeatable (default: /health and /islatest)')
+    parser.add_argument('--ready-timeout', type=float, default=180.0, help='seconds a new worker gets to become ready')
+    parser.add_argument('--warm-limit', type=int, default=200, help='URLs from /cacheLinks replayed against a new worker')
+    parser.add_argument('--warm-concurrency', type=int, default=4, help='parallel warm-up requests')
+    parser.add_argument('--warm-timeout', type=float, default=120.0, help='seconds the warm-up of a new worker may take')
+    parser.add_argument('--probe', action='store_true',
+                        help='probe the command over HTTP (implied by --probe-port, with --rolling the direct port is used)')
+    parser.add_argument('--probe-port', type=int, help='port the HTTP probes go to')
+    parser.add_argument('--probe-host', default='127.0.0.1', help='host the HTTP probes go to')
+    parser.add_argument('--probe-path', action='append', dest='probe_paths',
+                        help='path that must answer 200, repeatable (default: /health and /islatest)')
+    parser.add_argument('--probe-interval', type=float, default=10.0, help='seconds between probe rounds')
+    parser.add_argument('--probe-timeout', type=float, default=5.0,
+                        help='seconds a single probe may take, also the readiness checks of a rolling replacement')
+    parser.add_argument('--probe-failures', type=int, default=3, help='consecutive failures of a path before acting')
+    parser.add_argument('--probe-action', choices=('restart', 'alert'), default='restart',
+                        help='restart the command on sustained failure, or only log it and flag it in the metrics')
+    parser.add_argument('--probe-start-period', type=float, default=120.0,
+                        help='seconds after start during which probe failures do not count')
+    args = parser.parse_args(argv)
+    if args.config is None and (args.timeout is None or args.cmd is None):
+        parser.error('timeout and cmd are required without --config')
+    if args.rolling and args.config is None and not args.direct_port:
+        parser.error('--rolling needs --direct-port')
+    if args.probe and args.config is None and not (args.probe_port or args.rolling):
+        parser.error('--probe needs --probe-port unless --rolling is used')
+    _imply_progress(args)
+    return args
+
+
+def _imply_progress(args):
+    if args.progress_timeout or args.progress_regex != INDEXER_HEIGHT_REGEX:
+        args.progress = True
+    if args.probe_port:
+        args.probe = True
+
+
+def _resource_watch_from_args(args):
+    if not (args.max_rss_mb or args.max_cpu_percent or args.stats_jsonl or args.stats_prom):
+        return None
+    return ResourceWatch(
+        interval=args.sample_interval,
+        max_rss_bytes=int(args.max_rss_mb * 1024 * 1024) if args.max_rss_mb else None,
+        max_cpu_percent=args.max_cpu_percent,
+        ceiling_samples=args.ceiling_samples,
+        jsonl_path=args.stats_jsonl,
+        prom_path=args.stats_prom,
+    )
+
+
+def _rolling_restart_from_args(args, env=None, policy='always', **supervisor_options):
+    return RollingRestart(
+        args.cmd,
+        args.timeout,
+        args.direct_port,
+        backoff=Backoff(initial=args.backoff_initial, maximum=args.backoff_max),
+        stable_after=args.stable_after,
+        crash_loop_restarts=args.crash_loop_restarts,
+        crash_loop_window=args.crash_loop_window,
+        policy=policy,
+        max_uptime=args.max_uptime,
+        ready_paths=tuple(args.ready_paths or ('/health', '/islatest')),
+        ready_timeout=args.ready_timeout,
+        probe_timeout=args.probe_timeout,
+        warm_limit=args.warm_limit,
+        warm_concurrency=args.warm_concurrency,
+        warm_timeout=args.warm_timeout,
+        env=env,
+        **supervisor_options,
+    )
+
+
+def _supervisor_options(args):
+    supervisor_options = {
+        'name': args.name,
+        'resources': _resource_watch_from_args(args),
+        'kill_grace': args.kill_grace,
+    }
+    if args.diag_dir:
+        supervisor_options['diagnostics'] = Diagnostics(
+            args.diag_dir,
+            sig=args.diag_signal,
+            wait=args.diag_wait,
+            tail_lines=args.diag_tail_lines,
+        )
+    if args.progress:
+        supervisor_options['progress'] = ProgressWatch(
+            height_regex=args.progress_regex,
+            chain_height_regex=args.chain_height_regex,
+            timeout=args.progress_timeout,
+            rate_window=args.progress_rate_window,
+        )
+    if args.probe:
+        supervisor_options['probe'] = HealthProbe(
+            port=args.probe_port,
+            host=args.probe_host,
+            paths=tuple(args.probe_paths or ('/health', '/islatest')),
+            interval=args.probe_interval,
+            timeout=args.probe_timeout,
+            failures=args.probe_failures,
+            action=args.probe_action,
+            start_period=args.probe_start_period,
+        )
+    return supervisor_options
+
+
+def main(argv):
+    args = _parse_args(argv)
+    if args.config:
+        config = load_config(args.config)
+        monitor = config.get('monitor', {})
+        default_output().max_buffer_bytes = int(monitor.get('output_buffer_mb', args.output_buffer_mb) * 1024 * 1024)
+        metrics_port = monitor.get('metrics_port', args.metrics_port)
+        metrics_address = (monitor.get('metrics_host', args.metrics_host), metrics_port) if metrics_port else None
+        try:
+            group = ChildGroup(runners_from_config(config))
+        except ValueError as e:
+            raise SystemExit('%s: %s' % (args.config, e))
+        return asyncio.run(_run_forwarding_signals(group, metrics_address))
+
+    default_output().max_buffer_bytes = int(args.output_buffer_mb * 1024 * 1024)
+    supervisor_options = _supervisor_options(args)
+    metrics_address = (args.metrics_host, args.metrics_port) if args.metrics_port else None
+    if args.rolling:
+        runner = _rolling_restart_from_args(args, **supervisor_options)
+        return _exit_code(asyncio.run(_run_forwarding_signals(runner, metrics_address)))
+    if not args.restart:
+        return monitor_command(args.cmd, args.timeout, metrics_address, **supervisor_options)
+
+    runner = RestartLoop(
+        args.cmd,
+        args.timeout,
+        backoff=Backoff(initial=args.backoff_initial, maximum=args.backoff_max),
+        stable_after=args.stable_after,
+        crash_loop_restarts=args.crash_loop_restarts,
+        crash_loop_window=args.crash_loop_window,
+        **supervisor_options,
+    )
+    return _exit_code(asyncio.run(_run_forwarding_signals(runner, metrics_address)))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
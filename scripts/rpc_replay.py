@@ -0,0 +1,384 @@
+#!/usr/bin/env python3 -u
+
+# jsinfo/scripts/rpc_replay.py
+#
+# A stand-in for the Lava node's Tendermint RPC, so the indexer can be run and
+# timed without a live node. It replays a recorded range of blocks:
+#
+#   python3 -u scripts/rpc_replay.py record --rpc https://lav1.tendermintrpc.lava.build \
+#       --start 1500000 --count 500 /tmp/lava-blocks
+#   python3 -u scripts/rpc_replay.py serve --port 26657 /tmp/lava-blocks
+#
+# or, for an indexer started with JSINFO_INDEXER_READ_CACHE=1, the blocks of
+# its JSINFO_INDEXER_CACHE_PATH disk cache (lavaBlockCache.ts), where the
+# indexer reads block, txs and events from the cache files and only asks the
+# node for its height:
+#
+#   python3 -u scripts/rpc_replay.py serve --cache-dir ~/Documents/jsinfo_disk_cache
+#
+# A recording holds one <height>.json.gz per block with the block, block_results
+# and tx_search results as the node returned them, and the node's status.json.
+# The served chain head is the last block of the range, so the indexer catches
+# up through all of it, or with --pace it grows from the first block at that
+# many blocks per second, like a live chain. Requests the recording cannot
+# answer (abci_query from lavajs, the REST endpoints of the monitors) are
+# proxied to --upstream when it is given and otherwise answered with an error;
+# they are counted apart, as "unrecorded".
+#
+# ReplayServer is also started in a thread by indexer_bench.py.
+
+import argparse
+import collections
+import glob
+import gzip
+import json
+import os
+import re
+import sys
+import threading
+import time
+import urllib.request
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+RECORD_TX_PAGE_SIZE = 100
+# lavaBlockCache.ts names its files <height>_<block|txs|events>[.pako].json
+CACHE_FILE_REGEX = re.compile(r'^(\d+)_block(\.pako)?\.json$')
+TX_HEIGHT_QUERY_REGEX = re.compile(r"tx\.height\s*=\s*'?(\d+)'?")
+# cosmjs picks its Tendermint 0.37 client for this version
+DEFAULT_NODE_VERSION = '0.37.2'
+
+
+class NotRecorded(Exception):
+    pass
+
+
+def _rpc_call(url, method, params, timeout=60.0):
+    body = json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': method, 'params': params}).encode()
+    request = urllib.request.Request(url, body, {'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        reply = json.loads(response.read())
+    if 'error' in reply:
+        raise RuntimeError('%s %s: %s' % (method, params, reply['error']))
+    return reply['result']
+
+
+def record(rpc, start, count, directory, log=print):
+    """Saves blocks start .. start + count - 1 of the node at rpc into directory."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'status.json'), 'w') as f:
+        json.dump(_rpc_call(rpc, 'status', {}), f)
+    for height in range(start, start + count):
+        path = os.path.join(directory, '%d.json.gz' % height)
+        if os.path.exists(path):
+            continue
+        txs, page = [], 1
+        while True:
+            result = _rpc_call(rpc, 'tx_search', {'query': 'tx.height=%d' % height, 'prove': False,
+                                                  'page': str(page), 'per_page': str(RECORD_TX_PAGE_SIZE)})
+            txs.extend(result['txs'])
+            if len(txs) >= int(result['total_count']) or not result['txs']:
+                break
+            page += 1
+        recorded = {
+            'height': height,
+            'block': _rpc_call(rpc, 'block', {'height': str(height)}),
+            'block_results': _rpc_call(rpc, 'block_results', {'height': str(height)}),
+            'txs': txs,
+        }
+        # written under a temporary name, so an interrupted recording does not leave half a block
+        with gzip.open(path + '.tmp', 'wt') as f:
+            json.dump(recorded, f)
+        os.rename(path + '.tmp', path)
+        if (height - start + 1) % 50 == 0:
+            log('recorded %d/%d blocks' % (height - start + 1, count))
+
+
+class RecordingSource:
+    """Blocks of a directory written by record()."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.heights = sorted(int(os.path.basename(path).split('.')[0])
+                              for path in glob.glob(os.path.join(directory, '*.json.gz')))
+        if not self.heights:
+            raise SystemExit('no recorded blocks in %s' % directory)
+        with open(os.path.join(directory, 'status.json')) as f:
+            self._status = json.load(f)
+        self._lock = threading.Lock()
+        self._cached = collections.OrderedDict()
+
+    def _block(self, height):
+        with self._lock:
+            if height in self._cached:
+                self._cached.move_to_end(height)
+                return self._cached[height]
+        path = os.path.join(self.directory, '%d.json.gz' % height)
+        if not os.path.exists(path):
+            raise NotRecorded('block %d' % height)
+        with gzip.open(path, 'rt') as f:
+            recorded = json.load(f)
+        with self._lock:
+            self._cached[height] = recorded
+            # the indexer asks for each block a few times in a row, not again later
+            while len(self._cached) > 64:
+                self._cached.popitem(last=False)
+        return recorded
+
+    def status(self, head):
+        status = json.loads(json.dumps(self._status))
+        status['sync_info']['latest_block_height'] = str(head)
+        status['sync_info']['catching_up'] = False
+        return status
+
+    def rpc(self, method, params, head):
+        if method in ('block', 'block_results'):
+            height = int(params.get('height') or head)
+            if height > head:
+                raise NotRecorded('block %d is past the head %d' % (height, head))
+            return self._block(height)[method]
+        if method == 'tx_search':
+            match = TX_HEIGHT_QUERY_REGEX.search(params.get('query', ''))
+            if not match:
+                raise NotRecorded('tx_search %s' % params.get('query'))
+            txs = self._block(int(match.group(1)))['txs']
+            page, per_page = int(params.get('page') or 1), int(params.get('per_page') or 30)
+            return {'txs': txs[(page - 1) * per_page:page * per_page], 'total_count': str(len(txs))}
+        raise NotRecorded(method)
+
+
+class BlockCacheSource:
+    """The heights of an indexer disk cache, for an indexer that reads its blocks from there."""
+
+    def __init__(self, directory, chain_id=None):
+        self.heights = sorted(int(match.group(1)) for match in
+                              (CACHE_FILE_REGEX.match(name) for name in os.listdir(directory)) if match)
+        if not self.heights:
+            raise SystemExit('no <height>_block files in %s' % directory)
+        last = self._read(directory, self.heights[-1])
+        self.chain_id = chain_id or last['header']['chainId']
+        self.time = last['header']['time']
+
+    @staticmethod
+    def _read(directory, height):
+        for name, compressed in (('%d_block.pako.json' % height, True), ('%d_block.json' % height, False)):
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    data = f.read()
+                # pako.deflate writes the zlib format
+                return json.loads(zlib.decompress(data) if compressed else data)
+        raise NotRecorded('block %d' % height)
+
+    def status(self, head):
+        zero_hash = '00' * 32
+        return {
+            'node_info': {
+                'protocol_version': {'p2p': '8', 'block': '11', 'app': '0'},
+                'id': '00' * 20,
+                'listen_addr': 'tcp://127.0.0.1:26656',
+                'network': self.chain_id,
+                'version': DEFAULT_NODE_VERSION,
+                'channels': '40202122233038606100',
+                'moniker': 'jsinfo-rpc-replay',
+                'other': {'tx_index': 'on', 'rpc_address': 'tcp://127.0.0.1:26657'},
+            },
+            'sync_info': {
+                'latest_block_hash': zero_hash,
+                'latest_app_hash': zero_hash,
+                'latest_block_height': str(head),
+                'latest_block_time': self.time,
+                'earliest_block_height': str(self.heights[0]),
+                'catching_up': False,
+            },
+            'validator_info': {
+                'address': '00' * 20,
+                'pub_key': {'type': 'tendermint/PubKeyEd25519', 'value': 'A' * 43 + '='},
+                'voting_power': '1',
+            },
+        }
+
+    def rpc(self, method, params, head):
+        # block, block_results and tx_search come out of the cache files
+        raise NotRecorded(method)
+
+
+class ReplayServer:
+    """Serves a RecordingSource or BlockCacheSource as a Tendermint RPC endpoint, in a thread."""
+
+    def __init__(self, source, host='127.0.0.1', port=0, pace=None, upstream=None):
+        self.source = source
+        self.pace = pace
+        self.upstream = upstream.rstrip('/') if upstream else None
+        self.first, self.last = source.heights[0], source.heights[-1]
+        self.started_at = None
+        self.requests = collections.Counter()  # method: count
+        self.unrecorded = collections.Counter()  # method or path: count
+        self.seconds = collections.Counter()  # method: seconds spent answering
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    @property
+    def head(self):
+        if not self.pace:
+            return self.last
+        elapsed = time.monotonic() - (self.started_at or time.monotonic())
+        return min(self.last, self.first + int(elapsed * self.pace))
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._server.serve_forever, name='rpc-replay', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.started_at = time.monotonic()
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': dict(self.requests),
+                'unrecorded': dict(self.unrecorded),
+                'ms_per_request': {method: 1000.0 * self.seconds[method] / count
+                                   for method, count in self.requests.items()},
+            }
+
+    def _count(self, method, started, unrecorded=False):
+        with self._lock:
+            self.requests[method] += 1
+            self.seconds[method] += time.monotonic() - started
+            if unrecorded:
+                self.unrecorded[method] += 1
+
+    def answer(self, call):
+        """The JSON-RPC reply to one call object."""
+        started = time.monotonic()
+        method, params = call.get('method', ''), call.get('params') or {}
+        reply = {'jsonrpc': '2.0', 'id': call.get('id', -1)}
+        try:
+            if method == 'health':
+                reply['result'] = {}
+            elif method == 'status':
+                reply['result'] = self.source.status(self.head)
+            else:
+                reply['result'] = self.source.rpc(method, params, self.head)
+        except NotRecorded as e:
+            if self.upstream:
+                try:
+                    reply['result'] = _rpc_call(self.upstream, method, params)
+                except (OSError, RuntimeError, ValueError) as upstream_error:
+                    reply['error'] = {'code': -32603, 'message': 'upstream: %s' % upstream_error}
+            else:
+                reply['error'] = {'code': -32601, 'message': 'not recorded: %s' % e}
+            self._count(method, started, unrecorded=True)
+            return reply
+        self._count(method, started)
+        return reply
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                try:
+                    call = json.loads(body)
+                except ValueError:
+                    self._send(400, {'jsonrpc': '2.0', 'id': -1, 'error': {'code': -32700, 'message': 'parse error'}})
+                    return
+                if isinstance(call, list):
+                    self._send(200, [server.answer(item) for item in call])
+                else:
+                    self._send(200, server.answer(call))
+
+            def do_GET(self):
+                # the URI form: /status, /block?height=5, and /health from ConnectToRpc
+                parts = urlsplit(self.path)
+                method = parts.path.strip('/')
+                if method not in ('health', 'status', 'block', 'block_results', 'tx_search'):
+                    self._unrecorded_get(parts)
+                    return
+                params = {key: value.strip('"') for key, value in parse_qsl(parts.query)}
+                self._send(200, server.answer({'id': -1, 'method': method, 'params': params}))
+
+            def _unrecorded_get(self, parts):
+                # REST paths of the indexer's monitors when JSINFO_INDEXER_LAVA_REST_RPC_URL points here
+                started = time.monotonic()
+                server._count('GET /' + parts.path.strip('/').split('/')[0], started, unrecorded=True)
+                self._send(501, {'code': 12, 'message': 'not recorded: %s' % parts.path})
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode()
+                # one write, so the response does not wait on a delayed ACK
+                self.wfile.write(b'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s' % (
+                    status, self.responses.get(status, ('',))[0].encode(), len(body), body))
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def load_source(args):
+    if args.cache_dir:
+        return BlockCacheSource(os.path.expanduser(args.cache_dir), args.chain_id)
+    if not args.directory:
+        raise SystemExit('give a recording directory or --cache-dir')
+    return RecordingSource(args.directory)
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description='Replay recorded Lava blocks as a Tendermint RPC endpoint.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help='serve a recording or an indexer block cache')
+    serve.add_argument('directory', nargs='?', help='directory written by the record command')
+    serve.add_argument('--cache-dir', help='serve the heights of this JSINFO_INDEXER_CACHE_PATH instead')
+    serve.add_argument('--chain-id', help='chain id for --cache-dir (default: the one in the last block)')
+    serve.add_argument('--host', default='127.0.0.1', help='address to listen on (default: %(default)s)')
+    serve.add_argument('--port', type=int, default=26657, help='port to listen on (default: %(default)s)')
+    serve.add_argument('--pace', type=float, default=None,
+                       help='grow the chain head from the first block at this many blocks per second')
+    serve.add_argument('--upstream', help='node to proxy calls the recording cannot answer to')
+
+    rec = commands.add_parser('record', help='save a range of blocks of a live node')
+    rec.add_argument('directory', help='directory to write the recording to')
+    rec.add_argument('--rpc', required=True, help='Tendermint RPC URL of the node')
+    rec.add_argument('--start', type=int, required=True, help='first height to record')
+    rec.add_argument('--count', type=int, default=200, help='blocks to record (default: %(default)s)')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = _parse_args(argv)
+    if args.command == 'record':
+        record(args.rpc.rstrip('/'), args.start, args.count, args.directory)
+        return 0
+
+    server = ReplayServer(load_source(args), args.host, args.port, args.pace, args.upstream)
+    print('serving blocks %d..%d on %s' % (server.first, server.last, server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(server.stats(), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -12,12 +12,20 @@ ulimit -c unlimited;
 while true; do
     # echo "$(date '+%Y-%m-%d %H:%M:%S') - Starting bun dist/src/indexer.js in process_monitor";
     # timeout 4m bun run dist/src/indexer.js;
-    python3 -u scripts/process_monitor.py 600 "bun run dist/src/indexer.js" || true;
+    # process_monitor.py restarts the indexer itself (with backoff), this loop only guards the monitor.
+    # It also restarts when no block was inserted for JSINFO_INDEXER_PROGRESS_TIMEOUT seconds
+    # and serves blocks/sec and lag on /metrics. Before stopping a stuck indexer it asks
+    # for a heap snapshot (SIGUSR2) and keeps it with the last log lines in the diagnostics dir.
+    python3 -u scripts/process_monitor.py --restart --name indexer \
+        --progress-timeout "${JSINFO_INDEXER_PROGRESS_TIMEOUT:-1800}" \
+        --diag-dir "${JSINFO_INDEXER_DIAGNOSTICS_DIR:-/tmp/jsinfo-diagnostics}" \
+        --metrics-host 0.0.0.0 --metrics-port "${JSINFO_INDEXER_MONITOR_METRICS_PORT:-9464}" \
+        600 "bun run dist/src/indexer.js" || true;
     EXIT_CODE=$?;
     echo "$(date '+%Y-%m-%d %H:%M:%S') - process_monitor.py bun run dist/src/indexer.js exited with code:" $EXIT_CODE;
     if [ $EXIT_CODE -ne 0 ]; then
         echo "$(date '+%Y-%m-%d %H:%M:%S') - Error: process_monitor.py bun run dist/src/indexer.js returned a non 0 exit code, restarting...";
     fi;
     echo "$(date '+%Y-%m-%d %H:%M:%S') - Finished process_monitor.py bun run dist/src/indexer.js loop";
-    # sleep 1;
+    sleep 1;
 done
\ No newline at end of file
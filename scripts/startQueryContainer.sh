@@ -9,16 +9,31 @@ trap 'echo "Warning: Script received SIGSEGV, ignoring"' 11;
 trap 'echo "Error: Script terminated by signal, ignoring"' 2 15;
 ulimit -c unlimited
 
+# Memory ceiling for the query server, process_monitor.py replaces it when RSS stays above it
+QUERY_MAX_RSS_MB=${JSINFO_QUERY_MAX_RSS_MB:-4096}
+# Loopback ports (this one and +1) the monitor uses to probe and warm a replacement worker
+QUERY_DIRECT_PORT=${JSINFO_QUERY_DIRECT_PORT:-18081}
+# Optional periodic replacement, 0 disables it
+QUERY_MAX_UPTIME=${JSINFO_QUERY_MAX_UPTIME_SECONDS:-0}
+
+# The old and the new worker listen on the public port together during a rolling restart.
+# Set net.ipv4.tcp_migrate_req=1 (docker-compose.yml does) so connections still queued on
+# the old worker's socket move to the new one instead of being reset when it closes.
+export JSINFO_QUERY_REUSE_PORT=true
+
 # Start the scripts in an endless loop
 run_script() {
     command=$1
     while true; do
-        # Generate a random number between 1 to 4 hours
-        BUN_TIMEOUT=$((RANDOM % 181 + 60))
-        
-        # Run the command with the random timeout
-        echo "QueryPod $(date) :: Starting '$command' with ${BUN_TIMEOUT} minute timeout ..."
-        eval "timeout ${BUN_TIMEOUT}m $command" || true
+        # process_monitor.py restarts the command itself when it exits. When its RSS stays over the ceiling
+        # (or on SIGHUP) it starts a replacement, waits for /health and /islatest, warms it with /cacheLinks
+        # and only then drains the old worker. A worker whose /health stops answering is replaced the same way.
+        # This loop only guards the monitor. The query server may be silent for long, so no stall timeout.
+        echo "QueryPod $(date) :: Starting '$command' with a ${QUERY_MAX_RSS_MB}MB memory ceiling ..."
+        python3 -u scripts/process_monitor.py --rolling --name query \
+            --direct-port "$QUERY_DIRECT_PORT" --max-uptime "$QUERY_MAX_UPTIME" \
+            --probe --probe-path /health \
+            --max-rss-mb "$QUERY_MAX_RSS_MB" 0 "$command" || true
         echo "QueryPod $(date) :: '$command' stopped, restarting..."
         sleep 1
     done
@@ -2,6 +2,7 @@
 
 import { logger } from '@jsinfo/utils/logger';
 import { IsIndexerProcess } from '@jsinfo/utils/env';
+import { SetupDiagnosticsSignalHandler } from '@jsinfo/utils/diagnostics';
 
 if (!IsIndexerProcess()) {
     console.log('indexer.ts', "not indexer process");
@@ -11,6 +12,8 @@ if (!IsIndexerProcess()) {
 import * as consts from './indexer/indexerConsts';
 import { IndexerThreadCallerStart } from './indexer/indexerThreadCaller';
 
+SetupDiagnosticsSignalHandler('indexer');
+
 const indexer = async (): Promise<void> => {
     logger.info(`Starting indexer, rpc: ${consts.JSINFO_INDEXER_LAVA_RPC}, start height: ${consts.JSINFO_INDEXER_START_BLOCK}`);
 
@@ -15,7 +15,7 @@ import * as JsinfoSchema from "../schemas/jsinfoSchema/jsinfoSchema";
 import { eq, desc } from "drizzle-orm";
 import { PromisePool } from '@supercharge/promise-pool'
 import { GetOneLavaBlock } from './lavaBlock'
-import { LavaBlock } from './lavaTypes'
+import { LavaBlock, LavaBlockTimings } from './lavaTypes'
 import { queryRpc } from "./utils/lavajsRpc";
 import { queryJsinfo } from '../utils/db';
 
@@ -55,6 +55,13 @@ async function isBlockInDb(height: number): Promise<boolean> {
     return dbBlock.length != 0;
 }
 
+// rows InsertBlock writes, the blocks row included
+function LavaBlockRowCount(block: LavaBlock): number {
+    return 1 + block.dbEvents.length + block.dbPayments.length + block.dbConflictResponses.length +
+        block.dbSubscriptionBuys.length + block.dbConflictVote.length + block.dbProviderReports.length +
+        block.dbProviderLatestBlockReports.length;
+}
+
 async function InsertBlock(block: LavaBlock) {
     logger.info(`Starting InsertBlock for block height: ${block.height}`);
     onActivity(); // Reset activity timeout
@@ -177,10 +184,13 @@ const doBatch = async (
                 }
 
                 let block: null | LavaBlock = null;
-                block = await GetOneLavaBlock(height);
+                const timings: LavaBlockTimings = { fetchMs: 0, processMs: 0 };
+                block = await GetOneLavaBlock(height, timings);
                 if (block != null) {
+                    const insertStart = performance.now();
                     await InsertBlock(block);
-                    logger.info(`doBatch: Inserted block ${height} into DB`);
+                    // scripts/indexer_bench.py reads the stage times and row count off this line
+                    logger.info(`doBatch: Inserted block ${height} into DB, fetch ${timings.fetchMs.toFixed(1)}ms process ${timings.processMs.toFixed(1)}ms insert ${(performance.now() - insertStart).toFixed(1)}ms rows ${LavaBlockRowCount(block)}`);
                 } else {
                     logger.info(`doBatch: Failed getting block ${height}`);
                 }
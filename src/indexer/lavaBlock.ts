@@ -3,7 +3,7 @@
 import * as JsinfoSchema from '@jsinfo/schemas/jsinfoSchema/jsinfoSchema';
 import { IndexedTx, Block, Event } from "@cosmjs/stargate"
 import { ProcessOneEvent } from './eventProcessor';
-import { LavaBlock } from './lavaTypes';
+import { LavaBlock, LavaBlockTimings } from './lavaTypes';
 import LavaBlockCache from './lavaBlockCache';
 import { logger } from '@jsinfo/utils/logger';
 import { queryRpc } from './utils/lavajsRpc';
@@ -64,7 +64,8 @@ export const GetRpcBlockResultEvents = async (
 }
 
 export const GetOneLavaBlock = async (
-    height: number
+    height: number,
+    timings?: LavaBlockTimings
 ): Promise<LavaBlock> => {
 
     const startTimeBlock = Date.now();
@@ -102,6 +103,7 @@ export const GetOneLavaBlock = async (
         });
     }
 
+    const startTimeProcess = performance.now();
     const blockTime = new Date(block!.header.time);
 
     const lavaBlock: LavaBlock = {
@@ -139,5 +141,10 @@ export const GetOneLavaBlock = async (
         null,
     ))
 
+    if (timings) {
+        timings.fetchMs = (endTimeBlock - startTimeBlock) + (endTimeTxs - startTimeTxs) + (endTimeEvts - startTimeEvts);
+        timings.processMs = performance.now() - startTimeProcess;
+    }
+
     return lavaBlock;
 }
\ No newline at end of file
@@ -16,4 +16,10 @@ export type LavaBlock = {
     dbConflictVote: JsinfoSchema.InsertConflictVote[]
     dbProviderReports: JsinfoSchema.InsertProviderReported[]
     dbProviderLatestBlockReports: JsinfoSchema.InsertProviderLatestBlockReports[]
-}
\ No newline at end of file
+}
+
+// filled by GetOneLavaBlock when asked, for the per block stage times doBatch logs
+export type LavaBlockTimings = {
+    fetchMs: number
+    processMs: number
+}
@@ -8,6 +8,10 @@ import { GetLatestBlock } from './query/utils/getLatestBlock'
 
 import './query/queryRoutes'
 import { JSONStringify } from './utils/fmt'
+import { SetupDiagnosticsSignalHandler } from './utils/diagnostics'
+import { createServer, Server } from 'http'
+import { ListenOptions } from 'net'
+import { FastifyListenOptions } from 'fastify'
 
 export const queryServerMain = async (): Promise<void> => {
     logger.info('Starting query server on port ' + consts.JSINFO_QUERY_PORT + ' host ' + consts.JSINFO_QUERY_HOST)
@@ -25,8 +29,22 @@ export const queryServerMain = async (): Promise<void> => {
             process.exit(1)
         }
 
-        logger.info(`listening on ${consts.JSINFO_QUERY_PORT} ${consts.JSINFO_QUERY_HOST}`)
-        await GetServerInstance().listen({ port: consts.JSINFO_QUERY_PORT, host: consts.JSINFO_QUERY_HOST })
+        logger.info(`listening on ${consts.JSINFO_QUERY_PORT} ${consts.JSINFO_QUERY_HOST}${consts.JSINFO_QUERY_REUSE_PORT ? ' (reusePort)' : ''}`)
+        // fastify passes the options on to server.listen
+        const listenOptions: ReusePortOptions<FastifyListenOptions> = { port: consts.JSINFO_QUERY_PORT, host: consts.JSINFO_QUERY_HOST, reusePort: consts.JSINFO_QUERY_REUSE_PORT }
+        await GetServerInstance().listen(listenOptions)
+        if (consts.JSINFO_QUERY_REUSE_PORT && !await listenerSharesPort(consts.JSINFO_QUERY_PORT, consts.JSINFO_QUERY_HOST)) {
+            logger.warn(`reusePort was not applied to ${consts.JSINFO_QUERY_HOST}:${consts.JSINFO_QUERY_PORT}, a second worker on this port will fail with EADDRINUSE and rolling restarts will not overlap`)
+        }
+
+        let directServer: Server | null = null
+        if (consts.JSINFO_QUERY_DIRECT_PORT) {
+            // same routes, but only this worker answers here, even when several share the public port
+            logger.info(`listening on direct port ${consts.JSINFO_QUERY_DIRECT_PORT} 127.0.0.1`)
+            directServer = createServer((req, res) => GetServerInstance().routing(req, res))
+            directServer.listen(consts.JSINFO_QUERY_DIRECT_PORT, '127.0.0.1')
+        }
+        setupGracefulShutdown(directServer)
     } catch (err) {
         logger.error(String(err))
         logger.error('Sleeping one second before exit')
@@ -35,6 +53,47 @@ export const queryServerMain = async (): Promise<void> => {
     }
 }
 
+// reusePort is a node:net listen option that neither fastify's nor (depending on
+// the @types/node version) node's listen option types declare
+type ReusePortOptions<T> = T & { reusePort?: boolean }
+
+// A second reusePort listener on the port only binds when the first one set
+// SO_REUSEPORT too, so this tells whether the runtime honored the option. The
+// probe serves the same routes while it is open, in case the kernel hands it a
+// connection.
+function listenerSharesPort(port: number, host: string): Promise<boolean> {
+    return new Promise(resolve => {
+        const probe = createServer((req, res) => GetServerInstance().routing(req, res))
+        const probeOptions: ReusePortOptions<ListenOptions> = { port, host, reusePort: true }
+        probe.once('error', () => resolve(false))
+        probe.listen(probeOptions, () => probe.close(() => resolve(true)))
+    })
+}
+
+// On SIGTERM stop accepting connections and let in-flight requests finish, so a
+// rolling restart (process_monitor.py --rolling) does not cut off any response.
+function setupGracefulShutdown(directServer: Server | null) {
+    let closing = false
+
+    const shutdown = async (signal: string) => {
+        if (closing) return
+        closing = true
+        logger.info(`${signal} received, draining in-flight requests (up to ${consts.JSINFO_QUERY_SHUTDOWN_TIMEOUT_MS}ms)`)
+
+        setTimeout(() => {
+            logger.warn('In-flight requests did not finish in time, exiting')
+            process.exit(1)
+        }, consts.JSINFO_QUERY_SHUTDOWN_TIMEOUT_MS).unref()
+
+        directServer?.close()
+        await GetServerInstance().close()
+        logger.info('Query server closed')
+        process.exit(0)
+    }
+
+    process.on('SIGTERM', () => shutdown('SIGTERM'))
+    process.on('SIGINT', () => shutdown('SIGINT'))
+}
 
 try {
     console.info(`QueryCache:: JSINFO_QUERY_HIGH_POST_BODY_LIMIT: ${consts.JSINFO_QUERY_HIGH_POST_BODY_LIMIT}`);
@@ -101,3 +160,5 @@ async function setupMemoryDebug() {
 
 // Call the setup function
 setupMemoryDebug();
+
+SetupDiagnosticsSignalHandler('query');
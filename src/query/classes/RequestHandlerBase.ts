@@ -1,18 +1,24 @@
 // src/query/classes/RequestHandlerBase.ts
 
-import { Pagination, ParsePaginationFromRequest, SerializePagination } from "../utils/queryPagination";
+import { Pagination, PaginationCursor, ParsePaginationFromRequest, SerializePagination, SerializeKeysetPagination, ParseCursorFromRequest, EncodeCursor, FIRST_PAGE_CURSOR } from "../utils/queryPagination";
 import { FastifyReply, FastifyRequest } from "fastify";
 import { GetDataLength, GetDataLengthForPrints } from "@jsinfo/utils/fmt";
 import { subMonths } from 'date-fns';
-import { WriteErrorToFastifyReply } from '@jsinfo/query/utils/queryServerUtils';
+import { WriteErrorToFastifyReply, WriteCacheHeadersToFastifyReply } from '@jsinfo/query/utils/queryServerUtils';
 import { JSINFO_REQUEST_HANDLER_BASE_DEBUG } from '@jsinfo/query/queryConsts';
 import { RedisCache } from '@jsinfo/redis/classes/RedisCache';
 import { ParseDateToUtc, GetUtcNow, NormalizeChartFetchDates } from "@jsinfo/utils/date";
 import { logger } from "@jsinfo/utils/logger";
 import { JSONStringify } from '@jsinfo/utils/fmt';
+import { TimeRequestPhase } from '@jsinfo/utils/requestTiming';
 import { JSINFO_QUERY_CLASS_MEMORY_DEBUG_MODE } from '@jsinfo/query/queryConsts';
 import { logClassMemory } from './MemoryLogger';
 
+export interface KeysetPage<T> {
+    data: T[];
+    nextCursor: string | null;
+}
+
 export class RequestHandlerBase<T> {
     protected className: string;
     protected csvFileName: string = "";
@@ -116,6 +122,11 @@ export class RequestHandlerBase<T> {
         throw new Error("Method 'fetchPaginatedRecords' must be implemented.");
     }
 
+    // cursor is null for the first page, see KeysetCondition in queryPagination
+    protected async fetchKeysetRecords(pagination: Pagination | null, cursor: PaginationCursor | null): Promise<KeysetPage<T>> {
+        throw new Error("Cursor pagination is not supported for this endpoint");
+    }
+
     protected async fetchDateRangeRecords(from: Date, to: Date): Promise<T[]> {
         throw new Error("Method 'fetchDateRangeRecords' must be implemented.");
     }
@@ -124,19 +135,29 @@ export class RequestHandlerBase<T> {
         throw new Error("Method 'ConvertRecordsToCsv' must be implemented.");
     }
 
-    public async PaginatedRecordsRequestHandler(request: FastifyRequest, reply: FastifyReply): Promise<{ data: T[] } | null> {
+    public async PaginatedRecordsRequestHandler(request: FastifyRequest, reply: FastifyReply): Promise<{ data: T[], nextCursor?: string | null } | null> {
         try {
             const pagination = ParsePaginationFromRequest(request);
+            const cursor = ParseCursorFromRequest(request);
+            if (cursor !== undefined) {
+                return await this.keysetRecords(reply, pagination, cursor);
+            }
+
             const key = `${this.dataKey}|${pagination ? SerializePagination(pagination) : "-"}`;
 
+            const lookupStart = performance.now();
             const redisVal = await RedisCache.getArray(key);
+            const lookupMs = performance.now() - lookupStart;
             if (redisVal) {
+                WriteCacheHeadersToFastifyReply(reply, key, true, lookupMs);
                 return { data: redisVal as T[] };
             }
 
+            const computeStart = performance.now();
             const paginatedData = await this.fetchPaginatedRecords(pagination);
             this.log(`PaginatedRecordsRequestHandler Cache miss: key: ${key}. paginated items length: ${GetDataLengthForPrints(paginatedData)}`);
             await RedisCache.setArray(key, paginatedData, this.getTTL(key));
+            WriteCacheHeadersToFastifyReply(reply, key, false, lookupMs, performance.now() - computeStart);
 
             return { data: paginatedData };
         } catch (error) {
@@ -145,6 +166,26 @@ export class RequestHandlerBase<T> {
         }
     }
 
+    private async keysetRecords(reply: FastifyReply, pagination: Pagination | null, cursor: PaginationCursor | null): Promise<KeysetPage<T>> {
+        const key = `${this.dataKey}|${pagination ? SerializeKeysetPagination(pagination) : "-"}|cursor:${cursor ? EncodeCursor(cursor) : FIRST_PAGE_CURSOR}`;
+
+        const lookupStart = performance.now();
+        const redisVal = await RedisCache.getDict(key);
+        const lookupMs = performance.now() - lookupStart;
+        if (redisVal) {
+            WriteCacheHeadersToFastifyReply(reply, key, true, lookupMs);
+            return redisVal as KeysetPage<T>;
+        }
+
+        const computeStart = performance.now();
+        const page = await this.fetchKeysetRecords(pagination, cursor);
+        this.log(`PaginatedRecordsRequestHandler Cache miss: key: ${key}. keyset items length: ${GetDataLengthForPrints(page.data)}`);
+        await RedisCache.setDict(key, page, this.getTTL(key));
+        WriteCacheHeadersToFastifyReply(reply, key, false, lookupMs, performance.now() - computeStart);
+
+        return page;
+    }
+
     private handleError(source: string, reply: FastifyReply, error: unknown) {
         const err = error as Error;
         WriteErrorToFastifyReply(reply, err.message);
@@ -168,14 +209,19 @@ export class RequestHandlerBase<T> {
             const { from: normalizedFrom, to: normalizedTo } = NormalizeChartFetchDates(from, to);
 
             const key = `${this.dataKey}|${normalizedFrom.toISOString()}|${normalizedTo.toISOString()}`;
+            const lookupStart = performance.now();
             const redisVal = await RedisCache.getArray(key);
+            const lookupMs = performance.now() - lookupStart;
             if (redisVal) {
+                WriteCacheHeadersToFastifyReply(reply, key, true, lookupMs);
                 return { data: redisVal as T[] };
             }
 
+            const computeStart = performance.now();
             const filteredData = await this.fetchDateRangeRecords(normalizedFrom, normalizedTo);
             this.log(`DateRangeRequestHandler (cache miss): ${key}`);
             RedisCache.setArray(key, filteredData, this.getTTL(key));
+            WriteCacheHeadersToFastifyReply(reply, key, false, lookupMs, performance.now() - computeStart);
             return { data: filteredData };
         } catch (error) {
             this.handleError("DateRangeRequestHandler", reply, error);
@@ -186,12 +232,17 @@ export class RequestHandlerBase<T> {
     public async getTotalItemCountPaginatedHandler(request: FastifyRequest, reply: FastifyReply): Promise<FastifyReply> {
         try {
             const key = `${this.dataKey}|itemCount`;
+            const lookupStart = performance.now();
             const itemCountRedis = await RedisCache.get(key);
+            const lookupMs = performance.now() - lookupStart;
             if (itemCountRedis) {
+                WriteCacheHeadersToFastifyReply(reply, key, true, lookupMs);
                 reply.send({ itemCount: parseInt(itemCountRedis) });
             } else {
+                const computeStart = performance.now();
                 const itemCount = await this.fetchRecordCountFromDb();
                 RedisCache.set(key, itemCount.toString(), this.getTTL(key));
+                WriteCacheHeadersToFastifyReply(reply, key, false, lookupMs, performance.now() - computeStart);
                 reply.send({ itemCount: itemCount });
             }
             return reply;
@@ -204,25 +255,30 @@ export class RequestHandlerBase<T> {
     public async CSVRequestHandler(request: FastifyRequest, reply: FastifyReply): Promise<FastifyReply> {
         try {
             const cacheKey = `${this.dataKey}|csvData`;
+            const lookupStart = performance.now();
             const csvRedis = await RedisCache.get(cacheKey);
+            const lookupMs = performance.now() - lookupStart;
             if (csvRedis) {
+                WriteCacheHeadersToFastifyReply(reply, cacheKey, true, lookupMs);
                 reply.header('Content-Type', 'text/csv');
                 reply.header('Content-Disposition', `attachment; filename="${this.getCSVFileNameCached()}"`);
                 reply.send(csvRedis);
             } else {
+                const computeStart = performance.now();
                 const data = await this.fetchAllRecords();
                 if (GetDataLength(data) == 0) {
                     reply.send("Data is unavailable now");
                     return reply;
                 }
 
-                const csv = await this.ConvertRecordsToCsv(data);
+                const csv = await TimeRequestPhase('serialize', () => this.ConvertRecordsToCsv(data));
                 if (csv == null) {
                     reply.send("Data is not available in CSV format");
                     return reply;
                 }
 
                 RedisCache.set(cacheKey, csv);
+                WriteCacheHeadersToFastifyReply(reply, cacheKey, false, lookupMs, performance.now() - computeStart);
                 reply.header('Content-Type', 'text/csv');
                 reply.header('Content-Disposition', `attachment; filename="${this.getCSVFileNameCached()}"`);
                 reply.send(csv);
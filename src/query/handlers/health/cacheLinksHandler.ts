@@ -0,0 +1,99 @@
+// src/query/handlers/health/cacheLinksHandler.ts
+
+// curl http://localhost:8081/cacheLinks?limit=50
+
+// Lists the URLs worth pre-warming: the index/global pages first, then the
+// paths this worker served most often. process_monitor.py --rolling asks the
+// old worker for them and replays them against its replacement before switching.
+
+import { FastifyRequest, FastifyReply, RouteShorthandOptions } from 'fastify';
+
+const CACHE_LINKS_STATIC_URLS = [
+    '/indexLatestBlock',
+    '/index30DayCu',
+    '/indexTotalCu',
+    '/indexStakesHandler',
+    '/indexTopChains',
+    '/indexProvidersActive',
+    '/indexProvidersActiveV2',
+    '/indexChartsV3',
+    '/providers',
+    '/active_providers',
+    '/consumers',
+    '/specs',
+    '/validators',
+    '/events',
+    '/consumerspage',
+    '/autoCompleteLinksV2Handler',
+    '/stakers_and_restakers',
+    '/tvl',
+    '/apr',
+    '/supply/total',
+    '/supply/circulating',
+];
+
+// paths that are cheap or not cacheable, never worth warming
+const CACHE_LINKS_IGNORED_PREFIXES = ['/health', '/islatest', '/latest', '/cacheLinks', '/metrics'];
+
+const CACHE_LINKS_MAX_TRACKED = 10000;
+const CACHE_LINKS_DEFAULT_LIMIT = 200;
+
+export const CACHE_LINKS_WARMUP_HEADER = 'x-jsinfo-warmup';
+
+const hitCounts = new Map<string, number>();
+
+export function RecordCacheLinkHit(request: FastifyRequest, statusCode: number): void {
+    // a 304 is a poll the ETag answered, the URL is still in demand
+    if (request.method !== 'GET' || (statusCode !== 200 && statusCode !== 304)) return;
+    // warm-up requests would otherwise keep themselves on the list forever
+    if (request.headers[CACHE_LINKS_WARMUP_HEADER]) return;
+
+    const url = request.url;
+    if (CACHE_LINKS_IGNORED_PREFIXES.some(prefix => url.startsWith(prefix))) return;
+
+    hitCounts.set(url, (hitCounts.get(url) || 0) + 1);
+
+    if (hitCounts.size > CACHE_LINKS_MAX_TRACKED) {
+        // keep the busier half and halve their counts, so old traffic fades out
+        const sorted = Array.from(hitCounts.entries()).sort(([, a], [, b]) => b - a);
+        hitCounts.clear();
+        for (const [key, count] of sorted.slice(0, CACHE_LINKS_MAX_TRACKED / 2)) {
+            hitCounts.set(key, Math.ceil(count / 2));
+        }
+    }
+}
+
+export const CacheLinksRawHandlerOpts: RouteShorthandOptions = {
+    schema: {
+        querystring: {
+            type: 'object',
+            properties: {
+                limit: { type: 'integer', minimum: 1, maximum: CACHE_LINKS_MAX_TRACKED }
+            }
+        },
+        response: {
+            200: {
+                type: 'object',
+                properties: {
+                    urls: {
+                        type: 'array',
+                        items: { type: 'string' }
+                    }
+                }
+            }
+        }
+    }
+}
+
+export async function CacheLinksRawHandler(request: FastifyRequest, reply: FastifyReply) {
+    const { limit = CACHE_LINKS_DEFAULT_LIMIT } = request.query as { limit?: number };
+
+    const urls = new Set<string>(CACHE_LINKS_STATIC_URLS);
+    const hot = Array.from(hitCounts.entries()).sort(([, a], [, b]) => b - a);
+    for (const [url] of hot) {
+        if (urls.size >= limit) break;
+        urls.add(url);
+    }
+
+    reply.send({ urls: Array.from(urls).slice(0, limit) });
+}
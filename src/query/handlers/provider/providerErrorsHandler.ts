@@ -3,13 +3,13 @@
 
 import * as RelaysSchema from '@jsinfo/schemas/relaysSchema';
 import { FastifyRequest, FastifyReply, RouteShorthandOptions } from 'fastify';
-import { eq, desc, sql, asc } from "drizzle-orm";
-import { Pagination } from '@jsinfo/query/utils/queryPagination';
+import { eq, desc, sql, asc, and, AnyColumn, SQL } from "drizzle-orm";
+import { Pagination, PaginationCursor, KeysetCondition, KeysetOrderBy, NextKeysetCursor } from '@jsinfo/query/utils/queryPagination';
 import { CSVEscape } from '@jsinfo/utils/fmt';
 import { GetAndValidateProviderAddressFromRequest } from '@jsinfo/query/utils/queryRequestArgParser';
 import { JSINFO_QUERY_DEFAULT_ITEMS_PER_PAGE, JSINFO_QUERY_TOTAL_ITEM_LIMIT_FOR_PAGINATION } from '@jsinfo/query/queryConsts';
 import { ParseLavapProviderError } from '@jsinfo/query/utils/lavapProvidersErrorParser';
-import { RequestHandlerBase } from '@jsinfo/query/classes/RequestHandlerBase';
+import { RequestHandlerBase, KeysetPage } from '@jsinfo/query/classes/RequestHandlerBase';
 import { queryRelays } from '@jsinfo/utils/db';
 export interface ErrorsReport {
     id: number;
@@ -50,6 +50,12 @@ export const ProviderErrorsPaginatedHandlerOpts: RouteShorthandOptions = {
     }
 }
 
+// sort keys that can be paged with ?cursor=, and where their value is in a row
+const keysetSortKeys: Record<string, (row: ErrorsReportResponse) => unknown> = {
+    id: row => row.id,
+    date: row => row.date || null,
+};
+
 class ProviderErrorsData extends RequestHandlerBase<ErrorsReportResponse> {
     private addr: string;
 
@@ -101,9 +107,7 @@ class ProviderErrorsData extends RequestHandlerBase<ErrorsReportResponse> {
         return Math.min(countResult[0].count || 0, JSINFO_QUERY_TOTAL_ITEM_LIMIT_FOR_PAGINATION - 1);
     }
 
-    public async fetchPaginatedRecords(pagination: Pagination | null): Promise<ErrorsReportResponse[]> {
-
-
+    private getSortColumn(pagination: Pagination | null): { finalPagination: Pagination, sortColumn: AnyColumn } {
         const defaultSortKey = "id";
 
         if (!pagination) {
@@ -123,8 +127,10 @@ class ProviderErrorsData extends RequestHandlerBase<ErrorsReportResponse> {
         };
 
         const sortColumn = keyToColumnMap[pagination.sortKey || defaultSortKey] || keyToColumnMap[defaultSortKey];
-        const orderFunction = pagination.direction === 'ascending' ? asc : desc;
+        return { finalPagination: pagination, sortColumn };
+    }
 
+    private async queryErrors(keyset: SQL | undefined, orderBy: SQL[], offset: number, limit: number): Promise<ErrorsReportResponse[]> {
         const result = await queryRelays(
             async (db) => await db.select({
                 id: RelaysSchema.lavaReportError.id,
@@ -133,10 +139,10 @@ class ProviderErrorsData extends RequestHandlerBase<ErrorsReportResponse> {
                 errors: RelaysSchema.lavaReportError.errors
             })
                 .from(RelaysSchema.lavaReportError)
-                .where(eq(RelaysSchema.lavaReportError.provider, this.addr))
-                .orderBy(orderFunction(sortColumn))
-                .offset((pagination.page - 1) * pagination.count)
-                .limit(pagination.count),
+                .where(and(eq(RelaysSchema.lavaReportError.provider, this.addr), keyset))
+                .orderBy(...orderBy)
+                .offset(offset)
+                .limit(limit),
             "ProviderErrorsData"
         );
 
@@ -148,6 +154,36 @@ class ProviderErrorsData extends RequestHandlerBase<ErrorsReportResponse> {
         }));
     }
 
+    public async fetchPaginatedRecords(pagination: Pagination | null): Promise<ErrorsReportResponse[]> {
+        const { finalPagination, sortColumn } = this.getSortColumn(pagination);
+        const orderFunction = finalPagination.direction === 'ascending' ? asc : desc;
+
+        return await this.queryErrors(
+            undefined,
+            [orderFunction(sortColumn)],
+            (finalPagination.page - 1) * finalPagination.count,
+            finalPagination.count
+        );
+    }
+
+    protected async fetchKeysetRecords(pagination: Pagination | null, cursor: PaginationCursor | null): Promise<KeysetPage<ErrorsReportResponse>> {
+        const { finalPagination, sortColumn } = this.getSortColumn(pagination);
+        const getSortValue = keysetSortKeys[finalPagination.sortKey || "id"];
+        if (!getSortValue) {
+            throw new Error(`Cursor pagination is not supported for sort key: ${finalPagination.sortKey}`);
+        }
+
+        const idColumn = RelaysSchema.lavaReportError.id;
+        const data = await this.queryErrors(
+            KeysetCondition(sortColumn, idColumn, finalPagination.direction, cursor),
+            KeysetOrderBy(sortColumn, idColumn, finalPagination.direction),
+            0,
+            finalPagination.count
+        );
+
+        return { data, nextCursor: NextKeysetCursor(data, finalPagination.count, getSortValue, row => row.id) };
+    }
+
 
     public async ConvertRecordsToCsv(data: ErrorsReportResponse[]): Promise<string> {
         let csv = 'date,chain,error\n';
@@ -3,12 +3,12 @@
 import { FastifyRequest, FastifyReply, RouteShorthandOptions } from 'fastify';
 
 import * as JsinfoSchema from '@jsinfo/schemas/jsinfoSchema/jsinfoSchema';
-import { asc, desc, eq, sql, and, gte } from "drizzle-orm";
-import { Pagination, ParsePaginationFromString } from '@jsinfo/query/utils/queryPagination';
+import { asc, desc, eq, sql, and, gte, AnyColumn, SQL } from "drizzle-orm";
+import { Pagination, PaginationCursor, ParsePaginationFromString, KeysetCondition, KeysetOrderBy, NextKeysetCursor, EncodeCursor } from '@jsinfo/query/utils/queryPagination';
 import { JSINFO_QUERY_DEFAULT_ITEMS_PER_PAGE, JSINFO_QUERY_TOTAL_ITEM_LIMIT_FOR_PAGINATION } from '@jsinfo/query/queryConsts';
 import { CSVEscape } from '@jsinfo/utils/fmt';
 import { GetAndValidateProviderAddressFromRequest } from '@jsinfo/query/utils/queryRequestArgParser';
-import { RequestHandlerBase } from '@jsinfo/query/classes/RequestHandlerBase';
+import { RequestHandlerBase, KeysetPage } from '@jsinfo/query/classes/RequestHandlerBase';
 import { queryJsinfo } from '@jsinfo/utils/db';
 
 export type ProviderEventsResponse = {
@@ -94,6 +94,18 @@ function getDateThirtyDaysAgo(): Date {
     return date;
 }
 
+// sort keys that can be paged with ?cursor=, and where their value is in a row
+const keysetSortKeys: Record<string, (row: ProviderEventsResponse) => unknown> = {
+    "events.id": row => row.events.id,
+    "blocks.height": row => row.events.blockId,
+    "blocks.datetime": row => row.blocks?.datetime,
+};
+
+// keyToColumnMap sorts blocks.datetime by id, cursors sort by the timestamp itself
+const keysetColumns: Record<string, AnyColumn> = {
+    "blocks.datetime": JsinfoSchema.events.timestamp,
+};
+
 class ProviderEventsData extends RequestHandlerBase<ProviderEventsResponse> {
     private addr: string;
 
@@ -178,7 +190,7 @@ class ProviderEventsData extends RequestHandlerBase<ProviderEventsResponse> {
         return Math.min(countResult[0].count || 0, JSINFO_QUERY_TOTAL_ITEM_LIMIT_FOR_PAGINATION - 1);
     }
 
-    public async fetchPaginatedRecords(pagination: Pagination | null): Promise<ProviderEventsResponse[]> {
+    private getSortColumn(pagination: Pagination | null): { finalPagination: Pagination, sortColumn: AnyColumn } {
         const defaultSortKey = "events.id";
         let finalPagination: Pagination;
 
@@ -216,9 +228,10 @@ class ProviderEventsData extends RequestHandlerBase<ProviderEventsResponse> {
             throw new Error(`Invalid sort key: ${trimmedSortKey}`);
         }
 
-        const sortColumn = keyToColumnMap[finalPagination.sortKey];
-        const orderFunction = finalPagination.direction === 'ascending' ? asc : desc;
+        return { finalPagination, sortColumn: keyToColumnMap[finalPagination.sortKey] };
+    }
 
+    private async queryEvents(keyset: SQL | undefined, orderBy: SQL[], offset: number, limit: number, queryName: string): Promise<ProviderEventsResponse[]> {
         const thirtyDaysAgo = getDateThirtyDaysAgo();
 
         const eventsRes: ProviderEventsResponse[] = await queryJsinfo(db => db
@@ -251,12 +264,13 @@ class ProviderEventsData extends RequestHandlerBase<ProviderEventsResponse> {
             .from(JsinfoSchema.events)
             .where(and(
                 eq(JsinfoSchema.events.provider, this.addr),
-                gte(JsinfoSchema.events.timestamp, thirtyDaysAgo)
+                gte(JsinfoSchema.events.timestamp, thirtyDaysAgo),
+                keyset
             ))
-            .orderBy(orderFunction(sortColumn))
-            .offset((finalPagination.page - 1) * finalPagination.count)
-            .limit(finalPagination.count),
-            `ProviderEventsData::fetchPaginatedRecords_${finalPagination.sortKey}_${finalPagination.direction}_${finalPagination.page}_${finalPagination.count}_${thirtyDaysAgo}`
+            .orderBy(...orderBy)
+            .offset(offset)
+            .limit(limit),
+            `ProviderEventsData::${queryName}_${thirtyDaysAgo}`
         );
 
         eventsRes.forEach((event) => {
@@ -268,6 +282,39 @@ class ProviderEventsData extends RequestHandlerBase<ProviderEventsResponse> {
         return eventsRes;
     }
 
+    public async fetchPaginatedRecords(pagination: Pagination | null): Promise<ProviderEventsResponse[]> {
+        const { finalPagination, sortColumn } = this.getSortColumn(pagination);
+        const orderFunction = finalPagination.direction === 'ascending' ? asc : desc;
+
+        return await this.queryEvents(
+            undefined,
+            [orderFunction(sortColumn)],
+            (finalPagination.page - 1) * finalPagination.count,
+            finalPagination.count,
+            `fetchPaginatedRecords_${finalPagination.sortKey}_${finalPagination.direction}_${finalPagination.page}_${finalPagination.count}`
+        );
+    }
+
+    protected async fetchKeysetRecords(pagination: Pagination | null, cursor: PaginationCursor | null): Promise<KeysetPage<ProviderEventsResponse>> {
+        const { finalPagination, sortColumn: offsetSortColumn } = this.getSortColumn(pagination);
+        const getSortValue = keysetSortKeys[finalPagination.sortKey!];
+        if (!getSortValue) {
+            throw new Error(`Cursor pagination is not supported for sort key: ${finalPagination.sortKey}`);
+        }
+        const sortColumn = keysetColumns[finalPagination.sortKey!] ?? offsetSortColumn;
+
+        const idColumn = JsinfoSchema.events.id;
+        const data = await this.queryEvents(
+            KeysetCondition(sortColumn, idColumn, finalPagination.direction, cursor),
+            KeysetOrderBy(sortColumn, idColumn, finalPagination.direction),
+            0,
+            finalPagination.count,
+            `fetchKeysetRecords_${finalPagination.sortKey}_${finalPagination.direction}_${finalPagination.count}_${cursor ? EncodeCursor(cursor) : "-"}`
+        );
+
+        return { data, nextCursor: NextKeysetCursor(data, finalPagination.count, getSortValue, row => row.events.id) };
+    }
+
     public async ConvertRecordsToCsv(data: ProviderEventsResponse[]): Promise<string> {
         const columns = [
             { key: "events.eventType", name: "Event Type" },
@@ -3,12 +3,12 @@
 import { FastifyRequest, FastifyReply, RouteShorthandOptions } from 'fastify';
 
 import * as JsinfoSchema from '@jsinfo/schemas/jsinfoSchema/jsinfoSchema';
-import { eq, desc, asc, sql, gte, and } from "drizzle-orm";
-import { Pagination, ParsePaginationFromString } from '@jsinfo/query/utils/queryPagination';
+import { eq, desc, asc, sql, gte, and, AnyColumn, SQL } from "drizzle-orm";
+import { Pagination, PaginationCursor, ParsePaginationFromString, KeysetCondition, KeysetOrderBy, NextKeysetCursor, EncodeCursor } from '@jsinfo/query/utils/queryPagination';
 import { CSVEscape } from '@jsinfo/utils/fmt';
 import { GetAndValidateProviderAddressFromRequest } from '@jsinfo/query/utils/queryRequestArgParser';
 import { JSINFO_QUERY_DEFAULT_ITEMS_PER_PAGE, JSINFO_QUERY_TOTAL_ITEM_LIMIT_FOR_PAGINATION } from '@jsinfo/query/queryConsts';
-import { RequestHandlerBase } from '@jsinfo/query/classes/RequestHandlerBase';
+import { RequestHandlerBase, KeysetPage } from '@jsinfo/query/classes/RequestHandlerBase';
 import { ParseDateToUtc } from '@jsinfo/utils/date';
 import { logger } from '@jsinfo/utils/logger';
 import { queryJsinfo } from '@jsinfo/utils/db';
@@ -56,6 +56,12 @@ export const ProviderHealthPaginatedHandlerOpts: RouteShorthandOptions = {
     }
 }
 
+// sort keys that can be paged with ?cursor=, and where their value is in a row
+const keysetSortKeys: Record<string, (row: HealthReportEntry) => unknown> = {
+    id: row => row.id,
+    timestamp: row => row.timestamp,
+};
+
 class ProviderHealthData extends RequestHandlerBase<HealthReportEntry> {
     private addr: string;
 
@@ -135,10 +141,7 @@ class ProviderHealthData extends RequestHandlerBase<HealthReportEntry> {
         return Math.min(countResult[0].count || 0, JSINFO_QUERY_TOTAL_ITEM_LIMIT_FOR_PAGINATION - 1);
     }
 
-    public async fetchPaginatedRecords(pagination: Pagination | null): Promise<HealthReportEntry[]> {
-        const oneMonthAgo = new Date();
-        oneMonthAgo.setMonth(oneMonthAgo.getMonth() - 1); // Calculate the date one month ago
-
+    private getSortColumn(pagination: Pagination | null): { finalPagination: Pagination, sortColumn: AnyColumn } {
         const defaultSortKey = "id";
         let finalPagination: Pagination;
 
@@ -170,12 +173,12 @@ class ProviderHealthData extends RequestHandlerBase<HealthReportEntry> {
             throw new Error(`Invalid sort key: ${trimmedSortKey}`);
         }
 
-        ;
-
-        const sortColumn = keyToColumnMap[finalPagination.sortKey];
-        const orderFunction = finalPagination.direction === 'ascending' ? asc : desc;
+        return { finalPagination, sortColumn: keyToColumnMap[finalPagination.sortKey] };
+    }
 
-        const offset = (finalPagination.page - 1) * finalPagination.count;
+    private async queryHealth(keyset: SQL | undefined, orderBy: SQL[], offset: number, limit: number, queryName: string): Promise<HealthReportEntry[]> {
+        const oneMonthAgo = new Date();
+        oneMonthAgo.setMonth(oneMonthAgo.getMonth() - 1); // Calculate the date one month ago
 
         const additionalData = await queryJsinfo(db => db
             .select()
@@ -183,13 +186,14 @@ class ProviderHealthData extends RequestHandlerBase<HealthReportEntry> {
             .where(
                 and(
                     eq(JsinfoSchema.providerHealth.provider, this.addr),
-                    gte(JsinfoSchema.providerHealth.timestamp, oneMonthAgo)
+                    gte(JsinfoSchema.providerHealth.timestamp, oneMonthAgo),
+                    keyset
                 )
             )
-            .orderBy(orderFunction(sortColumn))
+            .orderBy(...orderBy)
             .offset(offset)
-            .limit(finalPagination.count),
-            `ProviderHealthData::fetchPaginatedRecords_${finalPagination.sortKey}_${finalPagination.direction}_${finalPagination.page}_${finalPagination.count}`
+            .limit(limit),
+            `ProviderHealthData::${queryName}`
         );
 
         const healthReportEntries: HealthReportEntry[] = additionalData.map(item => ({
@@ -209,6 +213,38 @@ class ProviderHealthData extends RequestHandlerBase<HealthReportEntry> {
         return healthReportEntries;
     }
 
+    public async fetchPaginatedRecords(pagination: Pagination | null): Promise<HealthReportEntry[]> {
+        const { finalPagination, sortColumn } = this.getSortColumn(pagination);
+        const orderFunction = finalPagination.direction === 'ascending' ? asc : desc;
+
+        return await this.queryHealth(
+            undefined,
+            [orderFunction(sortColumn)],
+            (finalPagination.page - 1) * finalPagination.count,
+            finalPagination.count,
+            `fetchPaginatedRecords_${finalPagination.sortKey}_${finalPagination.direction}_${finalPagination.page}_${finalPagination.count}`
+        );
+    }
+
+    protected async fetchKeysetRecords(pagination: Pagination | null, cursor: PaginationCursor | null): Promise<KeysetPage<HealthReportEntry>> {
+        const { finalPagination, sortColumn } = this.getSortColumn(pagination);
+        const getSortValue = keysetSortKeys[finalPagination.sortKey!];
+        if (!getSortValue) {
+            throw new Error(`Cursor pagination is not supported for sort key: ${finalPagination.sortKey}`);
+        }
+
+        const idColumn = JsinfoSchema.providerHealth.id;
+        const data = await this.queryHealth(
+            KeysetCondition(sortColumn, idColumn, finalPagination.direction, cursor),
+            KeysetOrderBy(sortColumn, idColumn, finalPagination.direction),
+            0,
+            finalPagination.count,
+            `fetchKeysetRecords_${finalPagination.sortKey}_${finalPagination.direction}_${finalPagination.count}_${cursor ? EncodeCursor(cursor) : "-"}`
+        );
+
+        return { data, nextCursor: NextKeysetCursor(data, finalPagination.count, getSortValue, row => row.id) };
+    }
+
     public async ConvertRecordsToCsv(data: HealthReportEntry[]): Promise<string> {
         let csv = 'time,chain,interface,status,region,message\n';
         data.forEach((item: HealthReportEntry) => {
@@ -4,12 +4,12 @@
 import { FastifyRequest, FastifyReply, RouteShorthandOptions } from 'fastify';
 
 import * as JsinfoSchema from '@jsinfo/schemas/jsinfoSchema/jsinfoSchema';
-import { asc, desc, eq, gte, sql, and } from "drizzle-orm";
-import { Pagination, ParsePaginationFromString } from '../../utils/queryPagination';
+import { asc, desc, eq, gte, sql, and, AnyColumn, SQL } from "drizzle-orm";
+import { Pagination, PaginationCursor, ParsePaginationFromString, KeysetCondition, KeysetOrderBy, NextKeysetCursor, EncodeCursor } from '../../utils/queryPagination';
 import { JSINFO_QUERY_DEFAULT_ITEMS_PER_PAGE, JSINFO_QUERY_TOTAL_ITEM_LIMIT_FOR_PAGINATION } from '@jsinfo/query/queryConsts';
 import { CSVEscape } from '@jsinfo/utils/fmt';
 import { GetAndValidateProviderAddressFromRequest } from '@jsinfo/query/utils/queryRequestArgParser';
-import { RequestHandlerBase } from '@jsinfo/query/classes/RequestHandlerBase';
+import { RequestHandlerBase, KeysetPage } from '@jsinfo/query/classes/RequestHandlerBase';
 import { queryJsinfo } from '@jsinfo/utils/db';
 
 export type ProviderReportsResponse = {
@@ -103,6 +103,13 @@ export const ProviderReportsPaginatedHandlerOpts: RouteShorthandOptions = {
     }
 };
 
+// sort keys that can be paged with ?cursor=, and where their value is in a query row
+const keysetSortKeys: Record<string, (row: { providerReported: { id: number, blockId: number | null, datetime: Date | null } }) => unknown> = {
+    "provider_reported.id": row => row.providerReported.id,
+    "provider_reported.blockId": row => row.providerReported.blockId,
+    "blocks.datetime": row => row.providerReported.datetime,
+};
+
 class ProviderReportsData extends RequestHandlerBase<ProviderReportsResponse> {
     private addr: string;
 
@@ -179,7 +186,7 @@ class ProviderReportsData extends RequestHandlerBase<ProviderReportsResponse> {
         return Math.min(countResult[0].count || 0, JSINFO_QUERY_TOTAL_ITEM_LIMIT_FOR_PAGINATION - 1);
     }
 
-    public async fetchPaginatedRecords(pagination: Pagination | null): Promise<ProviderReportsResponse[]> {
+    private getSortColumn(pagination: Pagination | null): { finalPagination: Pagination, sortColumn: AnyColumn } {
         const defaultSortKey = "provider_reported.id";
         let finalPagination: Pagination;
 
@@ -211,12 +218,13 @@ class ProviderReportsData extends RequestHandlerBase<ProviderReportsResponse> {
             throw new Error(`Invalid sort key: ${trimmedSortKey}`);
         }
 
-        const sortColumn = keyToColumnMap[finalPagination.sortKey];
-        const orderFunction = finalPagination.direction === 'ascending' ? asc : desc;
+        return { finalPagination, sortColumn: keyToColumnMap[finalPagination.sortKey] };
+    }
 
+    private async queryReports(keyset: SQL | undefined, orderBy: SQL[], offset: number, limit: number, queryName: string) {
         const thirtyDaysAgo = this.getThirtyDaysAgo();
 
-        const reportsRes = await queryJsinfo(db => db
+        return await queryJsinfo(db => db
             .select({
                 providerReported: {
                     id: JsinfoSchema.providerReported.id,
@@ -241,15 +249,18 @@ class ProviderReportsData extends RequestHandlerBase<ProviderReportsResponse> {
             .where(
                 and(
                     eq(JsinfoSchema.providerReported.provider, this.addr),
-                    gte(JsinfoSchema.providerReported.datetime, thirtyDaysAgo)
+                    gte(JsinfoSchema.providerReported.datetime, thirtyDaysAgo),
+                    keyset
                 )
             )
-            .orderBy(orderFunction(sortColumn))
-            .offset((finalPagination.page - 1) * finalPagination.count)
-            .limit(finalPagination.count),
-            `ProviderReportsData::fetchPaginatedRecords_${finalPagination.sortKey}_${finalPagination.direction}_${finalPagination.page}_${finalPagination.count}_${thirtyDaysAgo}_${this.addr}`
+            .orderBy(...orderBy)
+            .offset(offset)
+            .limit(limit),
+            `ProviderReportsData::${queryName}_${thirtyDaysAgo}_${this.addr}`
         );
+    }
 
+    private mapReportsRows(reportsRes: Awaited<ReturnType<ProviderReportsData['queryReports']>>): ProviderReportsResponse[] {
         return reportsRes.map(row => ({
             provider_reported: {
                 provider: row.providerReported.provider,
@@ -271,6 +282,44 @@ class ProviderReportsData extends RequestHandlerBase<ProviderReportsResponse> {
         }));
     }
 
+    public async fetchPaginatedRecords(pagination: Pagination | null): Promise<ProviderReportsResponse[]> {
+        const { finalPagination, sortColumn } = this.getSortColumn(pagination);
+        const orderFunction = finalPagination.direction === 'ascending' ? asc : desc;
+
+        const reportsRes = await this.queryReports(
+            undefined,
+            [orderFunction(sortColumn)],
+            (finalPagination.page - 1) * finalPagination.count,
+            finalPagination.count,
+            `fetchPaginatedRecords_${finalPagination.sortKey}_${finalPagination.direction}_${finalPagination.page}_${finalPagination.count}`
+        );
+
+        return this.mapReportsRows(reportsRes);
+    }
+
+    protected async fetchKeysetRecords(pagination: Pagination | null, cursor: PaginationCursor | null): Promise<KeysetPage<ProviderReportsResponse>> {
+        const { finalPagination, sortColumn } = this.getSortColumn(pagination);
+        const getSortValue = keysetSortKeys[finalPagination.sortKey!];
+        if (!getSortValue) {
+            throw new Error(`Cursor pagination is not supported for sort key: ${finalPagination.sortKey}`);
+        }
+
+        const idColumn = JsinfoSchema.providerReported.id;
+        const reportsRes = await this.queryReports(
+            KeysetCondition(sortColumn, idColumn, finalPagination.direction, cursor),
+            KeysetOrderBy(sortColumn, idColumn, finalPagination.direction),
+            0,
+            finalPagination.count,
+            `fetchKeysetRecords_${finalPagination.sortKey}_${finalPagination.direction}_${finalPagination.count}_${cursor ? EncodeCursor(cursor) : "-"}`
+        );
+
+        // the response rows have no id, the cursor is taken from the query rows
+        return {
+            data: this.mapReportsRows(reportsRes),
+            nextCursor: NextKeysetCursor(reportsRes, finalPagination.count, getSortValue, row => row.providerReported.id)
+        };
+    }
+
     public async ConvertRecordsToCsv(data: ProviderReportsResponse[]): Promise<string> {
         const columns = [
             { key: "provider_reported.blockId", name: "Block" },
@@ -4,12 +4,12 @@
 import { FastifyRequest, FastifyReply, RouteShorthandOptions } from 'fastify';
 
 import * as JsinfoSchema from '@jsinfo/schemas/jsinfoSchema/jsinfoSchema';
-import { asc, desc, eq, gte, sql, and } from "drizzle-orm";
-import { Pagination, ParsePaginationFromString } from '../../utils/queryPagination';
+import { asc, desc, eq, gte, sql, and, AnyColumn, SQL } from "drizzle-orm";
+import { Pagination, PaginationCursor, ParsePaginationFromString, KeysetCondition, KeysetOrderBy, NextKeysetCursor, EncodeCursor } from '../../utils/queryPagination';
 import { JSINFO_QUERY_DEFAULT_ITEMS_PER_PAGE, JSINFO_QUERY_TOTAL_ITEM_LIMIT_FOR_PAGINATION } from '@jsinfo/query/queryConsts';
 import { CSVEscape } from '@jsinfo/utils/fmt';
 import { GetAndValidateProviderAddressFromRequest } from '@jsinfo/query/utils/queryRequestArgParser';
-import { RequestHandlerBase } from '@jsinfo/query/classes/RequestHandlerBase';
+import { RequestHandlerBase, KeysetPage } from '@jsinfo/query/classes/RequestHandlerBase';
 import { queryJsinfo } from '@jsinfo/utils/db';
 
 export type ProviderRewardsResponse = {
@@ -120,6 +120,12 @@ export const ProviderRewardsPaginatedHandlerOpts: RouteShorthandOptions = {
     }
 };
 
+// sort keys that can be paged with ?cursor=, and where their value is in a row
+const keysetSortKeys: Record<string, (row: ProviderRewardsResponse) => unknown> = {
+    "relay_payments.id": row => row.relay_payments.id,
+    "relay_payments.blockId": row => row.relay_payments.blockId,
+    "blocks.datetime": row => row.relay_payments.datetime,
+};
 
 class ProviderRewardsData extends RequestHandlerBase<ProviderRewardsResponse> {
     private addr: string;
@@ -198,7 +204,7 @@ class ProviderRewardsData extends RequestHandlerBase<ProviderRewardsResponse> {
         return Math.min(countResult[0].count || 0, JSINFO_QUERY_TOTAL_ITEM_LIMIT_FOR_PAGINATION - 1);
     }
 
-    public async fetchPaginatedRecords(pagination: Pagination | null): Promise<ProviderRewardsResponse[]> {
+    private getSortColumn(pagination: Pagination | null): { finalPagination: Pagination, sortColumn: AnyColumn } {
         const defaultSortKey = "relay_payments.id";
         let finalPagination: Pagination;
 
@@ -231,11 +237,10 @@ class ProviderRewardsData extends RequestHandlerBase<ProviderRewardsResponse> {
             throw new Error(`Invalid sort key: ${trimmedSortKey}`);
         }
 
-        ;
-
-        const sortColumn = keyToColumnMap[finalPagination.sortKey];
-        const orderFunction = finalPagination.direction === 'ascending' ? asc : desc;
+        return { finalPagination, sortColumn: keyToColumnMap[finalPagination.sortKey] };
+    }
 
+    private async queryPayments(keyset: SQL | undefined, orderBy: SQL[], offset: number, limit: number, queryName: string): Promise<ProviderRewardsResponse[]> {
         const thirtyDaysAgo = this.getThirtyDaysAgo();
 
         const paymentsRes: ProviderRewardsResponse[] = await queryJsinfo<ProviderRewardsResponse[]>(
@@ -250,13 +255,14 @@ class ProviderRewardsData extends RequestHandlerBase<ProviderRewardsResponse> {
                 .where(
                     and(
                         eq(JsinfoSchema.relayPayments.provider, this.addr),
-                        gte(JsinfoSchema.relayPayments.datetime, thirtyDaysAgo)
+                        gte(JsinfoSchema.relayPayments.datetime, thirtyDaysAgo),
+                        keyset
                     )
                 )
-                .orderBy(orderFunction(sortColumn))
-                .offset((finalPagination.page - 1) * finalPagination.count)
-                .limit(finalPagination.count),
-            `ProviderRewards_fetchPaginatedRecords_${finalPagination.sortKey}_${finalPagination.direction}_${finalPagination.page}_${finalPagination.count}_${thirtyDaysAgo}_${this.addr}`
+                .orderBy(...orderBy)
+                .offset(offset)
+                .limit(limit),
+            `${queryName}_${thirtyDaysAgo}_${this.addr}`
         );
 
         paymentsRes.forEach((payment) => {
@@ -266,6 +272,38 @@ class ProviderRewardsData extends RequestHandlerBase<ProviderRewardsResponse> {
         return paymentsRes;
     }
 
+    public async fetchPaginatedRecords(pagination: Pagination | null): Promise<ProviderRewardsResponse[]> {
+        const { finalPagination, sortColumn } = this.getSortColumn(pagination);
+        const orderFunction = finalPagination.direction === 'ascending' ? asc : desc;
+
+        return await this.queryPayments(
+            undefined,
+            [orderFunction(sortColumn)],
+            (finalPagination.page - 1) * finalPagination.count,
+            finalPagination.count,
+            `ProviderRewards_fetchPaginatedRecords_${finalPagination.sortKey}_${finalPagination.direction}_${finalPagination.page}_${finalPagination.count}`
+        );
+    }
+
+    protected async fetchKeysetRecords(pagination: Pagination | null, cursor: PaginationCursor | null): Promise<KeysetPage<ProviderRewardsResponse>> {
+        const { finalPagination, sortColumn } = this.getSortColumn(pagination);
+        const getSortValue = keysetSortKeys[finalPagination.sortKey!];
+        if (!getSortValue) {
+            throw new Error(`Cursor pagination is not supported for sort key: ${finalPagination.sortKey}`);
+        }
+
+        const idColumn = JsinfoSchema.relayPayments.id;
+        const data = await this.queryPayments(
+            KeysetCondition(sortColumn, idColumn, finalPagination.direction, cursor),
+            KeysetOrderBy(sortColumn, idColumn, finalPagination.direction),
+            0,
+            finalPagination.count,
+            `ProviderRewards_fetchKeysetRecords_${finalPagination.sortKey}_${finalPagination.direction}_${finalPagination.count}_${cursor ? EncodeCursor(cursor) : "-"}`
+        );
+
+        return { data, nextCursor: NextKeysetCursor(data, finalPagination.count, getSortValue, row => row.relay_payments.id) };
+    }
+
     public async ConvertRecordsToCsv(data: ProviderRewardsResponse[]): Promise<string> {
         const columns = [
             { key: "relay_payments.specId", name: "Spec" },
@@ -12,6 +12,14 @@ if (!JSINFO_QUERY_PORT_STRING) {
 
 export const JSINFO_QUERY_PORT = parseInt(JSINFO_QUERY_PORT_STRING);
 export const JSINFO_QUERY_HOST = GetEnvVar('JSINFO_QUERY_HOST', '0.0.0.0');
+// lets several query workers (process_monitor.py --config) listen on the same port, the kernel spreads connections between them
+export const JSINFO_QUERY_REUSE_PORT: boolean = GetEnvVar("JSINFO_QUERY_REUSE_PORT", "false").toLowerCase() === "true";
+// loopback port that reaches only this worker, process_monitor.py --rolling probes and warms a replacement through it
+export const JSINFO_QUERY_DIRECT_PORT: number = parseInt(GetEnvVar("JSINFO_QUERY_DIRECT_PORT", "0"));
+// how long a SIGTERM'd worker waits for in-flight requests before exiting anyway
+export const JSINFO_QUERY_SHUTDOWN_TIMEOUT_MS: number = parseInt(GetEnvVar("JSINFO_QUERY_SHUTDOWN_TIMEOUT_MS", "30000"));
+// larger 200 GET bodies go out without an ETag instead of being hashed on the event loop
+export const JSINFO_QUERY_ETAG_MAX_BODY_BYTES: number = parseInt(GetEnvVar("JSINFO_QUERY_ETAG_MAX_BODY_BYTES", "262144"));
 
 export const JSINFO_QUERY_HIGH_POST_BODY_LIMIT = false;
 
@@ -22,6 +30,9 @@ export const JSINFO_QUERY_TOTAL_ITEM_LIMIT_FOR_PAGINATION = parseInt(GetEnvVar("
 
 export const JSINFO_QUERY_NETWORK = GetEnvVar("JSINFO_QUERY_NETWORK", "local");
 
+// adds the redis key to the X-Jsinfo-Cache headers, tests/query_endpoints/cache_bench.py deletes it to time a cold request
+export const JSINFO_QUERY_CACHE_DEBUG_HEADERS: boolean = GetEnvVar("JSINFO_QUERY_CACHE_DEBUG_HEADERS", "false").toLowerCase() === "true";
+
 export const JSINFO_REQUEST_HANDLER_BASE_DEBUG = GetEnvVar("JSINFO_REQUEST_HANDLER_BASE_DEBUG", "true").toLowerCase() === "true";
 
 const numberQueryConsts = [
@@ -29,6 +40,9 @@ const numberQueryConsts = [
     'JSINFO_QUERY_DEFAULT_ITEMS_PER_PAGE',
     'JSINFO_QUERY_ALLOWED_ITEMS_PER_PAGE',
     'JSINFO_QUERY_TOTAL_ITEM_LIMIT_FOR_PAGINATION',
+    'JSINFO_QUERY_DIRECT_PORT',
+    'JSINFO_QUERY_SHUTDOWN_TIMEOUT_MS',
+    'JSINFO_QUERY_ETAG_MAX_BODY_BYTES',
 ];
 
 numberQueryConsts.forEach(key => {
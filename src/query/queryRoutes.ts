@@ -12,6 +12,7 @@ import { LatestRawHandler, LatestRawHandlerOpts } from './handlers/health/latest
 import { IsLatestRawHandler, IsLatestRawHandlerOpts } from './handlers/health/isLatestHandler';
 import { HealthRawHandler, HealthRawHandlerOpts } from './handlers/health/healthHandler';
 import { HealthStatusRawHandler, HealthStatusRawHandlerOpts } from './handlers/health/healthStatusHandler';
+import { CacheLinksRawHandler, CacheLinksRawHandlerOpts } from './handlers/health/cacheLinksHandler';
 
 // Supply
 import { SupplyRawHandlerOpts, TotalSupplyRawHandler, CirculatingSupplyRawHandler } from './handlers/ajax/supplyHandler';
@@ -123,6 +124,7 @@ GetServerInstance().get('/health', HealthRawHandlerOpts, HealthRawHandler);
 GetServerInstance().get('/healths', HealthRawHandlerOpts, HealthRawHandler);
 GetServerInstance().get('/healthz', HealthRawHandlerOpts, HealthRawHandler);
 GetServerInstance().get('/healthstatus', HealthStatusRawHandlerOpts, HealthStatusRawHandler);
+GetServerInstance().get('/cacheLinks', CacheLinksRawHandlerOpts, CacheLinksRawHandler);
 
 // -----------------------------------------------------------------------------
 // Supply Routes
@@ -18,14 +18,16 @@ import fastifyCors from '@fastify/cors';
 import pino from 'pino';
 
 // Local utilities and constants
-import { JSINFO_QUERY_HIGH_POST_BODY_LIMIT, JSINFO_QUERY_FASITY_PRINT_LOGS } from './queryConsts';
-import { AddErrorResponseToFastifyServerOpts, ItemCountOpts, WriteErrorToFastifyReply } from './utils/queryServerUtils';
+import { JSINFO_QUERY_HIGH_POST_BODY_LIMIT, JSINFO_QUERY_FASITY_PRINT_LOGS, JSINFO_QUERY_ETAG_MAX_BODY_BYTES } from './queryConsts';
+import { AddErrorResponseToFastifyServerOpts, AddCursorResponseToFastifyServerOpts, ItemCountOpts, WriteErrorToFastifyReply, WriteCacheHeadersToFastifyReply, ComputeEtag, IfNoneMatchMatches } from './utils/queryServerUtils';
 import { validatePaginationString } from './utils/queryPagination';
 import { JSONStringify } from '@jsinfo/utils/fmt';
 import { logger } from '@jsinfo/utils/logger';
+import { RunWithRequestTiming, GetRequestTiming, TimeRequestPhaseSync, FormatServerTiming } from '@jsinfo/utils/requestTiming';
 
 // Local classes
 import { RedisCache } from '@jsinfo/redis/classes/RedisCache';
+import { RecordCacheLinkHit } from './handlers/health/cacheLinksHandler';
 
 const FastifyLogger: FastifyBaseLogger = pino({
     level: 'warn',
@@ -44,6 +46,63 @@ const server: FastifyInstance = Fastify({
 
 server.register(fastifyCors, { origin: "*" });
 
+// Server-Timing on every response: db, redis, serialize and total ms, see
+// src/utils/requestTiming.ts. The timing follows the request through the
+// handler's awaits, so queryJsinfo and RedisCache add to it from anywhere.
+server.addHook('onRequest', (request, reply, done) => {
+    RunWithRequestTiming(done);
+});
+
+server.addHook('preSerialization', async (request, reply, payload) => {
+    const timing = GetRequestTiming();
+    if (timing) timing.serializeStart = performance.now();
+    return payload;
+});
+
+server.addHook('onSend', async (request, reply, payload) => {
+    const timing = GetRequestTiming();
+    if (!timing) return payload;
+    if (timing.serializeStart !== null) {
+        timing.add('serialize', performance.now() - timing.serializeStart);
+        timing.serializeStart = null;
+    }
+    reply.header('Server-Timing', FormatServerTiming(timing));
+    // lets the dashboards' devtools show it cross origin, as the cors origin above does for the body
+    reply.header('Timing-Allow-Origin', '*');
+    return payload;
+});
+
+// ETag on 200 GET responses, hashed from the body as it goes out, so
+// RequestHandlerBase's cached pages and the raw handlers all get it; a client
+// that already has that body gets an empty 304 instead. CSV exports and bodies
+// over JSINFO_QUERY_ETAG_MAX_BODY_BYTES are downloads, not polled, and are not
+// worth hashing on every request.
+server.addHook('onSend', async (request, reply, payload) => {
+    if (request.method !== 'GET' || reply.statusCode !== 200) return payload;
+    if (typeof payload !== 'string' && !Buffer.isBuffer(payload)) return payload;
+
+    let etag = reply.getHeader('ETag') as string | undefined;
+    if (!etag) {
+        const contentType = reply.getHeader('Content-Type');
+        if (typeof contentType === 'string' && contentType.startsWith('text/csv')) return payload;
+        if (Buffer.byteLength(payload) > JSINFO_QUERY_ETAG_MAX_BODY_BYTES) return payload;
+        etag = ComputeEtag(payload);
+        reply.header('ETag', etag);
+    }
+    if (IfNoneMatchMatches(request.headers['if-none-match'], etag)) {
+        reply.code(304);
+        reply.removeHeader('Content-Type');
+        reply.removeHeader('Content-Disposition');
+        return null;
+    }
+    return payload;
+});
+
+// feeds /cacheLinks, the URLs a replacement worker is warmed with
+server.addHook('onResponse', async (request, reply) => {
+    RecordCacheLinkHit(request, reply.statusCode);
+});
+
 function handleRequestWithPagination(
     handler: (request: FastifyRequest, reply: FastifyReply) => Promise<any>,
 ): (request: FastifyRequest, reply: FastifyReply) => Promise<any> {
@@ -74,7 +133,7 @@ export function RegisterPaginationServerHandler(
     ItemCountPaginatiedHandler?: (request: FastifyRequest, reply: FastifyReply) => Promise<any>
 ) {
     logger.info("Registering paginated handler for path: " + path);
-    opts = AddErrorResponseToFastifyServerOpts(opts);
+    opts = AddErrorResponseToFastifyServerOpts(AddCursorResponseToFastifyServerOpts(opts));
     server.get(path, opts, handleRequestWithPagination(handler));
 
     if (ItemCountPaginatiedHandler) {
@@ -94,20 +153,25 @@ function handleRequestWithRedisCache<T extends RouteGenericInterface>(
     return async function (request: FastifyRequest<T>, reply: FastifyReply) {
         const cacheKey = `url:${request.url.split('?')[0].substring(1)}`; // Use the path and query for the cache key
 
+        const lookupStart = performance.now();
         const cachedResponse = await RedisCache.get(cacheKey);
+        const lookupMs = performance.now() - lookupStart;
         if (cachedResponse) {
-            const parsedResponse = JSON.parse(cachedResponse);
+            const parsedResponse = TimeRequestPhaseSync('serialize', () => JSON.parse(cachedResponse));
+            WriteCacheHeadersToFastifyReply(reply, cacheKey, true, lookupMs);
             reply.send(parsedResponse);
             return reply;
         }
 
         // If no cache is found, call the handler
+        const computeStart = performance.now();
         const handlerData = await handler(request, reply);
         // returns null on error and handler handled the response
         if (handlerData == null || handlerData == undefined || handlerData == reply) return reply;
 
         // Cache the new response, don't await
-        RedisCache.set(cacheKey, JSONStringify(handlerData), cache_ttl || 30);
+        RedisCache.set(cacheKey, TimeRequestPhaseSync('serialize', () => JSONStringify(handlerData)), cache_ttl || 30);
+        WriteCacheHeadersToFastifyReply(reply, cacheKey, false, lookupMs, performance.now() - computeStart);
 
         let data = handlerData;
         if (is_text) {
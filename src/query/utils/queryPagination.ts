@@ -2,6 +2,7 @@
 
 import { FastifyRequest } from "fastify";
 import * as url from 'url';
+import { AnyColumn, SQL, and, asc, desc, gt, isNull, lt, sql } from 'drizzle-orm';
 import { JSINFO_QUERY_ALLOWED_ITEMS_PER_PAGE } from '@jsinfo/query/queryConsts';
 import { logger } from '@jsinfo/utils/logger';
 
@@ -142,3 +143,122 @@ export function SerializePagination(pagination: Pagination): string {
 
     return `${sortKeyString},${directionShort},${page},${count}`;
 }
+
+// Keyset (cursor) pagination. An offset page makes postgres walk and drop every
+// row before it, so deep pages get slower the deeper they are. A cursor holds the
+// sort value and id of the last row of the previous page instead, and the next
+// page starts right after it on the index: ?pagination=<sortKey>,<dir>,1,<count>&cursor=-
+// for the first page, then &cursor=<nextCursor of the previous response>.
+// The page number of the pagination string is ignored in this mode.
+
+export interface PaginationCursor {
+    value: string | number | null;
+    id: number;
+}
+
+export const FIRST_PAGE_CURSOR = '-';
+
+// SerializePagination without the page number, which cursor mode ignores, so
+// the same cursor page is cached once whatever page a client sends
+export function SerializeKeysetPagination(pagination: Pagination): string {
+    const { sortKey, direction, count } = pagination;
+    const directionShort = direction === 'ascending' ? 'a' : 'd';
+    const sortKeyString = sortKey === null ? '-' : sortKey;
+
+    return `${sortKeyString},${directionShort},${count}`;
+}
+
+export function EncodeCursor(cursor: PaginationCursor): string {
+    return Buffer.from(JSON.stringify([cursor.value, cursor.id])).toString('base64url');
+}
+
+export function DecodeCursor(cursorString: string): PaginationCursor {
+    if (cursorString.length > 300 || !/^[0-9a-zA-Z_\-]+$/.test(cursorString)) {
+        throw new Error(`Invalid cursor: ${cursorString.substring(0, 100)}`);
+    }
+
+    let parsed: unknown;
+    try {
+        parsed = JSON.parse(Buffer.from(cursorString, 'base64url').toString('utf8'));
+    } catch (error) {
+        throw new Error(`Invalid cursor: ${cursorString.substring(0, 100)}`);
+    }
+
+    if (!Array.isArray(parsed) || parsed.length !== 2 || !Number.isInteger(parsed[1]) ||
+        !(parsed[0] === null || typeof parsed[0] === 'string' || typeof parsed[0] === 'number')) {
+        throw new Error(`Invalid cursor: ${cursorString.substring(0, 100)}`);
+    }
+
+    return { value: parsed[0], id: parsed[1] };
+}
+
+// undefined - no cursor argument, the request is offset paginated
+// null      - the first page of a cursor paginated request
+export function ParseCursorFromRequest(request: FastifyRequest): PaginationCursor | null | undefined {
+    const query = request.query as { [key: string]: unknown };
+    const cursorString = query.cursor;
+
+    if (cursorString === undefined) {
+        return undefined;
+    }
+
+    if (typeof cursorString !== 'string') {
+        throw new Error('Invalid cursor');
+    }
+
+    return cursorString === FIRST_PAGE_CURSOR ? null : DecodeCursor(cursorString);
+}
+
+// Rows after the cursor in (sortColumn, idColumn) order. The id breaks ties, so
+// rows sharing a sort value are neither repeated nor skipped between pages.
+// A row comparison is never true against NULL, so NULL sort values are ordered
+// last in both directions (see KeysetOrderBy) and paged by id once the cursor
+// has reached them.
+export function KeysetCondition(sortColumn: AnyColumn, idColumn: AnyColumn, direction: Pagination['direction'], cursor: PaginationCursor | null): SQL | undefined {
+    if (cursor === null) {
+        return undefined;
+    }
+
+    const idCondition = direction === 'ascending' ? gt(idColumn, cursor.id) : lt(idColumn, cursor.id);
+
+    if (sortColumn === idColumn) {
+        return idCondition;
+    }
+
+    if (cursor.value === null) {
+        return and(isNull(sortColumn), idCondition);
+    }
+
+    return direction === 'ascending'
+        ? sql`((${sortColumn}, ${idColumn}) > (${cursor.value}, ${cursor.id}) or ${sortColumn} is null)`
+        : sql`((${sortColumn}, ${idColumn}) < (${cursor.value}, ${cursor.id}) or ${sortColumn} is null)`;
+}
+
+export function KeysetOrderBy(sortColumn: AnyColumn, idColumn: AnyColumn, direction: Pagination['direction']): SQL[] {
+    const orderFunction = direction === 'ascending' ? asc : desc;
+    if (sortColumn === idColumn) {
+        return [orderFunction(idColumn)];
+    }
+    // postgres puts NULLs first in descending order, KeysetCondition expects them last
+    const sortOrder = direction === 'ascending' ? sql`${sortColumn} asc nulls last` : sql`${sortColumn} desc nulls last`;
+    return [sortOrder, orderFunction(idColumn)];
+}
+
+// The cursor of the page after `rows`, or null when `rows` is the last page
+export function NextKeysetCursor<R>(rows: R[], count: number, getSortValue: (row: R) => unknown, getId: (row: R) => number): string | null {
+    if (rows.length < count || rows.length === 0) {
+        return null;
+    }
+
+    const last = rows[rows.length - 1];
+    let value = getSortValue(last);
+    if (value === undefined) {
+        value = null;
+    } else if (value instanceof Date) {
+        value = value.toISOString();
+    } else if (typeof value === 'bigint') {
+        value = value.toString();
+    }
+
+    return EncodeCursor({ value: value as string | number | null, id: getId(last) });
+}
@@ -1,7 +1,10 @@
 // ./src/query/server.ts
 
 import { RouteShorthandOptions, FastifyReply } from 'fastify'
+import { createHash } from 'crypto';
 import { logger } from '@jsinfo/utils/logger';
+import { RedisCache } from '@jsinfo/redis/classes/RedisCache';
+import { JSINFO_QUERY_CACHE_DEBUG_HEADERS } from '../queryConsts';
 
 export function AddErrorResponseToFastifyServerOpts(consumerOpts: RouteShorthandOptions): RouteShorthandOptions {
     const schema = consumerOpts.schema || {};
@@ -51,6 +54,35 @@ export function AddItemCountResponseToFastifyServerOpts(consumerOpts: RouteShort
     };
 }
 
+// Paginated routes answer ?cursor= requests with the cursor of the next page,
+// fastify drops properties the response schema does not declare
+export function AddCursorResponseToFastifyServerOpts(consumerOpts: RouteShorthandOptions): RouteShorthandOptions {
+    const schema = consumerOpts.schema || {};
+    const response = schema.response || {};
+    const existing200Response = response[200];
+
+    if (!existing200Response || !existing200Response.properties) {
+        return consumerOpts;
+    }
+
+    return {
+        ...consumerOpts,
+        schema: {
+            ...schema,
+            response: {
+                ...response,
+                200: {
+                    ...existing200Response,
+                    properties: {
+                        ...existing200Response.properties,
+                        nextCursor: { type: ['string', 'null'] },
+                    },
+                },
+            },
+        },
+    };
+}
+
 export const ItemCountOpts: RouteShorthandOptions = {
     schema: {
         response: {
@@ -72,4 +104,37 @@ export function WriteErrorToFastifyReply(reply: FastifyReply, message: string) {
 
 export function WriteErrorToFastifyReplyNoLog(reply: FastifyReply, message: string) {
     reply.code(400).send({ error: message });
-}
\ No newline at end of file
+}
+
+// Tells a benchmark whether the redis cache answered and where the time went:
+//   X-Jsinfo-Cache: hit | miss
+//   X-Jsinfo-Cache-Lookup-Ms: time spent reading redis
+//   X-Jsinfo-Compute-Ms: time spent building the response on a miss
+//   X-Jsinfo-Cache-Key: the redis key, only with JSINFO_QUERY_CACHE_DEBUG_HEADERS
+export function WriteCacheHeadersToFastifyReply(reply: FastifyReply, cacheKey: string, hit: boolean, lookupMs: number, computeMs: number = 0) {
+    if (reply.sent) return;
+    reply.header('X-Jsinfo-Cache', hit ? 'hit' : 'miss');
+    reply.header('X-Jsinfo-Cache-Lookup-Ms', lookupMs.toFixed(1));
+    reply.header('X-Jsinfo-Compute-Ms', computeMs.toFixed(1));
+    if (JSINFO_QUERY_CACHE_DEBUG_HEADERS) {
+        reply.header('X-Jsinfo-Cache-Key', RedisCache.getFullKey(cacheKey));
+    }
+}
+
+// Strong validator of a serialized response body. A dashboard that polls a
+// route sends it back in If-None-Match and gets an empty 304 until the data
+// behind the route changes.
+export function ComputeEtag(payload: string | Buffer): string {
+    return `"${createHash('sha1').update(payload).digest('base64url')}"`;
+}
+
+// If-None-Match holds * or a list of tags, compared weakly as RFC 9110 asks
+export function IfNoneMatchMatches(ifNoneMatch: string | string[] | undefined, etag: string): boolean {
+    if (!ifNoneMatch) return false;
+    const opaqueTag = etag.replace(/^W\//, '');
+    const candidates = (Array.isArray(ifNoneMatch) ? ifNoneMatch.join(',') : ifNoneMatch).split(',');
+    return candidates.some(candidate => {
+        const tag = candidate.trim();
+        return tag === '*' || tag.replace(/^W\//, '') === opaqueTag;
+    });
+}
@@ -5,6 +5,7 @@ import type { RedisClientType } from 'redis';
 import { logger } from '@jsinfo/utils/logger';
 import { GetRedisUrls } from '@jsinfo/utils/env';
 import { JSONStringify, MaskPassword } from '@jsinfo/utils/fmt';
+import { TimeRequestPhase, TimeRequestPhaseSync } from '@jsinfo/utils/requestTiming';
 
 class RedisCacheClass {
     private clients: (RedisClientType | null)[] = [];
@@ -100,7 +101,15 @@ class RedisCacheClass {
         return client;
     }
 
+    getFullKey(key: string): string {
+        return this.keyPrefix + key;
+    }
+
     async get(key: string): Promise<string | null> {
+        return TimeRequestPhase('redis', () => this.getFromClients(key));
+    }
+
+    private async getFromClients(key: string): Promise<string | null> {
         const fullKey = this.keyPrefix + key;
 
         if (!this.clients.length) {
@@ -152,6 +161,10 @@ class RedisCacheClass {
     }
 
     async set(key: string, value: string, cacheExpirySeconds?: number): Promise<void> {
+        return TimeRequestPhase('redis', () => this.setOnClients(key, value, cacheExpirySeconds));
+    }
+
+    private async setOnClients(key: string, value: string, cacheExpirySeconds?: number): Promise<void> {
         const fullKey = this.keyPrefix + key;
 
         const existingSet = RedisCacheClass.activeSets.get(fullKey);
@@ -213,7 +226,7 @@ class RedisCacheClass {
         const result = await this.get(key);
         if (!result) return null;
         try {
-            return JSON.parse(result);
+            return TimeRequestPhaseSync('serialize', () => JSON.parse(result));
         } catch (error) {
             logger.error('Redis operation failed', {
                 error: error as Error,
@@ -226,7 +239,7 @@ class RedisCacheClass {
 
     async setArray(key: string, value: any[], ttl: number = 30): Promise<void> {
         try {
-            const stringValue = JSONStringify(value);
+            const stringValue = TimeRequestPhaseSync('serialize', () => JSONStringify(value));
             await this.set(key, stringValue, ttl);
         } catch (error) {
             logger.error('Redis operation failed', {
@@ -241,7 +254,7 @@ class RedisCacheClass {
         const result = await this.get(key);
         if (!result) return null;
         try {
-            return JSON.parse(result);
+            return TimeRequestPhaseSync('serialize', () => JSON.parse(result));
         } catch (error) {
             logger.error('Redis operation failed', {
                 error: error as Error,
@@ -256,7 +269,7 @@ class RedisCacheClass {
         const result = await this.get(key);
         if (!result) return null;
         try {
-            return JSON.parse(result);
+            return TimeRequestPhaseSync('serialize', () => JSON.parse(result));
         } catch (error) {
             logger.error('Redis operation failed', {
                 error: error as Error,
@@ -269,7 +282,7 @@ class RedisCacheClass {
 
     async setDict(key: string, value: { [key: string]: any }, ttl: number = 30): Promise<void> {
         try {
-            const stringValue = JSONStringify(value);
+            const stringValue = TimeRequestPhaseSync('serialize', () => JSONStringify(value));
             await this.set(key, stringValue, ttl);
         } catch (error) {
             logger.error('Redis operation failed', {
@@ -281,6 +294,10 @@ class RedisCacheClass {
     }
 
     async getTTL(key: string): Promise<number | undefined> {
+        return TimeRequestPhase('redis', () => this.getTTLFromClients(key));
+    }
+
+    private async getTTLFromClients(key: string): Promise<number | undefined> {
         const fullKey = this.keyPrefix + key;
 
         if (!this.clients.length) {
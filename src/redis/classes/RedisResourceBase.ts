@@ -2,6 +2,7 @@ import { RedisCache } from './RedisCache';
 import { IsIndexerProcess } from '@jsinfo/utils/env';
 import { logger } from '@jsinfo/utils/logger';
 import { IsMeaningfulText, JSONStringify } from '@jsinfo/utils/fmt';
+import { TimeRequestPhaseSync } from '@jsinfo/utils/requestTiming';
 interface BaseArgs {
     [key: string]: any;
 }
@@ -18,7 +19,7 @@ export abstract class RedisResourceBase<T, A extends BaseArgs = BaseArgs> {
 
     // Core cache operations with args support
     protected async set(data: T, args?: A): Promise<void> {
-        await RedisCache.set(this.formatRedisKeyWithArgs(args), this.serialize(data), this.cacheExpirySeconds);
+        await RedisCache.set(this.formatRedisKeyWithArgs(args), TimeRequestPhaseSync('serialize', () => this.serialize(data)), this.cacheExpirySeconds);
     }
 
     protected async shouldUpdate(args?: A): Promise<boolean> {
@@ -38,7 +39,7 @@ export abstract class RedisResourceBase<T, A extends BaseArgs = BaseArgs> {
         const key = this.formatRedisKeyWithArgs(args);
         const cached = await RedisCache.get(key);
         if (key.includes("providerMonikerSpec")) {
-            return cached ? this.deserialize(cached) : null;
+            return cached ? TimeRequestPhaseSync('serialize', () => this.deserialize(cached)) : null;
         }
         logger.info(`RedisResourceBase:: [${this.redisKey}] Cache ${cached ? 'hit' : 'miss'}:`, {
             key,
@@ -47,7 +48,7 @@ export abstract class RedisResourceBase<T, A extends BaseArgs = BaseArgs> {
             timestamp: new Date().toISOString()
         });
 
-        return cached ? this.deserialize(cached) : null;
+        return cached ? TimeRequestPhaseSync('serialize', () => this.deserialize(cached)) : null;
     }
 
     // Default JSON serialization
@@ -7,6 +7,7 @@ import postgres from 'postgres';
 import { migrate } from "drizzle-orm/postgres-js/migrator";
 import { sql } from 'drizzle-orm';
 import { MaskPassword, JSONStringify } from './fmt';
+import { TimeRequestPhase } from './requestTiming';
 
 interface DbConnection {
     db: PostgresJsDatabase;
@@ -446,7 +447,7 @@ export async function queryJsinfo<T extends Record<string, any>>(
     queryKey: string,
     priority: "low" | "normal" | "high" = "normal"
 ): Promise<T> {
-    return DbConnectionPoolJsinfo.executeQuery<T>(queryFn, queryKey, priority);
+    return TimeRequestPhase('db', () => DbConnectionPoolJsinfo.executeQuery<T>(queryFn, queryKey, priority));
 }
 
 export async function queryRelays<T extends Record<string, any>>(
@@ -454,7 +455,7 @@ export async function queryRelays<T extends Record<string, any>>(
     queryKey: string,
     priority: "low" | "normal" | "high" = "normal"
 ): Promise<T> {
-    return DbConnectionPoolRelays.executeQuery<T>(queryFn, queryKey, priority);
+    return TimeRequestPhase('db', () => DbConnectionPoolRelays.executeQuery<T>(queryFn, queryKey, priority));
 }
 
 export async function CheckDatabaseStatus(): Promise<{ ok: boolean; details: string }> {
@@ -0,0 +1,49 @@
+// jsinfo/src/utils/diagnostics.ts
+
+// process_monitor.py --diag-dir sets JSINFO_DIAGNOSTICS_DIR and sends SIGUSR2
+// before it stops a stuck process. The heap stats and snapshot written here end
+// up next to the last log lines in the monitor's capture directory.
+
+import { logger } from './logger';
+import { JSONStringify } from './fmt';
+
+export function SetupDiagnosticsSignalHandler(processName: string): void {
+    const diagnosticsDir = process.env.JSINFO_DIAGNOSTICS_DIR;
+    if (!diagnosticsDir) return;
+
+    let capturing = false;
+
+    process.on('SIGUSR2', async () => {
+        if (capturing) return;
+        capturing = true;
+        try {
+            const { heapStats } = await import("bun:jsc");
+            const { generateHeapSnapshot } = await import("bun");
+            const { writeFileSync, renameSync } = await import("fs");
+            const { join } = await import("path");
+
+            // the monitor ignores .tmp files, so it never collects a half written artifact
+            const writeArtifact = (name: string, data: string) => {
+                const path = join(diagnosticsDir, name);
+                writeFileSync(path + '.tmp', data);
+                renameSync(path + '.tmp', path);
+            };
+
+            const prefix = `${processName}-${process.pid}-${new Date().toISOString().replace(/[:.]/g, '-')}`;
+            logger.warn(`Diagnostics: SIGUSR2 received, writing ${prefix} to ${diagnosticsDir}`);
+
+            writeArtifact(`${prefix}-stats.json`, JSONStringify({
+                uptime: process.uptime(),
+                memoryUsage: process.memoryUsage(),
+                heapStats: heapStats(),
+            }));
+            writeArtifact(`${prefix}-heap-snapshot.json`, JSONStringify(generateHeapSnapshot()));
+
+            logger.warn(`Diagnostics: wrote ${prefix}`);
+        } catch (error) {
+            logger.error(`Diagnostics: capture failed: ${String(error)}`);
+        } finally {
+            capturing = false;
+        }
+    });
+}
@@ -0,0 +1,69 @@
+// src/utils/requestTiming.ts
+
+// Where a query server request spent its time, for the Server-Timing header:
+//   db: queryJsinfo / queryRelays, including the wait for a pool connection
+//   redis: RedisCache GET / SET round trips
+//   serialize: JSON and CSV encoding and decoding, fastify's reply serializer included
+// The phases are summed per request; queries run with Promise.all overlap,
+// so db can add up to more than the total. Outside a request (the indexer,
+// the redis refresh loops) nothing is recorded.
+
+import { AsyncLocalStorage } from 'async_hooks';
+
+export type RequestTimingPhase = 'db' | 'redis' | 'serialize';
+
+export const REQUEST_TIMING_PHASES: RequestTimingPhase[] = ['db', 'redis', 'serialize'];
+
+export class RequestTiming {
+    public readonly start: number = performance.now();
+    public readonly ms: Record<RequestTimingPhase, number> = { db: 0, redis: 0, serialize: 0 };
+    public readonly count: Record<RequestTimingPhase, number> = { db: 0, redis: 0, serialize: 0 };
+    // set by the preSerialization hook, fastify serializes the reply after it
+    public serializeStart: number | null = null;
+
+    add(phase: RequestTimingPhase, ms: number) {
+        this.ms[phase] += ms;
+        this.count[phase] += 1;
+    }
+}
+
+const requestTimingStorage = new AsyncLocalStorage<RequestTiming>();
+
+export function RunWithRequestTiming<R>(fn: () => R): R {
+    return requestTimingStorage.run(new RequestTiming(), fn);
+}
+
+export function GetRequestTiming(): RequestTiming | undefined {
+    return requestTimingStorage.getStore();
+}
+
+export async function TimeRequestPhase<R>(phase: RequestTimingPhase, fn: () => Promise<R>): Promise<R> {
+    const timing = requestTimingStorage.getStore();
+    if (!timing) return await fn();
+    const start = performance.now();
+    try {
+        return await fn();
+    } finally {
+        timing.add(phase, performance.now() - start);
+    }
+}
+
+export function TimeRequestPhaseSync<R>(phase: RequestTimingPhase, fn: () => R): R {
+    const timing = requestTimingStorage.getStore();
+    if (!timing) return fn();
+    const start = performance.now();
+    try {
+        return fn();
+    } finally {
+        timing.add(phase, performance.now() - start);
+    }
+}
+
+// db;dur=12.3;desc="2", redis;dur=0.4;desc="1", serialize;dur=1.1;desc="1", total;dur=15.2
+// desc is how many times the phase ran
+export function FormatServerTiming(timing: RequestTiming): string {
+    const phases = REQUEST_TIMING_PHASES.map(phase =>
+        `${phase};dur=${timing.ms[phase].toFixed(1)};desc="${timing.count[phase]}"`);
+    phases.push(`total;dur=${(performance.now() - timing.start).toFixed(1)}`);
+    return phases.join(', ');
+}
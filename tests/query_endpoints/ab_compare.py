@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+# jsinfo/tests/query_endpoints/ab_compare.py
+#
+# Latency comparison of two query server deployments, for checking a new
+# build on staging against the one on mainnet before it rolls out:
+#
+#   source env.sh
+#   python3 ab_compare.py --baseline mainnet --candidate staging --mix provider --requests 400
+#   python3 ab_compare.py --baseline http://localhost:8081 --candidate http://localhost:8082 --json /tmp/ab.json
+#
+# local, staging, testnet and mainnet stand for the TESTS_SERVER_ADDRESS_*
+# addresses of env.sh, as in tests.sh. Both servers get the same requests,
+# paths drawn from a bench.py mix with ids from the baseline's lists. Each
+# path goes to both servers back to back, in a random order, so drift over
+# the run (cache warming, other traffic, the network) hits both sides alike.
+#
+# Per endpoint the change is the geometric mean of the candidate/baseline
+# latency ratios of the pairs, with a Student t confidence interval. An
+# endpoint regressed when the whole interval is slower than --threshold, and
+# improved when the whole interval is faster than it; the run exits 1 when any
+# endpoint regressed.
+
+import argparse
+import asyncio
+import collections
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+from bench import DEFAULT_SERVER, ConnectionPool, Mix, load_fixtures, load_mix
+
+ENVIRONMENTS = ('local', 'staging', 'testnet', 'mainnet')
+# two sided 97.5% quantiles of Student's t, by degrees of freedom
+T_975 = (None, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+         2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+         2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042)
+MIN_PAIRS = 5
+
+
+def resolve_server(name):
+    """A base URL, or one of ENVIRONMENTS looked up in the environment like tests.sh does."""
+    if name not in ENVIRONMENTS:
+        return name.rstrip('/')
+    variable = 'TESTS_SERVER_ADDRESS_%s' % name.upper()
+    address = os.getenv(variable) or (DEFAULT_SERVER if name == 'local' else None)
+    if not address:
+        raise SystemExit('%s is not set, source env.sh first' % variable)
+    return address.rstrip('/')
+
+
+def t_quantile(df, confidence=0.95):
+    """Two sided Student t quantile at 95% from the table, the normal one for other levels or large samples."""
+    if confidence == 0.95 and df < len(T_975):
+        return T_975[df]
+    return statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def ratio_interval(pairs, confidence=0.95):
+    """(change, low, high) of the candidate over the baseline, as fractions, from (baseline_ms, candidate_ms) pairs."""
+    logs = [math.log(candidate / baseline) for baseline, candidate in pairs if baseline > 0 and candidate > 0]
+    if len(logs) < 2:
+        return None, None, None
+    mean = statistics.fmean(logs)
+    margin = t_quantile(len(logs) - 1, confidence) * statistics.stdev(logs) / math.sqrt(len(logs))
+    return math.exp(mean) - 1, math.exp(mean - margin) - 1, math.exp(mean + margin) - 1
+
+
+class EndpointComparison:
+    """The paired samples of one endpoint template."""
+
+    def __init__(self, template):
+        self.template = template
+        self.pairs = []  # (baseline ms, candidate ms)
+        self.errors = collections.Counter()  # 'baseline' / 'candidate'
+        self.status_mismatches = 0
+        self.baseline_bytes = 0
+        self.candidate_bytes = 0
+
+    def row(self, threshold, confidence):
+        change, low, high = ratio_interval(self.pairs, confidence)
+        verdict = None
+        if len(self.pairs) < MIN_PAIRS or change is None:
+            verdict = 'too few'
+        elif low > threshold:
+            verdict = 'regressed'
+        elif high < -threshold:
+            verdict = 'improved'
+        baseline = [pair[0] for pair in self.pairs]
+        candidate = [pair[1] for pair in self.pairs]
+        return {
+            'template': self.template,
+            'pairs': len(self.pairs),
+            'baseline_p50_ms': statistics.median(baseline) if baseline else None,
+            'candidate_p50_ms': statistics.median(candidate) if candidate else None,
+            'change': change,
+            'change_low': low,
+            'change_high': high,
+            'verdict': verdict,
+            'baseline_errors': self.errors['baseline'],
+            'candidate_errors': self.errors['candidate'],
+            'status_mismatches': self.status_mismatches,
+            'baseline_mean_bytes': self.baseline_bytes / len(self.pairs) if self.pairs else None,
+            'candidate_mean_bytes': self.candidate_bytes / len(self.pairs) if self.pairs else None,
+        }
+
+
+async def _timed(pool, path):
+    started = time.monotonic()
+    try:
+        status, _, body = await pool.get(path)
+    except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        return 'error', None, 0
+    return status, (time.monotonic() - started) * 1000.0, len(body)
+
+
+async def compare(baseline, candidate, requests, concurrency, rng):
+    """Sends every (template, path) of requests to both pools, `concurrency` pairs at a time."""
+    results = {}
+    queue = collections.deque(requests)
+
+    async def client():
+        while queue:
+            template, path = queue.popleft()
+            comparison = results.setdefault(template, EndpointComparison(template))
+            candidate_first = rng.random() < 0.5
+            first, second = (candidate, baseline) if candidate_first else (baseline, candidate)
+            first_result = await _timed(first, path)
+            second_result = await _timed(second, path)
+            baseline_result, candidate_result = ((second_result, first_result) if candidate_first
+                                                 else (first_result, second_result))
+
+            if baseline_result[0] != 200:
+                comparison.errors['baseline'] += 1
+            if candidate_result[0] != 200:
+                comparison.errors['candidate'] += 1
+            if baseline_result[0] != candidate_result[0]:
+                comparison.status_mismatches += 1
+            if baseline_result[0] == 200 and candidate_result[0] == 200:
+                comparison.pairs.append((baseline_result[1], candidate_result[1]))
+                comparison.baseline_bytes += baseline_result[2]
+                comparison.candidate_bytes += candidate_result[2]
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return results
+
+
+def _percent(value):
+    return '-' if value is None else '%+.1f%%' % (100.0 * value)
+
+
+def print_comparison(rows, baseline, candidate, confidence, out=sys.stdout):
+    print('baseline  %s\ncandidate %s\n' % (baseline, candidate), file=out)
+    header = '%-44s %6s %10s %10s %9s %21s %6s %6s  %s' % (
+        'endpoint', 'pairs', 'base p50', 'cand p50', 'change', '%.0f%% interval' % (100 * confidence),
+        'errA', 'errB', '')
+    print(header, file=out)
+    print('-' * len(header), file=out)
+    for row in rows:
+        interval = '-' if row['change_low'] is None else '%s .. %s' % (_percent(row['change_low']), _percent(row['change_high']))
+        print('%-44s %6d %10s %10s %9s %21s %6d %6d  %s' % (
+            row['template'][:44], row['pairs'],
+            '-' if row['baseline_p50_ms'] is None else '%.1f' % row['baseline_p50_ms'],
+            '-' if row['candidate_p50_ms'] is None else '%.1f' % row['candidate_p50_ms'],
+            _percent(row['change']), interval, row['baseline_errors'], row['candidate_errors'],
+            (row['verdict'] or '').upper() if row['verdict'] in ('regressed', 'improved') else row['verdict'] or ''),
+            file=out)
+    print('(ms; change is the candidate over the baseline, negative is faster)', file=out)
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the latency of two query server deployments.')
+    parser.add_argument('--baseline', required=True,
+                        help='base URL, or one of %s for the TESTS_SERVER_ADDRESS_* of env.sh' % ', '.join(ENVIRONMENTS))
+    parser.add_argument('--candidate', required=True, help='base URL or environment of the build under test')
+    parser.add_argument('--mix', default='default', help='bench.py mix name or JSON file (default: %(default)s)')
+    parser.add_argument('--requests', type=int, default=300,
+                        help='paths to send, each to both servers (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='pairs in flight at once (default: %(default)s)')
+    parser.add_argument('--warmup', type=int, default=20,
+                        help='pairs sent first and left out, to open connections (default: %(default)s)')
+    parser.add_argument('--threshold', type=float, default=0.05,
+                        help='smallest change that counts, as a fraction (default: %(default)s)')
+    parser.add_argument('--confidence', type=float, default=0.95, help='interval confidence (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=60.0,
+                        help='per request timeout in seconds (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the paths and the order within pairs')
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    return parser.parse_args(argv)
+
+
+async def _main(args, baseline_url, candidate_url):
+    rng = random.Random(args.seed)
+    baseline = ConnectionPool(baseline_url, args.concurrency, args.timeout)
+    candidate = ConnectionPool(candidate_url, args.concurrency, args.timeout)
+    try:
+        mix = Mix(load_mix(args.mix), await load_fixtures(baseline), rng)
+        if args.warmup:
+            await compare(baseline, candidate, [mix.next() for _ in range(args.warmup)], args.concurrency, rng)
+        requests = [mix.next() for _ in range(args.requests)]
+        return await compare(baseline, candidate, requests, args.concurrency, rng)
+    finally:
+        baseline.close()
+        candidate.close()
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    baseline_url, candidate_url = resolve_server(args.baseline), resolve_server(args.candidate)
+    started = time.monotonic()
+    results = asyncio.run(_main(args, baseline_url, candidate_url))
+    print('%d pairs in %.0fs' % (args.requests, time.monotonic() - started), file=sys.stderr)
+
+    rows = [results[template].row(args.threshold, args.confidence) for template in sorted(results)]
+    rows.sort(key=lambda row: -(row['change'] if row['change'] is not None else -math.inf))
+    print_comparison(rows, baseline_url, candidate_url, args.confidence)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'baseline': baseline_url, 'candidate': candidate_url, 'threshold': args.threshold,
+                       'confidence': args.confidence, 'endpoints': rows}, f, indent=2)
+    regressed = [row['template'] for row in rows if row['verdict'] == 'regressed']
+    if regressed:
+        print('\nregressed: %s' % ', '.join(regressed), file=sys.stderr)
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
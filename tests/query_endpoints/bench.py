@@ -0,0 +1,762 @@
+#!/usr/bin/env python3
+
+# jsinfo/tests/query_endpoints/bench.py
+#
+# Load generator for the query server. Replays a weighted mix of endpoints
+# over pooled keep-alive connections and reports throughput and latency
+# percentiles per endpoint:
+#
+#   python3 bench.py --server http://localhost:8081 --mix default --concurrency 32 --duration 60
+#   python3 bench.py --mix provider --requests 2000 --json /tmp/bench.json
+#   python3 bench.py --list-mixes
+#
+# Endpoint templates use {provider}, {consumer} and {spec}, filled per request
+# from the /providers, /consumers and /specs lists fetched at start. Each of the
+# --concurrency clients sends its next request as soon as the previous one
+# returns, so this measures capacity at a fixed number of users in flight.
+# The hit% column is the share of responses the query server's redis cache
+# answered, from its X-Jsinfo-Cache header; cache_bench.py times hits and misses.
+#
+# Closed loop clients slow down with the server and so under-report its stalls.
+# With --rate requests go out on a Poisson (or constant) schedule instead,
+# whether or not earlier ones returned, and latency counts from the time each
+# request was due. --ramp steps that rate up until p99, throughput or errors
+# show the server has saturated:
+#
+#   python3 bench.py --mix index --rate 200 --duration 60
+#   python3 bench.py --mix provider --ramp 10:1000:x1.5 --step-duration 30
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import ssl
+import sys
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_SERVER = os.getenv('TESTS_SERVER_ADDRESS', 'http://localhost:8081')
+FIXTURE_LIMIT = 200
+# template placeholder, list endpoint, list key, id key of list items that are objects
+FIXTURES = (
+    ('provider', '/providers', 'providers', 'address'),
+    ('consumer', '/consumers', 'consumers', 'address'),
+    ('spec', '/specs', 'specs', 'id'),
+)
+REPORT_PERCENTILES = (50, 95, 99, 99.9)
+# hit or miss, set by the query server's redis backed handlers
+CACHE_HEADER = 'x-jsinfo-cache'
+# db, redis, serialize and total ms of the request, see src/utils/requestTiming.ts
+SERVER_TIMING_HEADER = 'server-timing'
+
+# (weight, path template); weights are relative within a mix
+MIXES = {
+    'index': [
+        (5, '/indexLatestBlock'),
+        (3, '/indexTotalCu'),
+        (3, '/index30DayCu'),
+        (3, '/indexStakesHandler'),
+        (3, '/indexTopChains'),
+        (2, '/indexProvidersActiveV2'),
+        (4, '/indexChartsV3'),
+    ],
+    'provider': [
+        (4, '/providerV2/{provider}'),
+        (2, '/providerCardsStakes/{provider}'),
+        (2, '/providerCardsCuRelayAndRewards/{provider}'),
+        (2, '/providerCardsDelegatorRewards/{provider}'),
+        (2, '/providerRelaysPerSpecPie/{provider}'),
+        (3, '/providerHealth/{provider}'),
+        (2, '/providerErrors/{provider}'),
+        (3, '/providerStakes/{provider}'),
+        (2, '/providerEvents/{provider}'),
+        (3, '/providerRewards/{provider}'),
+        (2, '/providerReports/{provider}'),
+        (1, '/providerBlockReports/{provider}'),
+        (2, '/providerLatestHealth/{provider}'),
+    ],
+    'csv': [
+        (1, '/providerHealthCsv/{provider}'),
+        (1, '/providerErrorsCsv/{provider}'),
+        (1, '/providerStakesCsv/{provider}'),
+        (1, '/providerEventsCsv/{provider}'),
+        (1, '/providerRewardsCsv/{provider}'),
+        (1, '/providerReportsCsv/{provider}'),
+        (1, '/providerBlockReportsCsv/{provider}'),
+        (1, '/eventsEventsCsv'),
+        (1, '/eventsRewardsCsv'),
+        (1, '/eventsReportsCsv'),
+        (1, '/indexProvidersActiveCsvV2'),
+    ],
+    'spec': [
+        (4, '/specStakes/{spec}'),
+        (2, '/specCuRelayRewards/{spec}'),
+        (2, '/specProviderCount/{spec}'),
+        (1, '/specEndpointHealth/{spec}'),
+        (1, '/specCacheHitRate/{spec}'),
+        (1, '/specTrackedInfo/{spec}'),
+    ],
+    'consumer': [
+        (3, '/consumerV2/{consumer}'),
+        (1, '/consumerSubscriptions/{consumer}'),
+        (1, '/consumerConflicts/{consumer}'),
+        (1, '/consumerEvents/{consumer}'),
+    ],
+}
+# roughly what the site's page views look like
+MIXES['default'] = (
+    [(w * 6, p) for w, p in MIXES['index']]
+    + [(w * 4, p) for w, p in MIXES['provider']]
+    + [(w * 3, p) for w, p in MIXES['spec']]
+    + [(w * 1, p) for w, p in MIXES['consumer']]
+    + [(w * 1, p) for w, p in MIXES['csv']]
+)
+
+
+class LatencyHistogram:
+    """HDR style histogram of microsecond values.
+
+    Values below 2**SUB_BUCKET_BITS are counted exactly, larger ones in
+    buckets that keep SUB_BUCKET_BITS bits of precision (about 0.1%), so
+    memory stays bounded whatever the number of samples.
+    """
+
+    SUB_BUCKET_BITS = 11
+    SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+    SUB_BUCKET_HALF = SUB_BUCKET_COUNT >> 1
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @classmethod
+    def _index(cls, value):
+        if value < cls.SUB_BUCKET_COUNT:
+            return value
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS
+        return cls.SUB_BUCKET_COUNT + (shift - 1) * cls.SUB_BUCKET_HALF + (value >> shift) - cls.SUB_BUCKET_HALF
+
+    @classmethod
+    def _highest_equivalent(cls, index):
+        if index < cls.SUB_BUCKET_COUNT:
+            return index
+        shift, offset = divmod(index - cls.SUB_BUCKET_COUNT, cls.SUB_BUCKET_HALF)
+        shift += 1
+        return ((offset + cls.SUB_BUCKET_HALF) << shift) + (1 << shift) - 1
+
+    def record(self, value, count=1):
+        value = max(0, int(value))
+        self.counts[self._index(value)] += count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0
+        target = max(1, -(-self.count * percent // 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._highest_equivalent(index), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+
+class HttpConnection:
+    """One keep-alive HTTP/1.1 connection, used for one request at a time."""
+
+    def __init__(self, host, port, use_tls, timeout):
+        self.host = host
+        self.port = port
+        self.ssl = ssl.create_default_context() if use_tls else None
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def get(self, path, headers):
+        """Returns (status, response headers, body bytes); any failure closes the connection."""
+        try:
+            return await asyncio.wait_for(self._get(path, headers), self.timeout)
+        except BaseException:
+            self.close()
+            raise
+
+    async def _get(self, path, headers):
+        request = ('GET %s HTTP/1.1\r\nHost: %s\r\n%s\r\n' % (
+            path, self.host, ''.join('%s: %s\r\n' % item for item in headers.items()))).encode()
+        reused = self._writer is not None
+        try:
+            return await self._request(request)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # the server may have closed an idle kept-alive connection
+            if not reused:
+                raise
+        self.close()
+        return await self._request(request)
+
+    async def _request(self, request):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(
+                self.host, self.port, ssl=self.ssl, server_hostname=self.host if self.ssl else None)
+        self._writer.write(request)
+        await self._writer.drain()
+
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionResetError('connection closed by %s:%d' % (self.host, self.port))
+        parts = status_line.split(None, 2)
+        if len(parts) < 2 or not parts[1].isdigit():
+            raise ValueError('bad status line %r' % status_line)
+        response_headers = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.partition(b':')
+            response_headers[key.strip().lower().decode('latin-1')] = value.strip().decode('latin-1')
+
+        status = int(parts[1])
+        if status in (204, 304) or status < 200:
+            # no body, whatever the headers say
+            body = b''
+        elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = await self._read_chunked()
+        elif 'content-length' in response_headers:
+            body = await self._reader.readexactly(int(response_headers['content-length']))
+        else:
+            body = await self._reader.read()
+            self.close()
+        if response_headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, response_headers, body
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self._reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                while (await self._reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self._reader.readexactly(size))
+            await self._reader.readline()
+
+
+class ConnectionPool:
+    """Up to `size` kept-alive connections to one server, opened as they are needed."""
+
+    def __init__(self, server, size, timeout=30.0, headers=None):
+        parts = urlsplit(server if '://' in server else 'http://' + server)
+        self.use_tls = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.use_tls else 80)
+        self.base_path = parts.path.rstrip('/')
+        self.size = size
+        self.timeout = timeout
+        self.headers = {'Accept-Encoding': 'gzip', 'User-Agent': 'jsinfo-bench'}
+        self.headers.update(headers or {})
+        self._idle = asyncio.Queue()
+        self._opened = 0
+
+    async def acquire(self):
+        if self._idle.empty() and self._opened < self.size:
+            self._opened += 1
+            return HttpConnection(self.host, self.port, self.use_tls, self.timeout)
+        return await self._idle.get()
+
+    def release(self, connection):
+        self._idle.put_nowait(connection)
+
+    async def request(self, connection, path, headers=None):
+        return await connection.get(self.base_path + path, dict(self.headers, **(headers or {})))
+
+    async def get(self, path, headers=None):
+        connection = await self.acquire()
+        try:
+            return await self.request(connection, path, headers)
+        finally:
+            self.release(connection)
+
+    def close(self):
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+
+class EndpointStats:
+    """Latency, status codes and bytes for one endpoint template.
+
+    `latency` runs from the time a request was due to be sent, `service` from
+    the time it actually went out on a connection. They only differ in the
+    open loop mode, where the gap is the queueing a stalled server causes.
+    """
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.service = LatencyHistogram()
+        self.statuses = collections.Counter()
+        self.cache = collections.Counter()
+        self.bytes = 0
+
+    @property
+    def errors(self):
+        return sum(count for status, count in self.statuses.items() if status == 'error' or status >= 400)
+
+    def merge(self, other):
+        self.latency.merge(other.latency)
+        self.service.merge(other.service)
+        self.statuses.update(other.statuses)
+        self.cache.update(other.cache)
+        self.bytes += other.bytes
+
+    @property
+    def hit_ratio(self):
+        """Share of cache hits among responses that said, None when none did."""
+        answered = self.cache['hit'] + self.cache['miss']
+        return self.cache['hit'] / answered if answered else None
+
+
+def fixture_ids(items, key, limit=FIXTURE_LIMIT):
+    """Ids out of a /providers, /consumers or /specs list, whose items are ids or objects; limit None keeps all."""
+    ids = []
+    for item in items or []:
+        value = item.get(key) if isinstance(item, dict) else item
+        if value:
+            ids.append(str(value))
+    return ids[:limit]
+
+
+async def load_fixtures(pool):
+    """Fetches the id lists the endpoint templates are filled from."""
+    fixtures = {}
+    for name, path, list_key, id_key in FIXTURES:
+        status, _, body = await pool.get(path, {'Accept-Encoding': 'identity'})
+        if status != 200:
+            raise RuntimeError('GET %s returned %d' % (path, status))
+        fixtures[name] = fixture_ids(json.loads(body).get(list_key), id_key)
+    return fixtures
+
+
+def parse_server_timing(value):
+    """{metric: ms} out of a Server-Timing header, metrics without a dur are left out."""
+    timings = {}
+    for metric in (value or '').split(','):
+        name, _, params = metric.strip().partition(';')
+        for param in params.split(';'):
+            key, _, number = param.strip().partition('=')
+            if key.strip().lower() == 'dur' and name:
+                try:
+                    timings[name.strip()] = float(number.strip().strip('"'))
+                except ValueError:
+                    pass
+    return timings
+
+
+class Mix:
+    """Picks the next (template, path) from weighted endpoint templates."""
+
+    def __init__(self, entries, fixtures, rng=None):
+        self.rng = rng or random.Random()
+        self.fixtures = fixtures
+        self.templates = []
+        self.weights = []
+        for weight, template in entries:
+            missing = [name for name, _, _, _ in FIXTURES
+                       if '{%s}' % name in template and not fixtures.get(name)]
+            if missing:
+                print('Skipping %s: no %s ids' % (template, ', '.join(missing)), file=sys.stderr)
+                continue
+            self.templates.append(template)
+            self.weights.append(weight)
+        if not self.templates:
+            raise ValueError('nothing to request in this mix')
+
+    def next(self):
+        template = self.rng.choices(self.templates, self.weights)[0]
+        values = {name: self.rng.choice(ids) for name, ids in self.fixtures.items() if ids}
+        return template, template.format(**values)
+
+
+def load_mix(name_or_path):
+    """A named mix from MIXES or a JSON file holding [[weight, template], ...]."""
+    if name_or_path in MIXES:
+        return MIXES[name_or_path]
+    with open(name_or_path) as f:
+        return [(float(weight), str(template)) for weight, template in json.load(f)]
+
+
+class Recorder:
+    """Collects per-endpoint stats, ignoring requests due before the end of warm-up."""
+
+    def __init__(self, warmup_until=0.0):
+        self.warmup_until = warmup_until
+        self.endpoints = collections.defaultdict(EndpointStats)
+        self.started = None
+        self.finished = None
+
+    def record(self, template, start, sent, end, status, nbytes, cache=None):
+        if start < self.warmup_until:
+            return
+        if self.started is None or start < self.started:
+            self.started = start
+        self.finished = end if self.finished is None else max(self.finished, end)
+        stats = self.endpoints[template]
+        stats.latency.record((end - start) * 1e6)
+        stats.service.record((end - sent) * 1e6)
+        stats.statuses[status] += 1
+        if cache:
+            stats.cache[cache] += 1
+        stats.bytes += nbytes
+
+    @property
+    def elapsed(self):
+        return (self.finished - self.started) if self.started is not None else 0.0
+
+    def total(self):
+        total = EndpointStats()
+        for stats in self.endpoints.values():
+            total.merge(stats)
+        return total
+
+
+async def send(pool, recorder, template, path, start):
+    """Sends one request and records its latency measured from `start`.
+
+    Waiting for a free connection counts against the request, so in the open
+    loop mode a server that stalls shows up in the latency of every request
+    that was due meanwhile rather than only in the one that hit the stall.
+    """
+    connection = await pool.acquire()
+    sent = time.monotonic()
+    try:
+        status, headers, body = await pool.request(connection, path)
+        nbytes, cache = len(body), headers.get(CACHE_HEADER)
+    except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        status, nbytes, cache = 'error', 0, None
+    finally:
+        pool.release(connection)
+    recorder.record(template, start, sent, time.monotonic(), status, nbytes, cache)
+
+
+async def run_closed(pool, mix, recorder, concurrency, deadline, max_requests=None):
+    """`concurrency` clients that each send their next request once the previous one returned."""
+    remaining = [max_requests]
+
+    async def client():
+        while time.monotonic() < deadline:
+            if remaining[0] is not None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            template, path = mix.next()
+            await send(pool, recorder, template, path, time.monotonic())
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+
+
+def arrival_offsets(rate, arrival, rng):
+    """Seconds from the start at which requests are due, at `rate` per second on average."""
+    offset = 0.0
+    while True:
+        offset += rng.expovariate(rate) if arrival == 'poisson' else 1.0 / rate
+        yield offset
+
+
+async def run_open(pool, mix, recorder, rate, arrival, start, deadline, rng, max_requests=None):
+    """Sends requests on an arrival schedule, whether or not earlier ones have returned.
+
+    Latency is measured from the time each request was due, so a slow
+    response does not hide the requests that should have gone out behind it.
+    Returns the number of requests sent.
+    """
+    in_flight = set()
+    sent = 0
+    for offset in arrival_offsets(rate, arrival, rng):
+        due = start + offset
+        if due >= deadline or (max_requests is not None and sent >= max_requests):
+            break
+        delay = due - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        template, path = mix.next()
+        task = asyncio.ensure_future(send(pool, recorder, template, path, due))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        sent += 1
+    if in_flight:
+        await asyncio.gather(*in_flight)
+    return sent
+
+
+def ramp_rates(spec):
+    """START:STOP:STEP, where a STEP like x1.5 multiplies instead of adds."""
+    try:
+        start, stop, step = spec.split(':')
+        start, stop = float(start), float(stop)
+        factor = float(step[1:]) if step.startswith('x') else None
+        increment = None if factor else float(step)
+    except ValueError:
+        raise SystemExit('bad --ramp %r, expected START:STOP:STEP or START:STOP:xFACTOR' % spec)
+    if start <= 0 or stop < start or (factor is not None and factor <= 1) or (increment is not None and increment <= 0):
+        raise SystemExit('bad --ramp %r, rates must be positive and increasing' % spec)
+    rates = []
+    rate = start
+    while rate <= stop * 1.0001:
+        rates.append(rate)
+        rate = rate * factor if factor else rate + increment
+    return rates
+
+
+def saturation(step, baseline, knee_factor, max_error_rate):
+    """Why a ramp step counts as past the knee, or None while the server keeps up."""
+    total = step['summary']['total']
+    if total['requests'] and total['errors'] / total['requests'] > max_error_rate:
+        return 'error rate %.1f%%' % (100.0 * total['errors'] / total['requests'])
+    if step['achieved_rps'] < 0.9 * step['rate']:
+        return 'throughput %.1f/s of %.1f/s offered' % (step['achieved_rps'], step['rate'])
+    p99 = total['percentiles_ms']['99']
+    if baseline and p99 > knee_factor * baseline:
+        return 'p99 %.1fms over %gx the %.1fms at the lowest rate' % (p99, knee_factor, baseline)
+    return None
+
+
+async def run_ramp(pool, mix, rates, step_duration, arrival, rng, knee_factor, max_error_rate, out=sys.stderr):
+    """Raises the open loop rate step by step until the server saturates."""
+    steps = []
+    baseline = None
+    knee = None
+    print('%10s %10s %7s %9s %9s %9s %9s' % ('rate', 'achieved', 'errors', 'p50', 'p99', 'p99.9', 'max'), file=out)
+    for rate in rates:
+        start = time.monotonic()
+        recorder = Recorder()
+        await run_open(pool, mix, recorder, rate, arrival, start, start + step_duration, rng)
+        summary = summarize(recorder)
+        total = summary['total']
+        step = {
+            'rate': rate,
+            'achieved_rps': (total['requests'] - total['errors']) / step_duration,
+            'summary': summary,
+        }
+        if baseline is None:
+            baseline = total['percentiles_ms']['99']
+        step['saturated'] = saturation(step, baseline, knee_factor, max_error_rate)
+        steps.append(step)
+        p = total['percentiles_ms']
+        print('%10.1f %10.1f %7d %9.1f %9.1f %9.1f %9.1f  %s' % (
+            rate, step['achieved_rps'], total['errors'], p['50'], p['99'], p['99.9'], total['max_ms'],
+            step['saturated'] or ''), file=out)
+        if step['saturated']:
+            knee = steps[-2] if len(steps) > 1 else None
+            break
+    else:
+        knee = steps[-1] if steps else None
+    return {'steps': steps, 'knee': knee, 'saturated': bool(steps and steps[-1]['saturated'])}
+
+
+def _ms(micros):
+    return micros / 1000.0
+
+
+def summarize(recorder):
+    """Per-endpoint and total numbers, latencies in milliseconds."""
+    elapsed = recorder.elapsed or 1e-9
+
+    def row(stats):
+        latency = stats.latency
+        return {
+            'requests': latency.count,
+            'rps': latency.count / elapsed,
+            'errors': stats.errors,
+            'statuses': {str(k): v for k, v in sorted(stats.statuses.items(), key=str)},
+            'mean_ms': _ms(latency.mean),
+            'max_ms': _ms(latency.max),
+            'percentiles_ms': {str(p): _ms(latency.percentile(p)) for p in REPORT_PERCENTILES},
+            'service_percentiles_ms': {str(p): _ms(stats.service.percentile(p)) for p in REPORT_PERCENTILES},
+            'mean_bytes': stats.bytes / latency.count if latency.count else 0,
+            'cache_hit_ratio': stats.hit_ratio,
+        }
+
+    return {
+        'elapsed_seconds': recorder.elapsed,
+        'endpoints': {template: row(stats) for template, stats in sorted(recorder.endpoints.items())},
+        'total': row(recorder.total()),
+    }
+
+
+def print_summary(summary, open_loop=False, out=sys.stdout):
+    header = '%-44s %8s %8s %6s %9s %9s %9s %9s %9s %9s %6s' % (
+        'endpoint', 'requests', 'req/s', 'errors', 'mean', 'p50', 'p95', 'p99', 'p99.9', 'max', 'hit%')
+    print(header, file=out)
+    print('-' * len(header), file=out)
+    rows = list(summary['endpoints'].items()) + [('total', summary['total'])]
+    for name, row in rows:
+        p = row['percentiles_ms']
+        hit_ratio = row['cache_hit_ratio']
+        print('%-44s %8d %8.1f %6d %9.1f %9.1f %9.1f %9.1f %9.1f %9.1f %6s' % (
+            name[:44], row['requests'], row['rps'], row['errors'], row['mean_ms'],
+            p['50'], p['95'], p['99'], p['99.9'], row['max_ms'],
+            '-' if hit_ratio is None else '%.0f' % (100 * hit_ratio)), file=out)
+    print('(latencies in ms over %.1fs)' % summary['elapsed_seconds'], file=out)
+    if open_loop:
+        service = summary['total']['service_percentiles_ms']
+        print('(from the actual send instead of the due time: p50 %.1f, p99 %.1f, p99.9 %.1f)' % (
+            service['50'], service['99'], service['99.9']), file=out)
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the query server with a weighted endpoint mix.')
+    parser.add_argument('--server', default=DEFAULT_SERVER,
+                        help='base URL (default: $TESTS_SERVER_ADDRESS or %(default)s)')
+    parser.add_argument('--mix', default='default',
+                        help='one of %s, or a JSON file of [weight, template] pairs' % ', '.join(sorted(MIXES)))
+    parser.add_argument('--list-mixes', action='store_true', help='print the built-in mixes and exit')
+    parser.add_argument('--concurrency', type=int, default=16,
+                        help='requests in flight, one kept-alive connection each (default: %(default)s)')
+    parser.add_argument('--duration', type=float, default=30.0,
+                        help='seconds to run, after warm-up (default: %(default)s)')
+    parser.add_argument('--requests', type=int, default=None,
+                        help='stop after this many requests instead of at --duration')
+    parser.add_argument('--warmup', type=float, default=5.0,
+                        help='seconds of load before recording starts (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=30.0,
+                        help='per request timeout in seconds (default: %(default)s)')
+    parser.add_argument('--header', '-H', action='append', default=[], metavar='NAME:VALUE',
+                        help='extra request header, can be repeated')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the endpoint and id choice')
+    parser.add_argument('--json', metavar='PATH', help='also write the summary as JSON')
+
+    open_loop = parser.add_argument_group('open loop')
+    open_loop.add_argument('--rate', type=float, default=None,
+                           help='send this many requests per second whatever the server does, '
+                                'instead of --concurrency clients')
+    open_loop.add_argument('--arrival', choices=('poisson', 'constant'), default='poisson',
+                           help='gaps between requests (default: %(default)s)')
+    open_loop.add_argument('--max-connections', type=int, default=256,
+                           help='connections opened at most, later requests queue for one (default: %(default)s)')
+    open_loop.add_argument('--ramp', metavar='START:STOP:STEP',
+                           help='step the rate up, e.g. 10:400:10 or 5:1000:x1.5, until the server saturates')
+    open_loop.add_argument('--step-duration', type=float, default=20.0,
+                           help='seconds per ramp step (default: %(default)s)')
+    open_loop.add_argument('--knee-factor', type=float, default=3.0,
+                           help='a step saturates when its p99 is this many times the first step\'s '
+                                '(default: %(default)s)')
+    open_loop.add_argument('--max-error-rate', type=float, default=0.01,
+                           help='or when more than this fraction of requests fail (default: %(default)s)')
+    return parser.parse_args(argv)
+
+
+def _headers(values):
+    headers = {}
+    for value in values:
+        name, sep, content = value.partition(':')
+        if not sep:
+            raise SystemExit('bad --header %r, expected NAME:VALUE' % value)
+        headers[name.strip()] = content.strip()
+    return headers
+
+
+async def _main(args):
+    open_loop = args.rate is not None or args.ramp is not None
+    connections = args.max_connections if open_loop else args.concurrency
+    pool = ConnectionPool(args.server, connections, args.timeout, _headers(args.header))
+    rng = random.Random(args.seed)
+    try:
+        fixtures = await load_fixtures(pool)
+        mix = Mix(load_mix(args.mix), fixtures, rng)
+        if args.ramp:
+            rates = ramp_rates(args.ramp)
+            print('Ramping %s: mix %s, %s arrivals from %g to %g req/s, %gs per step' % (
+                args.server, args.mix, args.arrival, rates[0], rates[-1], args.step_duration), file=sys.stderr)
+            if args.warmup:
+                now = time.monotonic()
+                await run_open(pool, mix, Recorder(), rates[0], args.arrival, now, now + args.warmup, rng)
+            return {'ramp': await run_ramp(pool, mix, rates, args.step_duration, args.arrival, rng,
+                                           args.knee_factor, args.max_error_rate)}
+
+        if args.rate is not None:
+            print('Benchmarking %s: mix %s, %d templates, %s arrivals at %g req/s' % (
+                args.server, args.mix, len(mix.templates), args.arrival, args.rate), file=sys.stderr)
+        else:
+            print('Benchmarking %s: mix %s, %d templates, concurrency %d' % (
+                args.server, args.mix, len(mix.templates), args.concurrency), file=sys.stderr)
+
+        now = time.monotonic()
+        recorder = Recorder(warmup_until=now + args.warmup)
+        deadline = now + args.warmup + args.duration
+        if args.requests is not None:
+            deadline = float('inf')
+        if args.rate is not None:
+            await run_open(pool, mix, recorder, args.rate, args.arrival, now, deadline, rng, args.requests)
+        else:
+            await run_closed(pool, mix, recorder, args.concurrency, deadline, args.requests)
+    finally:
+        pool.close()
+    return summarize(recorder)
+
+
+def print_ramp(ramp, out=sys.stdout):
+    knee = ramp['knee']
+    last = ramp['steps'][-1]
+    if not ramp['saturated']:
+        print('No saturation up to %.1f req/s (p99 %.1fms)' % (
+            last['rate'], last['summary']['total']['percentiles_ms']['99']), file=out)
+    elif knee is None:
+        print('Saturated already at %.1f req/s: %s' % (last['rate'], last['saturated']), file=out)
+    else:
+        print('Saturation knee at about %.1f req/s (p99 %.1fms), at %.1f req/s: %s' % (
+            knee['rate'], knee['summary']['total']['percentiles_ms']['99'], last['rate'], last['saturated']),
+            file=out)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    if args.list_mixes:
+        for name, entries in sorted(MIXES.items()):
+            print('%s:' % name)
+            for weight, template in entries:
+                print('  %4g  %s' % (weight, template))
+        return 0
+    if args.requests is not None:
+        # a request count is exact, warm-up would eat into it
+        args.warmup = 0.0
+    if args.rate is not None and args.rate <= 0:
+        raise SystemExit('--rate must be positive')
+
+    result = asyncio.run(_main(args))
+    if 'ramp' in result:
+        print_ramp(result['ramp'])
+        ok = bool(result['ramp']['steps'])
+    else:
+        print_summary(result, open_loop=args.rate is not None)
+        ok = result['total']['requests'] > 0
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+# jsinfo/tests/query_endpoints/budgets.py
+#
+# Latency and payload budgets for the query endpoints, checked by
+# run_tests.py --budgets budgets.json after the tests have run.
+#
+# budgets.json maps route templates to limits:
+#
+#   {
+#     "samples": 10,
+#     "defaults": {"p95_ms": 1500, "max_ms": 5000, "max_bytes": 2000000},
+#     "routes": {
+#       "/indexChartsV3": {"p95_ms": 800},
+#       "/providerRewards/{provider}": {"max_bytes": 500000}
+#     }
+#   }
+#
+# Every route is requested `samples` times, with {provider}, {consumer} and
+# {spec} filled from the shared fixture lists. A route fails when the p95 or
+# the slowest of its samples, or its largest body, is over the limit. Any
+# limit can be left out or set to null to not check it.
+
+import json
+import random
+import time
+
+from bench import FIXTURES, fixture_ids
+
+BUDGET_LIMITS = ('p95_ms', 'max_ms', 'max_bytes')
+DEFAULT_SAMPLES = 10
+
+
+class Budget:
+    """The limits for one route template."""
+
+    def __init__(self, route, samples, p95_ms=None, max_ms=None, max_bytes=None):
+        self.route = route
+        self.samples = samples
+        self.p95_ms = p95_ms
+        self.max_ms = max_ms
+        self.max_bytes = max_bytes
+
+
+class Measurement:
+    """What sampling one route gave."""
+
+    def __init__(self, route):
+        self.route = route
+        self.latencies_ms = []
+        self.sizes = []
+        self.statuses = []
+        self.urls = []
+        self.error = None
+
+    @property
+    def p95_ms(self):
+        return percentile(self.latencies_ms, 95)
+
+    @property
+    def max_ms(self):
+        return max(self.latencies_ms, default=0.0)
+
+    @property
+    def max_bytes(self):
+        return max(self.sizes, default=0)
+
+
+def load_budgets(path):
+    """Returns the budgets of a budget file, route defaults applied."""
+    with open(path) as f:
+        config = json.load(f)
+    defaults = config.get('defaults', {})
+    samples = int(config.get('samples', DEFAULT_SAMPLES))
+    budgets = []
+    for route, limits in config.get('routes', {}).items():
+        unknown = set(limits) - set(BUDGET_LIMITS) - {'samples'}
+        if unknown:
+            raise ValueError('%s: unknown budget keys %s' % (route, ', '.join(sorted(unknown))))
+        merged = dict(defaults, **limits)
+        budgets.append(Budget(route, int(merged.pop('samples', samples)),
+                              **{key: merged.get(key) for key in BUDGET_LIMITS}))
+    return budgets
+
+
+def percentile(values, percent):
+    """Linear interpolation between the closest ranks, like numpy's default."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * percent / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def load_fixture_ids(get, server_address):
+    """{placeholder: ids} from the /providers, /consumers and /specs lists."""
+    fixtures = {}
+    for name, path, list_key, id_key in FIXTURES:
+        response = get(server_address.rstrip('/') + path)
+        if response.status_code == 200:
+            fixtures[name] = fixture_ids(response.json().get(list_key), id_key)
+    return fixtures
+
+
+def measure(get, server_address, budget, fixtures, rng=None):
+    """Requests the route `budget.samples` times, one after the other."""
+    rng = rng or random.Random()
+    measurement = Measurement(budget.route)
+    for _ in range(budget.samples):
+        try:
+            values = {name: rng.choice(ids) for name, ids in fixtures.items() if ids}
+            url = server_address.rstrip('/') + budget.route.format(**values)
+        except KeyError as e:
+            measurement.error = 'no ids for {%s}' % e.args[0]
+            return measurement
+        started = time.monotonic()
+        try:
+            response = get(url)
+            body = response.content
+        except Exception as e:
+            measurement.error = '%s: %r' % (url, e)
+            return measurement
+        measurement.latencies_ms.append((time.monotonic() - started) * 1000.0)
+        measurement.sizes.append(len(body))
+        measurement.statuses.append(response.status_code)
+        measurement.urls.append(url)
+    return measurement
+
+
+def violations(budget, measurement):
+    """(limit name, budget, actual) for every limit the measurement is over."""
+    over = []
+    if measurement.error:
+        return [('error', None, measurement.error)]
+    # a 404 or 400 (a stale fixture id, a renamed route) must not pass on the time of its error body
+    failed = [status for status in measurement.statuses if status != 200]
+    if failed:
+        over.append(('status', '== 200', '%d of %d samples: %s' % (
+            len(failed), len(measurement.statuses), sorted(set(failed)))))
+    for limit in BUDGET_LIMITS:
+        allowed = getattr(budget, limit)
+        actual = getattr(measurement, limit)
+        if allowed is not None and actual > allowed:
+            over.append((limit, allowed, actual))
+    return over
+
+
+def _format_value(limit, value):
+    if limit.endswith('_ms'):
+        return '%.0fms' % value
+    if limit.endswith('_bytes'):
+        return '%d bytes' % value
+    return str(value)
+
+
+def format_diff(budget, measurement, over):
+    """A few lines saying what went over, for the test log and the JUnit report."""
+    lines = ['%s: over budget (%d samples)' % (budget.route, len(measurement.latencies_ms))]
+    for limit, allowed, actual in over:
+        if limit in BUDGET_LIMITS:
+            lines.append('  %-10s budget %12s  actual %12s  (+%.0f%%)' % (
+                limit, _format_value(limit, allowed), _format_value(limit, actual),
+                100.0 * (actual - allowed) / allowed if allowed else 0.0))
+        else:
+            lines.append('  %-10s %s' % (limit, actual))
+    if measurement.latencies_ms:
+        slowest = max(range(len(measurement.latencies_ms)), key=measurement.latencies_ms.__getitem__)
+        lines.append('  slowest    %s (%.0fms, %d bytes, status %d)' % (
+            measurement.urls[slowest], measurement.latencies_ms[slowest],
+            measurement.sizes[slowest], measurement.statuses[slowest]))
+    return '\n'.join(lines)
+
+
+def format_summary(budget, measurement):
+    return '%s: p95 %.0fms, max %.0fms, %d bytes' % (
+        budget.route, measurement.p95_ms, measurement.max_ms, measurement.max_bytes)
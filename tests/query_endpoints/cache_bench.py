@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+# jsinfo/tests/query_endpoints/cache_bench.py
+#
+# Cold versus warm timing of the query server's redis cache. For every route
+# the cache key is deleted, the route is requested once cold and then a few
+# times warm, for a number of rounds:
+#
+#   JSINFO_QUERY_CACHE_DEBUG_HEADERS=true bun run dist/src/query.js   # against a local redis
+#   python3 cache_bench.py --server http://localhost:8081 --redis redis://localhost:6379 --rounds 5
+#
+# The server reports what its cache did in response headers (see
+# WriteCacheHeadersToFastifyReply): X-Jsinfo-Cache hit/miss, the redis lookup
+# and compute times, and with JSINFO_QUERY_CACHE_DEBUG_HEADERS the key this
+# script deletes. Point --redis at every write redis of the server
+# (JSINFO_QUERY_REDDIS_CACHE*), and never at a shared production one.
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+from bench import DEFAULT_SERVER, ConnectionPool, LatencyHistogram, load_fixtures
+from redis_client import RedisClient
+
+KEY_HEADER = 'x-jsinfo-cache-key'
+STATUS_HEADER = 'x-jsinfo-cache'
+LOOKUP_HEADER = 'x-jsinfo-cache-lookup-ms'
+COMPUTE_HEADER = 'x-jsinfo-compute-ms'
+
+# routes served through RequestHandlerBase or RegisterRedisBackedHandler
+CACHE_ROUTES = (
+    '/providerHealth/{provider}',
+    '/providerErrors/{provider}',
+    '/providerStakes/{provider}',
+    '/providerEvents/{provider}',
+    '/providerRewards/{provider}',
+    '/providerReports/{provider}',
+    '/providerBlockReports/{provider}',
+    '/item-count/providerRewards/{provider}',
+    '/providerHealthCsv/{provider}',
+    '/providerEventsCsv/{provider}',
+    '/providerRewardsCsv/{provider}',
+    '/providerReportsCsv/{provider}',
+    '/consumerEvents/{consumer}',
+    '/consumerSubscriptions/{consumer}',
+    '/eventsEvents',
+    '/eventsRewards',
+    '/eventsReports',
+    '/eventsEventsCsv',
+    '/eventsRewardsCsv',
+    '/eventsReportsCsv',
+)
+
+
+class RouteResult:
+    """Cold and warm samples of one route."""
+
+    def __init__(self, route, path):
+        self.route = route
+        self.path = path
+        self.key = None
+        self.skipped = None
+        self.cold = LatencyHistogram()
+        self.warm = LatencyHistogram()
+        self.cold_misses = 0
+        self.warm_hits = 0
+        self.compute_ms = []
+        self.lookup_ms = []
+        self.errors = 0
+
+    def row(self):
+        cold_p50 = self.cold.percentile(50) / 1000.0
+        warm_p50 = self.warm.percentile(50) / 1000.0
+        return {
+            'route': self.route,
+            'path': self.path,
+            'key': self.key,
+            'skipped': self.skipped,
+            'cold_requests': self.cold.count,
+            'warm_requests': self.warm.count,
+            'cold_p50_ms': cold_p50,
+            'cold_max_ms': self.cold.max / 1000.0,
+            'warm_p50_ms': warm_p50,
+            'warm_p95_ms': self.warm.percentile(95) / 1000.0,
+            'speedup': cold_p50 / warm_p50 if warm_p50 else None,
+            'compute_ms': sum(self.compute_ms) / len(self.compute_ms) if self.compute_ms else None,
+            'lookup_ms': sum(self.lookup_ms) / len(self.lookup_ms) if self.lookup_ms else None,
+            'cold_miss_ratio': self.cold_misses / self.cold.count if self.cold.count else None,
+            'warm_hit_ratio': self.warm_hits / self.warm.count if self.warm.count else None,
+            'errors': self.errors,
+        }
+
+
+def _float_header(headers, name):
+    try:
+        return float(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
+async def _timed_get(pool, path):
+    started = time.monotonic()
+    status, headers, body = await pool.get(path)
+    return status, headers, (time.monotonic() - started) * 1e6
+
+
+async def bench_route(pool, redis_clients, route, path, rounds, warm, settle):
+    result = RouteResult(route, path)
+    status, headers, _ = await _timed_get(pool, path)
+    if status != 200:
+        result.skipped = 'status %d' % status
+        return result
+    if STATUS_HEADER not in headers:
+        result.skipped = 'no %s header, not a redis backed route' % STATUS_HEADER
+        return result
+    result.key = headers.get(KEY_HEADER)
+    if not result.key:
+        result.skipped = 'no %s header, start the server with JSINFO_QUERY_CACHE_DEBUG_HEADERS=true' % KEY_HEADER
+        return result
+
+    for _ in range(rounds):
+        await asyncio.gather(*(client.command('DEL', result.key) for client in redis_clients))
+        status, headers, micros = await _timed_get(pool, path)
+        if status != 200:
+            result.errors += 1
+            continue
+        result.cold.record(micros)
+        result.cold_misses += headers.get(STATUS_HEADER) == 'miss'
+        compute = _float_header(headers, COMPUTE_HEADER)
+        if compute is not None:
+            result.compute_ms.append(compute)
+
+        # some handlers write the cache without waiting for it
+        await asyncio.sleep(settle)
+        for _ in range(warm):
+            status, headers, micros = await _timed_get(pool, path)
+            if status != 200:
+                result.errors += 1
+                continue
+            result.warm.record(micros)
+            result.warm_hits += headers.get(STATUS_HEADER) == 'hit'
+            lookup = _float_header(headers, LOOKUP_HEADER)
+            if lookup is not None:
+                result.lookup_ms.append(lookup)
+    return result
+
+
+def print_results(rows, out=sys.stdout):
+    header = '%-40s %9s %9s %9s %9s %8s %9s %8s %6s %6s' % (
+        'route', 'cold p50', 'cold max', 'warm p50', 'warm p95', 'speedup', 'compute', 'lookup', 'miss%', 'hit%')
+    print(header, file=out)
+    print('-' * len(header), file=out)
+
+    def fmt(value, pattern='%.1f'):
+        return '-' if value is None else pattern % value
+
+    for row in rows:
+        if row['skipped']:
+            print('%-40s skipped: %s' % (row['route'][:40], row['skipped']), file=out)
+            continue
+        print('%-40s %9.1f %9.1f %9.1f %9.1f %8s %9s %8s %6s %6s' % (
+            row['route'][:40], row['cold_p50_ms'], row['cold_max_ms'], row['warm_p50_ms'], row['warm_p95_ms'],
+            fmt(row['speedup'], '%.1fx'), fmt(row['compute_ms']), fmt(row['lookup_ms']),
+            fmt(row['cold_miss_ratio'] and 100 * row['cold_miss_ratio'], '%.0f'),
+            fmt(row['warm_hit_ratio'] and 100 * row['warm_hit_ratio'], '%.0f')), file=out)
+    print('(ms; compute is the server side time of a miss, lookup the redis read of a hit)', file=out)
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Time the query server with its redis cache cold and warm.')
+    parser.add_argument('--server', default=DEFAULT_SERVER,
+                        help='base URL (default: $TESTS_SERVER_ADDRESS or %(default)s)')
+    parser.add_argument('--redis', action='append', required=True, metavar='URL',
+                        help='redis the server caches in, repeat for every write redis')
+    parser.add_argument('--route', action='append', default=[],
+                        help='route template to time, can be repeated (default: the redis backed routes)')
+    parser.add_argument('--rounds', type=int, default=5,
+                        help='cold requests per route, each after deleting the key (default: %(default)s)')
+    parser.add_argument('--warm', type=int, default=5,
+                        help='warm requests after each cold one (default: %(default)s)')
+    parser.add_argument('--settle', type=float, default=0.2,
+                        help='seconds between the cold request and the warm ones (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=60.0,
+                        help='per request timeout in seconds (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the provider and consumer choice')
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    return parser.parse_args(argv)
+
+
+async def _main(args):
+    pool = ConnectionPool(args.server, 1, args.timeout)
+    redis_clients = [await RedisClient.connect(url) for url in args.redis]
+    rng = random.Random(args.seed)
+    try:
+        fixtures = await load_fixtures(pool)
+        rows = []
+        for route in args.route or CACHE_ROUTES:
+            try:
+                # one id per route, so every round hits the same key
+                path = route.format(**{name: rng.choice(ids) for name, ids in fixtures.items() if ids})
+            except KeyError as e:
+                rows.append(RouteResult(route, None).row() | {'skipped': 'no ids for {%s}' % e.args[0]})
+                continue
+            result = await bench_route(pool, redis_clients, route, path, args.rounds, args.warm, args.settle)
+            rows.append(result.row())
+            print('%s: %s' % (path, result.skipped or 'done'), file=sys.stderr)
+        return rows
+    finally:
+        pool.close()
+        for client in redis_clients:
+            client.close()
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    rows = asyncio.run(_main(args))
+    print_results(rows)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+    return 0 if any(not row['skipped'] for row in rows) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
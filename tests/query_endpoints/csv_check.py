@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+# jsinfo/tests/query_endpoints/csv_check.py
+#
+# Streaming check of the CSV exports. The body is read in chunks and every
+# row's column count is checked against the header as it arrives, so a large
+# export is never held in memory. Each export reports its time to first byte,
+# size and MB/s:
+#
+#   python3 csv_check.py --server http://localhost:8081 --providers 3
+#   python3 csv_check.py --export /providerRewardsCsv/{provider} --json /tmp/csv.json
+#
+# The tests in tests/*_csv_endpoints.py use check_csv_export() the same way.
+# When the first byte arrives only just before the last one, the server built
+# the whole file before sending it (ConvertRecordsToCsv does today); a
+# streaming export would show a small ttfb% on the large files.
+
+import argparse
+import json
+import random
+import sys
+import time
+
+import requests
+
+from bench import DEFAULT_SERVER, fixture_ids
+
+CHUNK_SIZE = 64 * 1024
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BAD_ROWS = 5
+UNAVAILABLE = 'Data is unavailable now'
+
+# export template: the header line it starts with
+CSV_EXPORTS = {
+    '/providerHealthCsv/{provider}': 'time,chain,interface,status,region,message',
+    '/providerErrorsCsv/{provider}': 'date,chain,error',
+    '/providerStakesCsv/{provider}': '"Spec","Status","Geolocation","Addons","Extensions","Self Stake","Total Stake","Delegate Total","Delegate Commission"',
+    '/providerEventsCsv/{provider}': '"Event Type","Block Height","Time","Text1","Text2","Text3","BigInt1","BigInt2","BigInt2","Int1","Int2","Int3"',
+    '/providerRewardsCsv/{provider}': '"Spec","Block","Time","Consumer","Relays","CU","QoS","Excellence"',
+    '/providerReportsCsv/{provider}': '"Block","Time","CU","Disconnections","Errors","Project","Chain ID"',
+    '/providerDelegatorRewardsCsv/{provider}': 'time,chain,amount',
+    '/providerBlockReportsCsv/{provider}': 'time,blockId,tx,chainId,chainBlockHeight',
+    '/eventsEventsCsv': None,
+    '/eventsRewardsCsv': None,
+    '/eventsReportsCsv': None,
+}
+
+
+class CsvStreamValidator:
+    """Counts the fields of every CSV record as chunks are fed in.
+
+    Only the header is kept. Quotes are tracked across chunk boundaries, so
+    commas and newlines inside quoted fields do not split a record; a doubled
+    quote inside a quoted field toggles twice and changes nothing. The bytes
+    that matter are ASCII, so UTF-8 bodies are scanned without decoding.
+    """
+
+    def __init__(self):
+        self.header = None
+        self.columns = None
+        self.rows = 0
+        self.bad_rows = 0
+        self.bad_row_samples = []  # (row number, field count)
+        self.bytes = 0
+        self._header_bytes = bytearray()
+        self._in_quotes = False
+        self._fields = 1
+        self._record_empty = True
+
+    def feed(self, chunk):
+        self.bytes += len(chunk)
+        # the segments between quotes alternate between outside and inside a quoted field
+        segments = chunk.split(b'"')
+        if self.header is None:
+            self._feed_header(segments)
+            return
+
+        # quoted text is dropped, a pair of quotes stands in for it so the line is not empty
+        started_in_quotes = self._in_quotes
+        outside = segments[1::2] if started_in_quotes else segments[0::2]
+        if (len(segments) - 1) % 2:
+            self._in_quotes = not self._in_quotes
+        text = b'""'.join(outside)
+        if started_in_quotes and len(segments) > 1:
+            text = b'"' + text
+        if self._in_quotes and len(segments) > 1:
+            text += b'"'
+        lines = text.split(b'\n')
+
+        self._fields += lines[0].count(b',')
+        if lines[0].strip(b'\r'):
+            self._record_empty = False
+        if len(lines) == 1:
+            return
+        self._end_record()
+
+        for line in lines[1:-1]:
+            if not line.strip(b'\r'):
+                continue
+            self.rows += 1
+            fields = line.count(b',') + 1
+            if fields != self.columns:
+                self._bad_row(fields)
+
+        self._fields = lines[-1].count(b',') + 1
+        self._record_empty = not lines[-1].strip(b'\r')
+
+    def _feed_header(self, segments):
+        """Segment by segment until the header has ended, the header is the only text kept."""
+        for index, segment in enumerate(segments):
+            if index:
+                self._in_quotes = not self._in_quotes
+                self._record_empty = False
+                if self.header is None:
+                    self._header_bytes += b'"'
+            if self._in_quotes:
+                if self.header is None:
+                    self._header_bytes += segment
+                continue
+            for line_index, line in enumerate(segment.split(b'\n')):
+                if line_index:
+                    self._end_record()
+                if line.strip(b'\r'):
+                    self._record_empty = False
+                self._fields += line.count(b',')
+                if self.header is None:
+                    self._header_bytes += line
+                    if len(self._header_bytes) > MAX_HEADER_BYTES:
+                        raise ValueError('no end of the CSV header in the first %d bytes' % MAX_HEADER_BYTES)
+
+    def close(self):
+        """Ends the last record when the body has no trailing newline."""
+        if not self._record_empty or self._fields > 1:
+            self._end_record()
+        if self._in_quotes:
+            self.bad_rows += 1
+            self.bad_row_samples.append((self.rows + 1, 'unterminated quote'))
+
+    def _end_record(self):
+        fields, empty = self._fields, self._record_empty
+        self._fields, self._record_empty = 1, True
+        if self.header is None:
+            self.header = self._header_bytes.decode('utf-8', 'replace').rstrip('\r')
+            self._header_bytes = None
+            self.columns = fields
+            return
+        if empty and fields == 1:
+            return
+        self.rows += 1
+        if fields != self.columns:
+            self._bad_row(fields)
+
+    def _bad_row(self, fields):
+        self.bad_rows += 1
+        if len(self.bad_row_samples) < MAX_BAD_ROWS:
+            self.bad_row_samples.append((self.rows, fields))
+
+
+class CsvExportReport:
+    """What downloading one export gave."""
+
+    def __init__(self, url):
+        self.url = url
+        self.status = None
+        self.headers_ms = None
+        self.ttfb_ms = None
+        self.total_ms = None
+        self.validator = CsvStreamValidator()
+        self.unavailable = False
+        self.error = None
+
+    @property
+    def mb_per_s(self):
+        """Over the whole request, time to first byte included."""
+        return self.validator.bytes / 1e3 / self.total_ms if self.total_ms else None
+
+    def problems(self, expected_header=None):
+        """What is wrong with the export, an empty list when nothing is."""
+        if self.error:
+            return [self.error]
+        if self.status != 200:
+            return ['status %s' % self.status]
+        if self.unavailable:
+            return []
+        problems = []
+        if expected_header is not None and self.validator.header != expected_header:
+            problems.append('header mismatch:\nExpected: %s\nActual: %s' % (expected_header, self.validator.header))
+        if self.validator.bad_rows:
+            problems.append('%d rows without %d columns, first ones (row, columns): %s' % (
+                self.validator.bad_rows, self.validator.columns, self.validator.bad_row_samples))
+        return problems
+
+    def summary(self):
+        if self.error or self.status != 200:
+            return '%s: %s' % (self.url, self.error or 'status %s' % self.status)
+        if self.unavailable:
+            return '%s: %s' % (self.url, UNAVAILABLE)
+        return '%s: %d rows x %d columns, %d bytes, ttfb %.0fms, total %.0fms, %s MB/s' % (
+            self.url, self.validator.rows, self.validator.columns or 0, self.validator.bytes,
+            self.ttfb_ms, self.total_ms, '-' if self.mb_per_s is None else '%.1f' % self.mb_per_s)
+
+    def row(self, expected_header=None):
+        return {
+            'url': self.url,
+            'status': self.status,
+            'unavailable': self.unavailable,
+            'header': self.validator.header,
+            'columns': self.validator.columns,
+            'rows': self.validator.rows,
+            'bad_rows': self.validator.bad_rows,
+            'bytes': self.validator.bytes,
+            'headers_ms': self.headers_ms,
+            'ttfb_ms': self.ttfb_ms,
+            'total_ms': self.total_ms,
+            'mb_per_s': self.mb_per_s,
+            'problems': self.problems(expected_header),
+        }
+
+
+def check_csv_export(get, url, chunk_size=CHUNK_SIZE):
+    """Downloads url through `get` (requests.get or a session's) as a stream, checking it as it comes."""
+    report = CsvExportReport(url)
+    started = time.monotonic()
+    try:
+        with get(url, stream=True) as response:
+            report.headers_ms = (time.monotonic() - started) * 1000.0
+            report.status = response.status_code
+            if response.status_code != 200:
+                return report
+            first = True
+            for chunk in response.iter_content(chunk_size):
+                if first:
+                    report.ttfb_ms = (time.monotonic() - started) * 1000.0
+                    first = False
+                    if chunk.startswith(UNAVAILABLE.encode()):
+                        report.unavailable = True
+                report.validator.feed(chunk)
+            report.validator.close()
+    except Exception as e:
+        report.error = '%r' % e
+        return report
+    report.total_ms = (time.monotonic() - started) * 1000.0
+    if report.ttfb_ms is None:
+        report.ttfb_ms = report.total_ms
+    return report
+
+
+def _fmt(value, pattern='%.1f'):
+    return '-' if value is None else pattern % value
+
+
+def print_results(rows, out=sys.stdout):
+    header = '%-60s %7s %8s %12s %9s %9s %5s %7s  %s' % (
+        'export', 'rows', 'columns', 'bytes', 'ttfb ms', 'total ms', 'ttfb%', 'MB/s', '')
+    print(header, file=out)
+    print('-' * len(header), file=out)
+    for row in rows:
+        if row['unavailable'] or row['status'] != 200:
+            print('%-60s %s' % (row['url'][-60:], row['problems'][0] if row['problems'] else UNAVAILABLE), file=out)
+            continue
+        print('%-60s %7d %8s %12d %9s %9s %5s %7s  %s' % (
+            row['url'][-60:], row['rows'], _fmt(row['columns'], '%d'), row['bytes'],
+            _fmt(row['ttfb_ms']), _fmt(row['total_ms']),
+            _fmt(100.0 * row['ttfb_ms'] / row['total_ms'] if row['total_ms'] else None, '%.0f'),
+            _fmt(row['mb_per_s']), 'FAIL' if row['problems'] else ''), file=out)
+    print('(ttfb%: share of the download spent before the first byte, near 100 means the file was built before sending)', file=out)
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Download the CSV exports as streams and check every row.')
+    parser.add_argument('--server', default=DEFAULT_SERVER,
+                        help='base URL (default: $TESTS_SERVER_ADDRESS or %(default)s)')
+    parser.add_argument('--export', action='append', default=[],
+                        help='export template to check, can be repeated (default: all of them)')
+    parser.add_argument('--providers', type=int, default=3,
+                        help='random providers to fill {provider} with (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the provider choice')
+    parser.add_argument('--timeout', type=float, default=300.0,
+                        help='per request timeout in seconds (default: %(default)s)')
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    server = args.server.rstrip('/')
+    session = requests.Session()
+
+    def get(url, **kwargs):
+        return session.get(url, timeout=args.timeout, **kwargs)
+
+    exports = args.export or list(CSV_EXPORTS)
+    providers = []
+    if any('{provider}' in export for export in exports):
+        providers = fixture_ids(get(server + '/providers').json().get('providers'), 'address')
+        providers = random.Random(args.seed).sample(providers, min(args.providers, len(providers)))
+
+    rows = []
+    for export in exports:
+        for provider in providers if '{provider}' in export else [None]:
+            report = check_csv_export(get, server + export.format(provider=provider))
+            rows.append(report.row(CSV_EXPORTS.get(export)))
+            print(report.summary(), file=sys.stderr)
+
+    print_results(rows)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+    return 1 if any(row['problems'] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+# jsinfo/tests/query_endpoints/pagination_bench.py
+#
+# Deep pagination crawl of the paginated provider tabs. For the providers with
+# the most rows it walks every page of a route for each sort key, records the
+# latency of every page and fits it against the page number, to show which
+# sort keys get slower the deeper the page:
+#
+#   python3 pagination_bench.py --server http://localhost:8081 --providers 3
+#   python3 pagination_bench.py --route providerRewards --sort-key blocks.datetime --mode both --plot
+#
+# With ?pagination=<sortKey>,<dir>,<page>,<count> postgres reads and throws
+# away every row before the page, so an offset crawl is expected to grow about
+# linearly. --mode cursor pages the same sort keys with ?cursor= (see
+# KeysetCondition in queryPagination.ts), which should stay flat; --check fails
+# the run when a cursor crawl does not.
+#
+# Page requests are sent one at a time so the crawl does not compete with
+# itself. Run it against a server whose redis cache is cold for these pages or
+# the hit% column will say the numbers are redis reads.
+
+import argparse
+import asyncio
+import json
+import math
+import statistics
+import sys
+import time
+from urllib.parse import quote
+
+from bench import DEFAULT_SERVER, CACHE_HEADER, ConnectionPool, load_fixtures
+
+# route: (sort keys crawled by default, sort keys that can be paged by cursor)
+PAGINATED_ROUTES = {
+    'providerHealth': (('id', 'timestamp', 'spec', 'status'), ('id', 'timestamp')),
+    'providerErrors': (('id', 'date', 'spec'), ('id', 'date')),
+    'providerEvents': (('events.id', 'blocks.height', 'events.eventType'), ('events.id', 'blocks.height', 'blocks.datetime')),
+    'providerRewards': (('relay_payments.id', 'blocks.datetime', 'relay_payments.cu', 'relay_payments.consumer'),
+                        ('relay_payments.id', 'relay_payments.blockId', 'blocks.datetime')),
+    'providerReports': (('provider_reported.id', 'blocks.datetime', 'provider_reported.cu'),
+                        ('provider_reported.id', 'provider_reported.blockId', 'blocks.datetime')),
+}
+
+MAX_PAGE = 4000  # validatePaginationString
+EDGE_SHARE = 0.1  # share of pages compared at each end of a crawl
+
+
+class Crawl:
+    """The pages of one (route, provider, sort key, direction, mode) walk."""
+
+    def __init__(self, route, provider, sort_key, direction, mode, item_count):
+        self.route = route
+        self.provider = provider
+        self.sort_key = sort_key
+        self.direction = direction
+        self.mode = mode
+        self.item_count = item_count
+        self.latencies_ms = []
+        self.rows = 0
+        self.cache_hits = 0
+        self.error = None
+
+    def row(self, growth_threshold, min_correlation):
+        pages = list(range(1, len(self.latencies_ms) + 1))
+        slope, correlation = linear_fit(pages, self.latencies_ms)
+        edge = max(1, int(len(pages) * EDGE_SHARE))
+        first = statistics.median(self.latencies_ms[:edge]) if self.latencies_ms else None
+        deep = statistics.median(self.latencies_ms[-edge:]) if self.latencies_ms else None
+        growth = deep / first if first else None
+        return {
+            'route': self.route,
+            'provider': self.provider,
+            'sort_key': self.sort_key,
+            'direction': self.direction,
+            'mode': self.mode,
+            'item_count': self.item_count,
+            'pages': len(pages),
+            'rows': self.rows,
+            'first_pages_ms': first,
+            'deep_pages_ms': deep,
+            'growth': growth,
+            'slope_ms_per_page': slope,
+            'correlation': correlation,
+            'cache_hit_ratio': self.cache_hits / len(pages) if pages else None,
+            'grows': grows(growth, correlation, growth_threshold, min_correlation),
+            'error': self.error,
+            'latencies_ms': self.latencies_ms,
+        }
+
+
+def linear_fit(xs, ys):
+    """Least squares slope of ys over xs and the Pearson correlation, None when undefined."""
+    if len(xs) < 3:
+        return None, None
+    mean_x = statistics.fmean(xs)
+    mean_y = statistics.fmean(ys)
+    sxx = sum((x - mean_x) ** 2 for x in xs)
+    syy = sum((y - mean_y) ** 2 for y in ys)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    slope = sxy / sxx if sxx else None
+    correlation = sxy / math.sqrt(sxx * syy) if sxx and syy else None
+    return slope, correlation
+
+
+def grows(growth, correlation, growth_threshold, min_correlation):
+    """True when deep pages are `growth_threshold` times slower and latency tracks the page number."""
+    return (growth is not None and correlation is not None and
+            growth >= growth_threshold and correlation >= min_correlation)
+
+
+def _pagination(sort_key, direction, page, count):
+    return '%s,%s,%d,%d' % (sort_key, direction, page, count)
+
+
+async def _timed_get(pool, path):
+    started = time.monotonic()
+    status, headers, body = await pool.get(path, {'Accept-Encoding': 'identity'})
+    return status, headers, body, (time.monotonic() - started) * 1000.0
+
+
+async def item_count(pool, route, provider):
+    status, _, body = await pool.get('/item-count/%s/%s' % (route, provider), {'Accept-Encoding': 'identity'})
+    if status != 200:
+        return None
+    return json.loads(body).get('itemCount')
+
+
+async def largest_providers(pool, route, providers, limit):
+    """The `limit` providers with the most rows on a route, as (provider, item count)."""
+    counts = []
+    for provider in providers:
+        count = await item_count(pool, route, provider)
+        if count:
+            counts.append((provider, count))
+    counts.sort(key=lambda item: item[1], reverse=True)
+    return counts[:limit]
+
+
+async def crawl_offset(pool, crawl, count, max_pages):
+    pages = min(max_pages, MAX_PAGE, math.ceil(crawl.item_count / count))
+    for page in range(1, pages + 1):
+        path = '/%s/%s?pagination=%s' % (crawl.route, crawl.provider, _pagination(crawl.sort_key, crawl.direction, page, count))
+        status, headers, body, ms = await _timed_get(pool, path)
+        if status != 200:
+            crawl.error = 'page %d: status %d %s' % (page, status, body[:200].decode('utf-8', 'replace'))
+            return crawl
+        data = json.loads(body).get('data') or []
+        crawl.latencies_ms.append(ms)
+        crawl.rows += len(data)
+        crawl.cache_hits += headers.get(CACHE_HEADER) == 'hit'
+        if len(data) < count:
+            break
+    return crawl
+
+
+async def crawl_cursor(pool, crawl, count, max_pages):
+    cursor = '-'
+    while cursor and len(crawl.latencies_ms) < max_pages:
+        path = '/%s/%s?pagination=%s&cursor=%s' % (
+            crawl.route, crawl.provider, _pagination(crawl.sort_key, crawl.direction, 1, count), quote(cursor))
+        status, headers, body, ms = await _timed_get(pool, path)
+        if status != 200:
+            crawl.error = 'page %d: status %d %s' % (
+                len(crawl.latencies_ms) + 1, status, body[:200].decode('utf-8', 'replace'))
+            return crawl
+        response = json.loads(body)
+        if 'nextCursor' not in response:
+            crawl.error = 'no nextCursor in the response, the server does not page by cursor'
+            return crawl
+        crawl.latencies_ms.append(ms)
+        crawl.rows += len(response.get('data') or [])
+        crawl.cache_hits += headers.get(CACHE_HEADER) == 'hit'
+        cursor = response['nextCursor']
+    return crawl
+
+
+def _fmt(value, pattern='%.1f'):
+    return '-' if value is None else pattern % value
+
+
+def print_results(rows, out=sys.stdout):
+    header = '%-16s %-14s %-26s %3s %-6s %6s %9s %9s %7s %9s %6s %5s  %s' % (
+        'route', 'provider', 'sort key', 'dir', 'mode', 'pages', 'first ms', 'deep ms', 'growth', 'ms/page', 'r', 'hit%', '')
+    print(header, file=out)
+    print('-' * len(header), file=out)
+    for row in rows:
+        provider = row['provider'] if len(row['provider']) <= 14 else row['provider'][:6] + '..' + row['provider'][-6:]
+        print('%-16s %-14s %-26s %3s %-6s %6d %9s %9s %7s %9s %6s %5s  %s' % (
+            row['route'][:16], provider, row['sort_key'][:26], row['direction'], row['mode'], row['pages'],
+            _fmt(row['first_pages_ms']), _fmt(row['deep_pages_ms']), _fmt(row['growth'], '%.1fx'),
+            _fmt(row['slope_ms_per_page'], '%.3f'), _fmt(row['correlation'], '%.2f'),
+            _fmt(None if row['cache_hit_ratio'] is None else 100 * row['cache_hit_ratio'], '%.0f'),
+            'ERROR ' + row['error'] if row['error'] else ('GROWS' if row['grows'] else '')), file=out)
+    print('(first/deep ms: median of the first and last %d%% of pages; r: correlation of latency and page)' % (
+        100 * EDGE_SHARE), file=out)
+
+
+def print_plot(row, width=50, buckets=20, out=sys.stdout):
+    """Median latency per band of pages, as a bar chart."""
+    latencies = row['latencies_ms']
+    if not latencies:
+        return
+    print('\n%s %s %s,%s %s' % (row['route'], row['provider'], row['sort_key'], row['direction'], row['mode']), file=out)
+    size = max(1, math.ceil(len(latencies) / buckets))
+    bands = [(start + 1, statistics.median(latencies[start:start + size])) for start in range(0, len(latencies), size)]
+    top = max(median for _, median in bands) or 1.0
+    for first_page, median in bands:
+        print('  page %5d+ %8.1fms %s' % (first_page, median, '#' * max(1, round(width * median / top))), file=out)
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Crawl every page of the paginated provider routes and fit latency against depth.')
+    parser.add_argument('--server', default=DEFAULT_SERVER,
+                        help='base URL (default: $TESTS_SERVER_ADDRESS or %(default)s)')
+    parser.add_argument('--route', action='append', choices=sorted(PAGINATED_ROUTES), default=[],
+                        help='route to crawl, can be repeated (default: all of them)')
+    parser.add_argument('--sort-key', action='append', default=[],
+                        help="sort key to crawl, can be repeated (default: each route's own list)")
+    parser.add_argument('--direction', choices=('a', 'd', 'both'), default='d', help='sort direction (default: %(default)s)')
+    parser.add_argument('--mode', choices=('offset', 'cursor', 'both'), default='offset',
+                        help='page by page number, by cursor, or both (default: %(default)s)')
+    parser.add_argument('--provider', action='append', default=[],
+                        help='provider to crawl, can be repeated (default: the largest ones)')
+    parser.add_argument('--providers', type=int, default=2,
+                        help='how many of the largest providers to crawl per route (default: %(default)s)')
+    parser.add_argument('--count', type=int, default=20,
+                        help='rows per page, 1 to 100 (default: %(default)s)')
+    parser.add_argument('--max-pages', type=int, default=MAX_PAGE,
+                        help='stop a crawl after this many pages (default: %(default)s)')
+    parser.add_argument('--growth', type=float, default=2.0,
+                        help='deep pages this many times slower than the first ones count as growth (default: %(default)s)')
+    parser.add_argument('--min-correlation', type=float, default=0.5,
+                        help='and latency must correlate this much with the page number (default: %(default)s)')
+    parser.add_argument('--check', action='store_true', help='exit 1 when a cursor crawl grows or fails')
+    parser.add_argument('--plot', action='store_true', help='print latency by page for every crawl')
+    parser.add_argument('--timeout', type=float, default=60.0,
+                        help='per request timeout in seconds (default: %(default)s)')
+    parser.add_argument('--json', metavar='PATH', help='also write the results, with every page latency, as JSON')
+    args = parser.parse_args(argv)
+    if not 1 <= args.count <= 100:
+        parser.error('--count must be between 1 and 100')
+    return args
+
+
+async def _main(args):
+    pool = ConnectionPool(args.server, 1, args.timeout)
+    directions = ('a', 'd') if args.direction == 'both' else (args.direction,)
+    modes = ('offset', 'cursor') if args.mode == 'both' else (args.mode,)
+    rows = []
+    try:
+        providers = args.provider or (await load_fixtures(pool)).get('provider', [])
+        for route in args.route or sorted(PAGINATED_ROUTES):
+            default_keys, cursor_keys = PAGINATED_ROUTES[route]
+            if args.provider:
+                targets = [(provider, await item_count(pool, route, provider) or 0) for provider in providers]
+            else:
+                targets = await largest_providers(pool, route, providers, args.providers)
+            for provider, count in targets:
+                for sort_key in args.sort_key or default_keys:
+                    for direction in directions:
+                        for mode in modes:
+                            if mode == 'cursor' and not args.sort_key and sort_key not in cursor_keys:
+                                continue
+                            crawl = Crawl(route, provider, sort_key, direction, mode, count)
+                            started = time.monotonic()
+                            if mode == 'offset':
+                                await crawl_offset(pool, crawl, args.count, args.max_pages)
+                            else:
+                                await crawl_cursor(pool, crawl, args.count, args.max_pages)
+                            print('%s/%s %s,%s %s: %d pages in %.1fs%s' % (
+                                route, provider, sort_key, direction, mode, len(crawl.latencies_ms),
+                                time.monotonic() - started, ', ' + crawl.error if crawl.error else ''), file=sys.stderr)
+                            rows.append(crawl.row(args.growth, args.min_correlation))
+        return rows
+    finally:
+        pool.close()
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    rows = asyncio.run(_main(args))
+    if not rows:
+        print('nothing crawled, no provider has rows on these routes', file=sys.stderr)
+        return 1
+    print_results(rows)
+    if args.plot:
+        for row in rows:
+            print_plot(row)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+    if args.check and any(row['mode'] == 'cursor' and (row['grows'] or row['error']) for row in rows):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
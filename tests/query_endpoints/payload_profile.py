@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+
+# jsinfo/tests/query_endpoints/payload_profile.py
+#
+# How big the query responses are. Every GET route registered in
+# src/query/queryRoutes.ts is requested twice, once with
+# Accept-Encoding: identity and once with Accept-Encoding: gzip, br, and the
+# routes are ranked by bytes per item:
+#
+#   python3 payload_profile.py --server http://localhost:8081
+#   python3 payload_profile.py --route /indexChartsV3 --route /specStakes/{spec} --fields --json /tmp/payloads.json
+#
+# The items of a response are the elements of its largest array (the rows of
+# a CSV export); a response without one counts as one item. For arrays of
+# objects, the bytes each field takes across all items are added up, and
+# fields with the same value in every item are listed as constant: those are
+# the candidates for over-fetching.
+#
+# Compressed sizes are what the server sent when it compressed, and gzip
+# (level 6, what a proxy would use) computed here either way. Brotli is
+# computed too when the brotli module is installed. Server ms is the
+# X-Jsinfo-Compute-Ms of a redis backed route on a miss.
+
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+import time
+
+import requests
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from bench import DEFAULT_SERVER
+from budgets import load_fixture_ids
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+QUERY_ROUTES = os.path.join(HERE, '..', '..', 'src', 'query', 'queryRoutes.ts')
+COMPUTE_HEADER = 'x-jsinfo-compute-ms'
+MAX_ARRAY_DEPTH = 3
+
+# route parameter: fixture list its values come from
+ROUTE_PARAMS = {
+    'addr': 'provider',
+    'providerId': 'provider',
+    'specId': 'spec',
+}
+
+_REGISTRATION = re.compile(r"(GetServerInstance\(\)\.get|RegisterRedisBackedHandler|RegisterPaginationServerHandler)"
+                           r"\s*(?:<[^(]*?>)?\s*\(\s*['\"](/[^'\"]*)['\"]")
+# const tvlRoutes = ['/tvl', ...]; registered with a forEach
+_ROUTE_LIST = re.compile(r"=\s*\[\s*((?:'/[^']*'\s*,?\s*)+)\]")
+
+
+def routes_from_source(path=QUERY_ROUTES):
+    """The GET route templates of queryRoutes.ts, {param} style, in registration order."""
+    with open(path) as f:
+        source = f.read()
+    routes = []
+    for registration, route in _REGISTRATION.findall(source):
+        routes.append(route)
+        if registration == 'RegisterPaginationServerHandler':
+            routes.append('/item-count' + route)
+    # aliases registered in a loop, like the /tvl ones
+    for names in _ROUTE_LIST.findall(source):
+        routes.extend(re.findall(r"'(/[^']*)'", names))
+
+    templates = []
+    for route in routes:
+        consumer_route = route.startswith(('/consumer', '/item-count/consumer'))
+        template = re.sub(r':(\w+)', lambda m: '{%s}' % ('consumer' if consumer_route and m.group(1) == 'addr'
+                                                          else ROUTE_PARAMS.get(m.group(1), m.group(1))), route)
+        if template not in templates:
+            templates.append(template)
+    return templates
+
+
+def largest_array(value, depth=0):
+    """The longest list in value, looking MAX_ARRAY_DEPTH levels down."""
+    best = value if isinstance(value, list) else None
+    if depth >= MAX_ARRAY_DEPTH:
+        return best
+    children = value.values() if isinstance(value, dict) else value if isinstance(value, list) else ()
+    if isinstance(value, list):
+        # the items of a list are alike, the first one stands for them
+        children = value[:1]
+    for child in children:
+        found = largest_array(child, depth + 1)
+        if found is not None and (best is None or len(found) > len(best)):
+            best = found
+    return best
+
+
+def field_breakdown(items):
+    """{field: {'bytes': n, 'constant': bool}} across a list of objects, None when the items are not objects."""
+    if not items or not all(isinstance(item, dict) for item in items):
+        return None
+    fields = {}
+    for item in items:
+        for key, value in item.items():
+            encoded = json.dumps(value, separators=(',', ':'))
+            field = fields.setdefault(key, {'bytes': 0, 'count': 0, 'first': encoded, 'constant': True})
+            # "key": value, including the quotes, colon and comma
+            field['bytes'] += len(key) + len(encoded) + 4
+            field['count'] += 1
+            if encoded != field['first']:
+                field['constant'] = False
+    return {key: {'bytes': field['bytes'],
+                  'constant': field['constant'] and field['count'] == len(items) and len(items) > 1}
+            for key, field in fields.items()}
+
+
+class PayloadProfile:
+    """Sizes of one route's response."""
+
+    def __init__(self, route, path):
+        self.route = route
+        self.path = path
+        self.skipped = None
+        self.status = None
+        self.content_type = None
+        self.raw_bytes = None
+        self.wire_encoding = None
+        self.wire_bytes = None
+        self.gzip_bytes = None
+        self.brotli_bytes = None
+        self.items = None
+        self.fields = None
+        self.identity_ms = None
+        self.compressed_ms = None
+        self.server_ms = None
+        self.parse_ms = None
+
+    @property
+    def compressed_bytes(self):
+        """The smallest compressed size seen, sent or computed."""
+        sizes = [size for size in (self.wire_bytes if self.wire_encoding else None, self.gzip_bytes, self.brotli_bytes)
+                 if size is not None]
+        return min(sizes) if sizes else None
+
+    @property
+    def ratio(self):
+        compressed = self.compressed_bytes
+        return self.raw_bytes / compressed if compressed else None
+
+    def per_item(self, size):
+        return size / self.items if size is not None and self.items else None
+
+    def row(self):
+        return {
+            'route': self.route,
+            'path': self.path,
+            'skipped': self.skipped,
+            'status': self.status,
+            'content_type': self.content_type,
+            'items': self.items,
+            'raw_bytes': self.raw_bytes,
+            'wire_encoding': self.wire_encoding,
+            'wire_bytes': self.wire_bytes,
+            'gzip_bytes': self.gzip_bytes,
+            'brotli_bytes': self.brotli_bytes,
+            'ratio': self.ratio,
+            'bytes_per_item': self.per_item(self.raw_bytes),
+            'compressed_bytes_per_item': self.per_item(self.compressed_bytes),
+            'identity_ms': self.identity_ms,
+            'compressed_ms': self.compressed_ms,
+            'server_ms': self.server_ms,
+            'parse_ms': self.parse_ms,
+            'fields': self.fields,
+        }
+
+
+def _wire_get(session, url, encoding, timeout):
+    """(response, body as sent, ms), the body is not decompressed."""
+    started = time.monotonic()
+    with session.get(url, headers={'Accept-Encoding': encoding}, stream=True, timeout=timeout) as response:
+        body = response.raw.read(decode_content=False)
+    return response, body, (time.monotonic() - started) * 1000.0
+
+
+def profile_route(session, route, path, server, timeout):
+    result = PayloadProfile(route, path)
+    url = server + path
+    response, body, result.identity_ms = _wire_get(session, url, 'identity', timeout)
+    result.status = response.status_code
+    if response.status_code != 200:
+        result.skipped = 'status %d' % response.status_code
+        return result
+    if response.headers.get('Content-Encoding', 'identity') != 'identity':
+        # a proxy in front compresses regardless, decode it for the plain size
+        body = requests.get(url, timeout=timeout).content
+    result.content_type = response.headers.get('Content-Type', '').split(';')[0]
+    result.raw_bytes = len(body)
+    try:
+        result.server_ms = float(response.headers[COMPUTE_HEADER])
+    except (KeyError, ValueError):
+        pass
+
+    response, wire, result.compressed_ms = _wire_get(session, url, 'gzip, br', timeout)
+    encoding = response.headers.get('Content-Encoding')
+    if encoding and encoding != 'identity':
+        result.wire_encoding = encoding
+    result.wire_bytes = len(wire)
+    result.gzip_bytes = len(gzip.compress(body, 6))
+    if brotli is not None:
+        result.brotli_bytes = len(brotli.compress(body, quality=5))
+
+    started = time.perf_counter()
+    if 'json' in result.content_type:
+        try:
+            value = json.loads(body)
+        except ValueError:
+            result.skipped = 'not JSON'
+            return result
+        result.parse_ms = (time.perf_counter() - started) * 1000.0
+        items = largest_array(value)
+        result.items = len(items) if items is not None else 1
+        result.fields = field_breakdown(items)
+    elif 'csv' in result.content_type:
+        lines = body.count(b'\n') + (0 if body.endswith(b'\n') or not body else 1)
+        result.items = max(lines - 1, 0)
+    else:
+        result.items = 1
+    return result
+
+
+def _fmt(value, pattern='%.1f'):
+    return '-' if value is None else pattern % value
+
+
+def _top_field(fields, raw_bytes):
+    if not fields:
+        return ''
+    key, field = max(fields.items(), key=lambda entry: entry[1]['bytes'])
+    constant = sum(1 for field in fields.values() if field['constant'])
+    text = '%s %.0f%%' % (key, 100.0 * field['bytes'] / raw_bytes)
+    return text + (', %d constant' % constant if constant else '')
+
+
+def print_results(rows, show_fields=False, out=sys.stdout):
+    header = '%-44s %7s %11s %10s %10s %6s %9s %9s %8s %8s  %s' % (
+        'route', 'items', 'raw bytes', 'sent', 'gzip', 'ratio', 'B/item', 'gz B/item', 'server', 'parse', 'largest field')
+    print(header, file=out)
+    print('-' * len(header), file=out)
+    for row in rows:
+        if row['skipped']:
+            print('%-44s skipped: %s' % (row['route'][:44], row['skipped']), file=out)
+            continue
+        sent = '%d %s' % (row['wire_bytes'], row['wire_encoding']) if row['wire_encoding'] else 'plain'
+        print('%-44s %7s %11d %10s %10s %6s %9s %9s %8s %8s  %s' % (
+            row['route'][:44], _fmt(row['items'], '%d'), row['raw_bytes'], sent, _fmt(row['gzip_bytes'], '%d'),
+            _fmt(row['ratio'], '%.1fx'), _fmt(row['bytes_per_item'], '%.0f'),
+            _fmt(row['compressed_bytes_per_item'], '%.0f'), _fmt(row['server_ms']), _fmt(row['parse_ms']),
+            _top_field(row['fields'], row['raw_bytes'])), file=out)
+    print('(ranked by bytes per item; sent is what came back for Accept-Encoding: gzip, br, plain when not compressed)', file=out)
+
+    if not show_fields:
+        return
+    for row in rows:
+        if not row['fields']:
+            continue
+        print('\n%s' % row['path'], file=out)
+        for key, field in sorted(row['fields'].items(), key=lambda entry: -entry[1]['bytes']):
+            print('  %-32s %10d bytes %5.1f%%%s' % (key, field['bytes'], 100.0 * field['bytes'] / row['raw_bytes'],
+                                                  '  constant' if field['constant'] else ''), file=out)
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Profile the response sizes and compression of the query routes.')
+    parser.add_argument('--server', default=DEFAULT_SERVER,
+                        help='base URL (default: $TESTS_SERVER_ADDRESS or %(default)s)')
+    parser.add_argument('--routes-file', default=QUERY_ROUTES, metavar='PATH',
+                        help='queryRoutes.ts to read the routes from (default: the one in this tree)')
+    parser.add_argument('--route', action='append', default=[],
+                        help='route template to profile, can be repeated (default: every route of --routes-file)')
+    parser.add_argument('--skip', action='append', default=[], metavar='REGEX',
+                        help='leave out the routes matching this, can be repeated')
+    parser.add_argument('--fields', action='store_true', help='print the per field breakdown of every route')
+    parser.add_argument('--timeout', type=float, default=120.0,
+                        help='per request timeout in seconds (default: %(default)s)')
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    server = args.server.rstrip('/')
+    session = requests.Session()
+    routes = args.route or routes_from_source(args.routes_file)
+    routes = [route for route in routes if not any(re.search(pattern, route) for pattern in args.skip)]
+    fixtures = load_fixture_ids(lambda url: session.get(url, timeout=args.timeout), server)
+
+    results = []
+    for route in routes:
+        try:
+            path = route.format(**{name: ids[0] for name, ids in fixtures.items() if ids})
+        except KeyError as e:
+            result = PayloadProfile(route, None)
+            result.skipped = 'no ids for {%s}' % e.args[0]
+            results.append(result)
+            continue
+        try:
+            result = profile_route(session, route, path, server, args.timeout)
+        except requests.RequestException as e:
+            result = PayloadProfile(route, path)
+            result.skipped = '%r' % e
+        results.append(result)
+        print('%s: %s' % (path, result.skipped or '%d bytes, %s items' % (result.raw_bytes, result.items)), file=sys.stderr)
+
+    rows = [result.row() for result in results]
+    rows.sort(key=lambda row: (row['skipped'] is not None, -(row['bytes_per_item'] or 0)))
+    print_results(rows, args.fields)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+    return 0 if any(not row['skipped'] for row in rows) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
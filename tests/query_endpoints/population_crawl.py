@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+# jsinfo/tests/query_endpoints/population_crawl.py
+#
+# Crawls the per entity pages for every provider and consumer, not a random
+# few, to find the addresses whose pages are slow: the ones with huge relay
+# histories that random.sample() in the tests almost never picks.
+#
+#   python3 population_crawl.py --server http://localhost:8081 --workers 8 --rate 20
+#   python3 population_crawl.py --kind provider --shard 0/4 --json /tmp/crawl-0.json   # one of 4 machines
+#   python3 population_crawl.py --merge /tmp/crawl-*.json                              # the combined report
+#
+# Every entity's routes are requested once, by --workers concurrent clients
+# that together stay under --rate requests per second. --shard K/N keeps the
+# entities whose address hashes to K modulo N, so N processes split the
+# population without overlap and the same address always lands in the same
+# shard; each of them then takes 1/N of --rate, so the server sees --rate in
+# total. Entities are ranked by the time their routes took together, and
+# each one shows its slowest route, how many times that route's median it
+# took, and how many bytes its routes returned.
+
+import argparse
+import asyncio
+import hashlib
+import json
+import sys
+import time
+
+from bench import DEFAULT_SERVER, CACHE_HEADER, MIXES, ConnectionPool, LatencyHistogram, fixture_ids
+
+# entity kind: (list path, list key, id key, route templates)
+ENTITY_ROUTES = {
+    'provider': ('/providers', 'providers', 'address',
+                 [path for _, path in MIXES['provider']] + ['/providerChartsV2/all/{provider}']),
+    'consumer': ('/consumers', 'consumers', 'address',
+                 [path for _, path in MIXES['consumer']] + ['/consumerCharts/{consumer}']),
+}
+PROGRESS_SECONDS = 10
+
+
+class RateLimiter:
+    """Spaces out the calls of all workers to `rate` per second, None for no limit."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+def parse_shard(text):
+    """'K/N' as (K, N)."""
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected K/N, got %r' % text)
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError('shard %d/%d out of range' % (index, count))
+    return index, count
+
+
+def in_shard(entity_id, shard):
+    index, count = shard
+    digest = hashlib.sha1(entity_id.encode()).digest()
+    return int.from_bytes(digest[:8], 'big') % count == index
+
+
+class EntityResult:
+    """Every route of one provider or consumer."""
+
+    def __init__(self, kind, entity_id):
+        self.kind = kind
+        self.id = entity_id
+        self.routes = {}  # template: {'ms', 'bytes', 'status', 'cache'}
+
+    def record(self, template, status, ms, size, cache):
+        self.routes[template] = {'status': status, 'ms': ms, 'bytes': size, 'cache': cache}
+
+    def row(self):
+        answered = {template: route for template, route in self.routes.items() if route['ms'] is not None}
+        slowest = max(answered, key=lambda template: answered[template]['ms']) if answered else None
+        largest = max(answered, key=lambda template: answered[template]['bytes']) if answered else None
+        return {
+            'kind': self.kind,
+            'id': self.id,
+            'total_ms': sum(route['ms'] for route in answered.values()),
+            'bytes': sum(route['bytes'] for route in answered.values()),
+            'slowest_route': slowest,
+            'slowest_ms': answered[slowest]['ms'] if slowest else None,
+            'largest_route': largest,
+            'largest_bytes': answered[largest]['bytes'] if largest else None,
+            'errors': sum(1 for route in self.routes.values() if route['status'] != 200),
+            'routes': self.routes,
+        }
+
+
+async def crawl(pool, jobs, workers, limiter):
+    """Requests every (entity, template, path) of jobs, returns the number of requests sent."""
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+    sent = 0
+    started = last_progress = time.monotonic()
+
+    async def worker():
+        nonlocal sent, last_progress
+        while True:
+            try:
+                entity, template, path = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await limiter.wait()
+            request_started = time.monotonic()
+            try:
+                status, headers, body = await pool.get(path)
+            except Exception as e:
+                entity.record(template, 'error: %r' % e, None, 0, None)
+            else:
+                entity.record(template, status, (time.monotonic() - request_started) * 1000.0, len(body),
+                              headers.get(CACHE_HEADER))
+            sent += 1
+            now = time.monotonic()
+            if now - last_progress >= PROGRESS_SECONDS:
+                last_progress = now
+                print('%d/%d requests, %.1f/s' % (sent, len(jobs), sent / (now - started)), file=sys.stderr)
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    return sent
+
+
+def route_medians(rows):
+    """{template: p50 ms} over every entity that answered it."""
+    histograms = {}
+    for row in rows:
+        for template, route in row['routes'].items():
+            if route['ms'] is not None and route['status'] == 200:
+                histograms.setdefault(template, LatencyHistogram()).record(route['ms'] * 1000.0)
+    return {template: histogram.percentile(50) / 1000.0 for template, histogram in histograms.items()}
+
+
+def print_report(rows, top, out=sys.stdout):
+    medians = route_medians(rows)
+    for kind in ENTITY_ROUTES:
+        ranked = sorted((row for row in rows if row['kind'] == kind), key=lambda row: -row['total_ms'])
+        if not ranked:
+            continue
+        print('\nslowest %ss, %d crawled' % (kind, len(ranked)), file=out)
+        header = '%-52s %10s %12s %-36s %10s %6s %6s' % (
+            kind, 'total ms', 'bytes', 'slowest route', 'ms', 'x p50', 'errors')
+        print(header, file=out)
+        print('-' * len(header), file=out)
+        for row in ranked[:top]:
+            median = medians.get(row['slowest_route'])
+            print('%-52s %10.0f %12d %-36s %10s %6s %6d' % (
+                row['id'][:52], row['total_ms'], row['bytes'], (row['slowest_route'] or '-')[:36],
+                '-' if row['slowest_ms'] is None else '%.0f' % row['slowest_ms'],
+                '%.1f' % (row['slowest_ms'] / median) if median and row['slowest_ms'] is not None else '-',
+                row['errors']), file=out)
+
+    print('\nper route across the population', file=out)
+    header = '%-44s %8s %10s %10s %10s  %s' % ('route', 'entities', 'p50 ms', 'max ms', 'max bytes', 'slowest entity')
+    print(header, file=out)
+    print('-' * len(header), file=out)
+    for template in sorted(medians):
+        answered = [(route, row['id']) for row in rows
+                    for name, route in row['routes'].items() if name == template and route['status'] == 200]
+        slowest, slowest_id = max(answered, key=lambda entry: entry[0]['ms'])
+        print('%-44s %8d %10.1f %10.1f %10d  %s' % (
+            template[:44], len(answered), medians[template], slowest['ms'],
+            max(route['bytes'] for route, _ in answered), slowest_id), file=out)
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Crawl the pages of every provider and consumer to find the slow ones.')
+    parser.add_argument('--server', default=DEFAULT_SERVER,
+                        help='base URL (default: $TESTS_SERVER_ADDRESS or %(default)s)')
+    parser.add_argument('--kind', action='append', choices=sorted(ENTITY_ROUTES), default=[],
+                        help='entities to crawl, can be repeated (default: providers and consumers)')
+    parser.add_argument('--route', action='append', default=[],
+                        help='route template to request per entity, can be repeated (default: all of the kind\'s)')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent clients (default: %(default)s)')
+    parser.add_argument('--rate', type=float, default=20.0,
+                        help='requests per second across all shards, 0 for no limit (default: %(default)s)')
+    parser.add_argument('--shard', type=parse_shard, default=(0, 1), metavar='K/N',
+                        help='crawl the K-th of N hash shards of the entities (default: 0/1, all of them)')
+    parser.add_argument('--limit', type=int, default=None, help='crawl at most this many entities per kind')
+    parser.add_argument('--top', type=int, default=20, help='entities to list per kind (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=120.0,
+                        help='per request timeout in seconds (default: %(default)s)')
+    parser.add_argument('--json', metavar='PATH', help='also write every entity\'s results as JSON')
+    parser.add_argument('--merge', nargs='+', metavar='PATH',
+                        help='print the report of earlier --json files, of the shards of one crawl, instead of crawling')
+    return parser.parse_args(argv)
+
+
+async def _main(args):
+    pool = ConnectionPool(args.server, args.workers, args.timeout)
+    try:
+        entities = []
+        for kind in args.kind or list(ENTITY_ROUTES):
+            list_path, list_key, id_key, templates = ENTITY_ROUTES[kind]
+            status, _, body = await pool.get(list_path, {'Accept-Encoding': 'identity'})
+            if status != 200:
+                raise RuntimeError('GET %s returned %d' % (list_path, status))
+            ids = sorted(set(fixture_ids(json.loads(body).get(list_key), id_key, limit=None)))
+            ids = [entity_id for entity_id in ids if in_shard(entity_id, args.shard)][:args.limit]
+            print('%d %ss in shard %d/%d' % (len(ids), kind, args.shard[0], args.shard[1]), file=sys.stderr)
+            entities.extend((EntityResult(kind, entity_id), templates) for entity_id in ids)
+
+        jobs = []
+        for entity, templates in entities:
+            for template in templates:
+                if args.route and template not in args.route:
+                    continue
+                jobs.append((entity, template, template.format(**{entity.kind: entity.id})))
+        limiter = RateLimiter(args.rate / args.shard[1] if args.rate else None)
+        started = time.monotonic()
+        sent = await crawl(pool, jobs, args.workers, limiter)
+        print('%d requests in %.0fs' % (sent, time.monotonic() - started), file=sys.stderr)
+        return [entity.row() for entity, _ in entities]
+    finally:
+        pool.close()
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    if args.merge:
+        rows = []
+        for path in args.merge:
+            with open(path) as f:
+                rows.extend(json.load(f))
+    else:
+        rows = asyncio.run(_main(args))
+    print_report(rows, args.top)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+    return 0 if rows else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# jsinfo/tests/query_endpoints/redis_client.py
+#
+# Just enough of a Redis client for the benchmarks, on asyncio streams, so
+# they need nothing beyond the standard library:
+#
+#   client = await RedisClient.connect('redis://:password@localhost:6379/0')
+#   await client.command('DEL', key)
+#   replies = await client.pipeline([('TTL', k) for k in keys])
+
+import asyncio
+import ssl
+from urllib.parse import unquote, urlsplit
+
+
+class RedisError(Exception):
+    """An error reply from the server."""
+
+
+class RedisClient:
+    """One RESP2 connection. Commands go out one at a time or as a pipeline."""
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    async def connect(cls, url, timeout=10.0):
+        """redis:// or rediss:// URL, with optional password and database number."""
+        parts = urlsplit(url if '://' in url else 'redis://' + url)
+        use_tls = parts.scheme == 'rediss'
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(
+            parts.hostname or 'localhost', parts.port or 6379,
+            ssl=ssl.create_default_context() if use_tls else None), timeout)
+        client = cls(reader, writer)
+        if parts.password:
+            if parts.username and parts.username != 'default':
+                await client.command('AUTH', unquote(parts.username), unquote(parts.password))
+            else:
+                await client.command('AUTH', unquote(parts.password))
+        database = parts.path.strip('/')
+        if database and database != '0':
+            await client.command('SELECT', database)
+        return client
+
+    def close(self):
+        self._writer.close()
+
+    async def command(self, *args):
+        return (await self.pipeline([args]))[0]
+
+    async def pipeline(self, commands, raise_errors=True):
+        """Sends all commands before reading any reply.
+
+        With raise_errors=False an error reply is returned as a RedisError in
+        its place instead of raised, so one bad key does not lose the batch.
+        """
+        async with self._lock:
+            self._writer.write(b''.join(_encode(command) for command in commands))
+            await self._writer.drain()
+            replies = [await self._read_reply() for _ in commands]
+        if raise_errors:
+            for reply in replies:
+                if isinstance(reply, RedisError):
+                    raise reply
+        return replies
+
+    async def scan(self, match='*', count=1000, type_=None):
+        """Yields every key matching `match`, with SCAN so the server is never blocked."""
+        cursor = b'0'
+        while True:
+            args = ['SCAN', cursor, 'MATCH', match, 'COUNT', count]
+            if type_:
+                args += ['TYPE', type_]
+            cursor, keys = await self.command(*args)
+            for key in keys:
+                yield key
+            if cursor == b'0':
+                return
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionResetError('redis closed the connection')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload
+        if kind == b'-':
+            return RedisError(payload.decode('utf-8', 'replace'))
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            size = int(payload)
+            if size < 0:
+                return None
+            data = await self._reader.readexactly(size + 2)
+            return data[:-2]
+        if kind == b'*':
+            size = int(payload)
+            if size < 0:
+                return None
+            return [await self._read_reply() for _ in range(size)]
+        raise ValueError('bad redis reply %r' % line)
+
+
+def _encode(args):
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(parts)
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+
+# jsinfo/tests/query_endpoints/redis_footprint.py
+#
+# What the query server's redis cache holds: keys, bytes and TTLs grouped by
+# the handler or resource that wrote them, and the largest keys:
+#
+#   python3 redis_footprint.py --redis redis://:mypassword@localhost:6379
+#   python3 redis_footprint.py --snapshot /backups/dump.rdb --top 50 --json /tmp/redis.json
+#
+# Keys are walked with SCAN and sized with MEMORY USAGE, TTL and TYPE sent in
+# pipelined batches, so the server is never blocked on one long command;
+# --pause leaves it time for other clients between batches. Rather than a
+# production redis, point it at a copy: --snapshot starts a throwaway
+# redis-server (which must be on the PATH) on a free local port, loads the
+# RDB file into it and stops it afterwards.
+#
+# The groups follow how the keys are built, after RedisCache's "jsinfo-"
+# prefix:
+#
+#   url:<route>/...                 RegisterRedisBackedHandler responses
+#   <Handler>-[args]|<suffix>       RequestHandlerBase data: pages, |csvData,
+#                                   |itemCount, cursor pages and date ranges
+#   <redisKey>[:args]               RedisResourceBase resources, their
+#                                   redisKey values read from src/redis/resources
+
+import argparse
+import asyncio
+import collections
+import heapq
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from redis_client import RedisClient, RedisError
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REDIS_RESOURCES = os.path.join(HERE, '..', '..', 'src', 'redis', 'resources')
+KEY_PREFIX = 'jsinfo-'
+# upper bounds in seconds of the TTL buckets
+TTL_BUCKETS = ((30, '<=30s'), (60, '<=1m'), (300, '<=5m'), (3600, '<=1h'), (86400, '<=1d'), (None, '>1d'))
+NO_TTL = 'none'
+
+_REDIS_KEY = re.compile(r"redisKey\s*(?::\s*string\s*)?=\s*['\"]([^'\"]+)['\"]")
+_HANDLER_KEY = re.compile(r'^([A-Za-z_$][\w$]*)-(.*)$', re.S)
+_DATE_RANGE = re.compile(r'^\d{4}-\d{2}-\d{2}T[^|]*\|\d{4}-\d{2}-\d{2}T')
+
+
+def resource_keys(path=REDIS_RESOURCES):
+    """The redisKey of every RedisResourceBase under src/redis/resources, longest first."""
+    keys = set()
+    for directory, _, files in os.walk(path):
+        for name in files:
+            if name.endswith('.ts'):
+                with open(os.path.join(directory, name)) as f:
+                    keys.update(_REDIS_KEY.findall(f.read()))
+    return sorted(keys, key=len, reverse=True)
+
+
+def classify(key, resources=()):
+    """(group, kind) of a key, by the layout of the code that writes it."""
+    if key.startswith(KEY_PREFIX):
+        key = key[len(KEY_PREFIX):]
+    else:
+        return 'other:%s' % re.split(r'[:|\-_]', key, 1)[0], 'unprefixed'
+
+    if key.startswith('url:'):
+        route = key[len('url:'):].split('/', 1)[0]
+        return 'url:%s' % route, 'route response'
+
+    for resource in resources:
+        if key == resource or key.startswith(resource + ':') or (resource.endswith(':') and key.startswith(resource)):
+            return resource.rstrip(':'), 'resource'
+
+    match = _HANDLER_KEY.match(key)
+    if match and '|' in key:
+        handler, suffix = match.group(1), key.rsplit('|', 1)[-1]
+        if suffix == 'csvData':
+            kind = 'csv'
+        elif suffix == 'itemCount':
+            kind = 'item count'
+        elif suffix.startswith('cursor:'):
+            kind = 'cursor page'
+        elif _DATE_RANGE.match(key.split('|', 1)[1]):
+            kind = 'date range'
+        else:
+            kind = 'page'
+        return handler, kind
+    return re.split(r'[:|\-]', key, 1)[0], 'other'
+
+
+def ttl_bucket(ttl):
+    if ttl is None or ttl < 0:
+        return NO_TTL
+    for limit, name in TTL_BUCKETS:
+        if limit is None or ttl <= limit:
+            return name
+
+
+class Group:
+    """Keys of one group."""
+
+    def __init__(self, name):
+        self.name = name
+        self.kinds = collections.Counter()
+        self.types = collections.Counter()
+        self.keys = 0
+        self.bytes = 0
+        self.largest = (0, None)
+        self.ttls = collections.Counter()
+
+    def add(self, key, kind, type_, size, ttl):
+        self.keys += 1
+        self.bytes += size
+        self.kinds[kind] += 1
+        self.types[type_] += 1
+        self.ttls[ttl_bucket(ttl)] += 1
+        if size > self.largest[0]:
+            self.largest = (size, key)
+
+    def row(self):
+        return {
+            'group': self.name,
+            'keys': self.keys,
+            'bytes': self.bytes,
+            'mean_bytes': self.bytes / self.keys if self.keys else 0,
+            'largest_bytes': self.largest[0],
+            'largest_key': self.largest[1],
+            'kinds': dict(self.kinds),
+            'types': dict(self.types),
+            'ttls': dict(self.ttls),
+        }
+
+
+class Footprint:
+    """Everything the scan saw."""
+
+    def __init__(self, resources, top):
+        self.resources = resources
+        self.top = top
+        self.groups = {}
+        self.ttls = collections.Counter()
+        self.largest = []  # heap of (bytes, key, group, ttl)
+        self.keys = 0
+        self.bytes = 0
+        self.vanished = 0
+
+    def add(self, key, type_, size, ttl):
+        if size is None:
+            # expired or deleted between SCAN and MEMORY USAGE
+            self.vanished += 1
+            return
+        group_name, kind = classify(key, self.resources)
+        group = self.groups.get(group_name)
+        if group is None:
+            group = self.groups[group_name] = Group(group_name)
+        group.add(key, kind, type_, size, ttl)
+        self.keys += 1
+        self.bytes += size
+        self.ttls[ttl_bucket(ttl)] += 1
+        entry = (size, key, group_name, ttl)
+        if len(self.largest) < self.top:
+            heapq.heappush(self.largest, entry)
+        elif entry > self.largest[0]:
+            heapq.heapreplace(self.largest, entry)
+
+    def summary(self, info=None):
+        return {
+            'keys': self.keys,
+            'bytes': self.bytes,
+            'vanished': self.vanished,
+            'used_memory': (info or {}).get('used_memory'),
+            'ttls': dict(self.ttls),
+            'groups': sorted((group.row() for group in self.groups.values()), key=lambda row: -row['bytes']),
+            'largest': [{'bytes': size, 'key': key, 'group': group, 'ttl': ttl}
+                        for size, key, group, ttl in sorted(self.largest, reverse=True)],
+        }
+
+
+def _decode(value):
+    return value.decode('utf-8', 'replace') if isinstance(value, bytes) else value
+
+
+async def scan_footprint(client, footprint, match='*', batch=500, pause=0.0, max_keys=None):
+    """SCANs the keys and sizes them `batch` at a time, three pipelined commands per key."""
+    keys = []
+
+    async def measure(keys):
+        commands = []
+        for key in keys:
+            commands += [('MEMORY', 'USAGE', key), ('TTL', key), ('TYPE', key)]
+        replies = await client.pipeline(commands, raise_errors=False)
+        for index, key in enumerate(keys):
+            size, ttl, type_ = replies[3 * index:3 * index + 3]
+            if isinstance(size, RedisError):
+                raise size
+            footprint.add(_decode(key), _decode(type_) if not isinstance(type_, RedisError) else '?', size,
+                          ttl if isinstance(ttl, int) else None)
+        if pause:
+            await asyncio.sleep(pause)
+
+    seen = 0
+    async for key in client.scan(match, count=batch):
+        keys.append(key)
+        seen += 1
+        if len(keys) >= batch:
+            await measure(keys)
+            keys = []
+            if seen % (batch * 20) == 0:
+                print('%d keys, %.1f MB' % (footprint.keys, footprint.bytes / 1e6), file=sys.stderr)
+        if max_keys and seen >= max_keys:
+            break
+    if keys:
+        await measure(keys)
+
+
+async def memory_info(client):
+    """used_memory and friends from INFO memory."""
+    info = {}
+    for line in _decode(await client.command('INFO', 'memory')).splitlines():
+        name, _, value = line.partition(':')
+        if value.isdigit():
+            info[name] = int(value)
+    return info
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class SnapshotServer:
+    """A throwaway redis-server that loads an RDB file, on a free local port."""
+
+    def __init__(self, rdb_path, startup_timeout=600.0):
+        self.rdb_path = os.path.abspath(rdb_path)
+        self.startup_timeout = startup_timeout
+        self.port = None
+        self._process = None
+        self._directory = None
+
+    async def start(self):
+        binary = shutil.which('redis-server')
+        if binary is None:
+            raise SystemExit('redis-server is not on the PATH, needed for --snapshot')
+        # redis-server loads dump.rdb from --dir, a link there saves copying the file
+        self._directory = tempfile.mkdtemp(prefix='jsinfo-redis-footprint-')
+        os.symlink(self.rdb_path, os.path.join(self._directory, 'dump.rdb'))
+        self.port = _free_port()
+        self._process = subprocess.Popen(
+            [binary, '--port', str(self.port), '--bind', '127.0.0.1', '--dir', self._directory,
+             '--dbfilename', 'dump.rdb', '--save', '', '--appendonly', 'no'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + self.startup_timeout
+        while True:
+            if self._process.poll() is not None:
+                raise SystemExit('redis-server exited with %d loading %s' % (self._process.returncode, self.rdb_path))
+            try:
+                client = await RedisClient.connect('redis://127.0.0.1:%d' % self.port)
+                try:
+                    await client.command('PING')  # a LOADING error until the dump is in
+                    return 'redis://127.0.0.1:%d' % self.port
+                finally:
+                    client.close()
+            except (OSError, RedisError):
+                if time.monotonic() > deadline:
+                    raise SystemExit('redis-server did not load %s in time' % self.rdb_path)
+                await asyncio.sleep(0.2)
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait()
+        if self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+
+
+def _mb(size):
+    return size / 1e6
+
+
+def print_footprint(summary, out=sys.stdout):
+    used = summary['used_memory']
+    print('%d keys, %.1f MB in keys%s%s' % (
+        summary['keys'], _mb(summary['bytes']),
+        ', %.1f MB used by redis' % _mb(used) if used else '',
+        ', %d vanished during the scan' % summary['vanished'] if summary['vanished'] else ''), file=out)
+    buckets = [NO_TTL] + [name for _, name in TTL_BUCKETS]
+    print('TTLs: %s\n' % ', '.join('%s %d' % (name, summary['ttls'].get(name)) for name in buckets if summary['ttls'].get(name)),
+          file=out)
+
+    header = '%-48s %8s %10s %6s %10s %11s  %-24s %s' % (
+        'group', 'keys', 'MB', 'share', 'mean KB', 'largest KB', 'kinds', 'TTLs')
+    print(header, file=out)
+    print('-' * len(header), file=out)
+    for row in summary['groups']:
+        kinds = ', '.join('%s %d' % item for item in sorted(row['kinds'].items(), key=lambda item: -item[1]))
+        ttls = ' '.join('%s:%d' % (name, row['ttls'][name]) for name in buckets if row['ttls'].get(name))
+        print('%-48s %8d %10.2f %5.1f%% %10.1f %11.1f  %-24s %s' % (
+            row['group'][:48], row['keys'], _mb(row['bytes']),
+            100.0 * row['bytes'] / summary['bytes'] if summary['bytes'] else 0,
+            row['mean_bytes'] / 1e3, row['largest_bytes'] / 1e3, kinds[:24], ttls), file=out)
+
+    print('\nlargest keys', file=out)
+    for entry in summary['largest']:
+        print('%10.1f KB  ttl %-7s %s' % (entry['bytes'] / 1e3, '-' if entry['ttl'] is None or entry['ttl'] < 0 else entry['ttl'],
+                                         entry['key'][:140]), file=out)
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Break down what the query server keeps in redis.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--redis', metavar='URL', help='redis to scan, preferably a copy')
+    source.add_argument('--snapshot', metavar='RDB', help='load this dump into a local redis-server and scan that')
+    parser.add_argument('--match', default='*', help='SCAN MATCH pattern (default: %(default)s)')
+    parser.add_argument('--batch', type=int, default=500,
+                        help='keys per SCAN COUNT and per pipeline (default: %(default)s)')
+    parser.add_argument('--pause', type=float, default=0.0,
+                        help='seconds to sleep between batches, to go easy on a live server (default: %(default)s)')
+    parser.add_argument('--max-keys', type=int, default=None, help='stop after this many keys')
+    parser.add_argument('--top', type=int, default=20, help='largest keys to list (default: %(default)s)')
+    parser.add_argument('--resources', default=REDIS_RESOURCES, metavar='DIR',
+                        help='src/redis/resources to read the resource keys from (default: the one in this tree)')
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    return parser.parse_args(argv)
+
+
+async def _main(args):
+    snapshot = SnapshotServer(args.snapshot) if args.snapshot else None
+    url = await snapshot.start() if snapshot else args.redis
+    try:
+        client = await RedisClient.connect(url)
+        try:
+            footprint = Footprint(resource_keys(args.resources), args.top)
+            started = time.monotonic()
+            await scan_footprint(client, footprint, args.match, args.batch, args.pause, args.max_keys)
+            print('scanned %d keys in %.1fs' % (footprint.keys, time.monotonic() - started), file=sys.stderr)
+            return footprint.summary(await memory_info(client))
+        finally:
+            client.close()
+    finally:
+        if snapshot:
+            snapshot.stop()
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    summary = asyncio.run(_main(args))
+    print_footprint(summary)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+# jsinfo/tests/query_endpoints/revalidation_bench.py
+#
+# What ETag revalidation saves a dashboard that polls the query server. Each
+# route is polled the way a browser with a cache would (If-None-Match with the
+# last ETag, a 304 when nothing changed) and the way one without would (the
+# full body every time), the two interleaved so both see the same data:
+#
+#   python3 revalidation_bench.py --server http://localhost:8081 --polls 20 --interval 1
+#   python3 revalidation_bench.py --route /indexChartsV3 --polls 60 --interval 5 --json /tmp/revalidation.json
+#
+# Bytes are the response headers and body as received. A route whose data
+# changed between polls answers 200 to the conditional poll too, so the 304
+# share shows how often polling at --interval finds new data.
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+from bench import DEFAULT_SERVER, ConnectionPool, LatencyHistogram, load_fixtures
+
+# polled by the dashboards: the index charts, the spec page and the provider tabs
+POLLED_ROUTES = (
+    '/indexChartsV3',
+    '/specStakes/{spec}',
+    '/providerHealth/{provider}',
+    '/providerErrors/{provider}',
+    '/providerStakes/{provider}',
+    '/providerEvents/{provider}',
+    '/providerRewards/{provider}',
+    '/providerReports/{provider}',
+    '/providerBlockReports/{provider}',
+    '/providerLatestHealth/{provider}',
+)
+
+
+class PollStats:
+    """The polls of one route in one mode."""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.bytes = 0
+        self.polls = 0
+        self.not_modified = 0
+        self.errors = 0
+
+    def record(self, status, micros, size):
+        if status not in (200, 304):
+            self.errors += 1
+            return
+        self.polls += 1
+        self.not_modified += status == 304
+        self.latency.record(micros)
+        self.bytes += size
+
+
+def _wire_size(headers, body):
+    # status line and header lines, near enough to what went over the wire
+    return 17 + sum(len(key) + len(value) + 4 for key, value in headers.items()) + 2 + len(body)
+
+
+async def _poll(pool, path, headers=None):
+    started = time.monotonic()
+    try:
+        status, response_headers, body = await pool.get(path, headers)
+    except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        return 'error', {}, 0, 0
+    return status, response_headers, _wire_size(response_headers, body), (time.monotonic() - started) * 1e6
+
+
+async def bench_route(pool, path, polls, interval):
+    """(plain stats, conditional stats, whether the route sent an ETag)"""
+    plain, conditional = PollStats(), PollStats()
+    etag = None
+    has_etag = False
+    for index in range(polls):
+        # alternate which poll goes first, so neither always sees the fresher server cache
+        order = (False, True) if index % 2 == 0 else (True, False)
+        for use_etag in order:
+            if use_etag:
+                status, headers, size, micros = await _poll(pool, path, {'If-None-Match': etag} if etag else None)
+                conditional.record(status, micros, size)
+                if headers.get('etag'):
+                    etag = headers['etag']
+                    has_etag = True
+            else:
+                status, headers, size, micros = await _poll(pool, path)
+                plain.record(status, micros, size)
+        if interval and index + 1 < polls:
+            await asyncio.sleep(interval)
+    return plain, conditional, has_etag
+
+
+def route_row(route, path, plain, conditional, has_etag):
+    plain_bytes = plain.bytes / plain.polls if plain.polls else None
+    conditional_bytes = conditional.bytes / conditional.polls if conditional.polls else None
+    plain_p50 = plain.latency.percentile(50) / 1000.0
+    conditional_p50 = conditional.latency.percentile(50) / 1000.0
+    return {
+        'route': route,
+        'path': path,
+        'etag': has_etag,
+        'polls': conditional.polls,
+        'not_modified_ratio': conditional.not_modified / conditional.polls if conditional.polls else None,
+        'plain_bytes_per_poll': plain_bytes,
+        'conditional_bytes_per_poll': conditional_bytes,
+        'bytes_saved_ratio': 1 - conditional_bytes / plain_bytes if plain_bytes and conditional_bytes is not None else None,
+        'plain_p50_ms': plain_p50,
+        'conditional_p50_ms': conditional_p50,
+        'plain_p95_ms': plain.latency.percentile(95) / 1000.0,
+        'conditional_p95_ms': conditional.latency.percentile(95) / 1000.0,
+        'latency_saved_ms': plain_p50 - conditional_p50,
+        'errors': plain.errors + conditional.errors,
+    }
+
+
+def _fmt(value, pattern='%.1f'):
+    return '-' if value is None else pattern % value
+
+
+def print_results(rows, out=sys.stdout):
+    header = '%-36s %5s %6s %12s %12s %7s %9s %9s %8s %6s' % (
+        'route', 'polls', '304%', 'plain B/poll', 'cond B/poll', 'saved', 'plain p50', 'cond p50', 'saved ms', 'errors')
+    print(header, file=out)
+    print('-' * len(header), file=out)
+    for row in rows:
+        print('%-36s %5d %6s %12s %12s %7s %9.1f %9.1f %8.1f %6d%s' % (
+            row['route'][:36], row['polls'],
+            _fmt(row['not_modified_ratio'] and 100 * row['not_modified_ratio'], '%.0f'),
+            _fmt(row['plain_bytes_per_poll'], '%.0f'), _fmt(row['conditional_bytes_per_poll'], '%.0f'),
+            _fmt(row['bytes_saved_ratio'] and 100 * row['bytes_saved_ratio'], '%.0f%%'),
+            row['plain_p50_ms'], row['conditional_p50_ms'], row['latency_saved_ms'], row['errors'],
+            '' if row['etag'] else '  no ETag'), file=out)
+    plain = sum((row['plain_bytes_per_poll'] or 0) * row['polls'] for row in rows)
+    conditional = sum((row['conditional_bytes_per_poll'] or 0) * row['polls'] for row in rows)
+    if plain:
+        print('(all routes: %.1f MB plain, %.1f MB conditional, %.0f%% saved)' % (
+            plain / 1e6, conditional / 1e6, 100.0 * (1 - conditional / plain)), file=out)
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Measure what If-None-Match revalidation saves on polled routes.')
+    parser.add_argument('--server', default=DEFAULT_SERVER,
+                        help='base URL (default: $TESTS_SERVER_ADDRESS or %(default)s)')
+    parser.add_argument('--route', action='append', default=[],
+                        help='route template to poll, can be repeated (default: the dashboard routes)')
+    parser.add_argument('--polls', type=int, default=10, help='polls per route and mode (default: %(default)s)')
+    parser.add_argument('--interval', type=float, default=0.5,
+                        help='seconds between polls of a route (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='routes polled at the same time (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=60.0,
+                        help='per request timeout in seconds (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the provider and spec choice')
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    return parser.parse_args(argv)
+
+
+async def _main(args):
+    # identity, so the bytes are the body's and not what a proxy's compression made of it
+    pool = ConnectionPool(args.server, args.concurrency, args.timeout, {'Accept-Encoding': 'identity'})
+    rng = random.Random(args.seed)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    try:
+        fixtures = await load_fixtures(pool)
+
+        async def one(route):
+            try:
+                path = route.format(**{name: rng.choice(ids) for name, ids in fixtures.items() if ids})
+            except KeyError as e:
+                print('%s: no ids for {%s}' % (route, e.args[0]), file=sys.stderr)
+                return None
+            async with semaphore:
+                plain, conditional, has_etag = await bench_route(pool, path, args.polls, args.interval)
+            print('%s: %d/%d not modified' % (path, conditional.not_modified, conditional.polls), file=sys.stderr)
+            return route_row(route, path, plain, conditional, has_etag)
+
+        rows = await asyncio.gather(*(one(route) for route in args.route or POLLED_ROUTES))
+        return [row for row in rows if row is not None]
+    finally:
+        pool.close()
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    rows = asyncio.run(_main(args))
+    print_results(rows)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+    return 0 if rows and all(row['etag'] for row in rows) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
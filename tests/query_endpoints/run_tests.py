@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+
+# jsinfo/tests/query_endpoints/run_tests.py
+#
+# Runs every test under ./tests in one interpreter, concurrently:
+#
+#   TESTS_SERVER_ADDRESS=http://localhost:8081 TESTS_FULL=true \
+#       python3 run_tests.py --junit test-results.xml
+#
+# The test modules are loaded as they are, each in its own thread. Their
+# requests.get calls go through one pooled requests.Session, and the /providers,
+# /consumers and /specs lists most modules start from are fetched once and
+# handed to all of them. Script style modules pass when loading them does not
+# raise or exit non-zero, a module that exits 0 while loading (the TESTS_FULL
+# gate) is reported as skipped. The .sh tests run as subprocesses.
+#
+# With --budgets budgets.json every route in the budget file is then sampled a
+# few times and the run fails when one is slower or larger than its budget, see
+# budgets.py.
+
+import argparse
+import concurrent.futures
+import glob
+import importlib.util
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import unittest
+import xml.etree.ElementTree as ET
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import budgets
+
+TESTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests')
+FIXTURE_PATHS = ('/providers', '/consumers', '/specs')
+DEFAULT_REQUEST_TIMEOUT = 120
+SHELL_TEST_TIMEOUT = 600
+
+
+class SharedSession:
+    """One pooled session for all test threads, with the fixture lists memoized."""
+
+    def __init__(self, server_address, pool_size, timeout):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        base = server_address.rstrip('/')
+        self.fixture_urls = {base + path for path in FIXTURE_PATHS}
+        self._fixtures = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def get(self, url, params=None, **kwargs):
+        if not params and not kwargs and url in self.fixture_urls:
+            return self.fixture(url)
+        kwargs.setdefault('timeout', self.timeout)
+        with self._lock:
+            self.requests += 1
+        return self.session.get(url, params=params, **kwargs)
+
+    def get_uncached(self, url):
+        """A fresh request even for the fixture lists, for timing them."""
+        with self._lock:
+            self.requests += 1
+        return self.session.get(url, timeout=self.timeout)
+
+    def fixture(self, url):
+        """Fetches url once, later and concurrent callers get the same response."""
+        with self._lock:
+            future = self._fixtures.get(url)
+            owner = future is None
+            if owner:
+                future = self._fixtures[url] = concurrent.futures.Future()
+        if owner:
+            try:
+                with self._lock:
+                    self.requests += 1
+                future.set_result(self.session.get(url, timeout=self.timeout))
+            except BaseException as e:
+                future.set_exception(e)
+        # the body is already read, so .json() and .text work for every caller
+        return future.result()
+
+    def prefetch(self, executor):
+        return [executor.submit(self.fixture, url) for url in sorted(self.fixture_urls)]
+
+
+class ThreadOutput(io.TextIOBase):
+    """sys.stdout/sys.stderr stand-in that keeps each test thread's output apart."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def capture(self, buffer):
+        self.local.buffer = buffer
+
+    def write(self, text):
+        buffer = getattr(self.local, 'buffer', None)
+        return (buffer if buffer is not None else self.stream).write(text)
+
+    def flush(self):
+        if getattr(self.local, 'buffer', None) is None:
+            self.stream.flush()
+
+    def isatty(self):
+        return False
+
+    @property
+    def encoding(self):
+        return self.stream.encoding
+
+
+class CaseResult:
+    """One <testcase> in the JUnit report."""
+
+    def __init__(self, classname, name, seconds, outcome='passed', message='', details=''):
+        self.classname = classname
+        self.name = name
+        self.seconds = seconds
+        self.outcome = outcome
+        self.message = message
+        self.details = details
+
+
+class RecordingResult(unittest.TestResult):
+    """unittest result that keeps a CaseResult with the duration of every test."""
+
+    def __init__(self, module):
+        super().__init__()
+        self.module = module
+        self.cases = []
+        self._started = {}
+
+    def _record(self, test, outcome, message='', details=''):
+        seconds = time.monotonic() - self._started.get(test.id(), time.monotonic())
+        classname = f"{self.module}.{type(test).__name__}" if isinstance(test, unittest.TestCase) else self.module
+        name = getattr(test, '_testMethodName', None) or str(test)
+        self.cases.append(CaseResult(classname, name, seconds, outcome, message, details))
+
+    def startTest(self, test):
+        super().startTest(test)
+        self._started[test.id()] = time.monotonic()
+
+    def addSuccess(self, test):
+        super().addSuccess(test)
+        self._record(test, 'passed')
+
+    def addFailure(self, test, err):
+        super().addFailure(test, err)
+        self._record(test, 'failure', str(err[1]), self._exc_info_to_string(err, test))
+
+    def addError(self, test, err):
+        # setUpClass errors arrive with a placeholder test instead of a TestCase
+        super().addError(test, err)
+        self._record(test, 'error', str(err[1]), self._exc_info_to_string(err, test))
+
+    def addSkip(self, test, reason):
+        super().addSkip(test, reason)
+        self._record(test, 'skipped', reason)
+
+    def addSubTest(self, test, subtest, err):
+        super().addSubTest(test, subtest, err)
+        if err is not None:
+            outcome = 'failure' if issubclass(err[0], test.failureException) else 'error'
+            self._record(test, outcome, f"{subtest._subDescription()}: {err[1]}", self._exc_info_to_string(err, test))
+
+
+class SuiteResult:
+    """One <testsuite>: the cases of a test file and everything it printed."""
+
+    def __init__(self, name):
+        self.name = name
+        self.cases = []
+        self.output = ''
+        self.seconds = 0.0
+
+    def count(self, outcome):
+        return sum(1 for case in self.cases if case.outcome == outcome)
+
+    @property
+    def ok(self):
+        return not self.count('failure') and not self.count('error')
+
+
+def run_python_test(path, stdout, stderr):
+    """Loads one test module and runs the unittest cases it defines."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    suite = SuiteResult(name)
+    buffer = io.StringIO()
+    stdout.capture(buffer)
+    stderr.capture(buffer)
+    started = time.monotonic()
+    try:
+        spec = importlib.util.spec_from_file_location(f"query_endpoints_tests.{name}", path)
+        module = importlib.util.module_from_spec(spec)
+        outcome, message, details = 'passed', '', ''
+        try:
+            spec.loader.exec_module(module)
+        except SystemExit as e:
+            if e.code in (0, None):
+                outcome, message = 'skipped', 'module exited while loading'
+            else:
+                outcome, message = 'failure', f"module exited with {e.code}"
+        except Exception as e:
+            outcome, message, details = 'error', repr(e), traceback.format_exc()
+        suite.cases.append(CaseResult(name, 'load', time.monotonic() - started, outcome, message, details))
+
+        if outcome == 'passed':
+            loader = unittest.TestLoader()
+            result = RecordingResult(name)
+            loader.loadTestsFromModule(module).run(result)
+            suite.cases.extend(result.cases)
+    finally:
+        stdout.capture(None)
+        stderr.capture(None)
+        suite.output = buffer.getvalue()
+        suite.seconds = time.monotonic() - started
+    return suite
+
+
+def run_shell_test(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    suite = SuiteResult(name)
+    started = time.monotonic()
+    try:
+        proc = subprocess.run([path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              text=True, timeout=SHELL_TEST_TIMEOUT)
+        suite.output = proc.stdout
+        outcome = 'passed' if proc.returncode == 0 else 'failure'
+        message = '' if proc.returncode == 0 else f"exited with {proc.returncode}"
+    except (OSError, subprocess.TimeoutExpired) as e:
+        outcome, message = 'error', str(e)
+    suite.seconds = time.monotonic() - started
+    suite.cases.append(CaseResult(name, os.path.basename(path), suite.seconds, outcome, message))
+    return suite
+
+
+def check_budgets(session, server_address, path, workers):
+    """Samples every route in the budget file, one suite case per route."""
+    suite = SuiteResult('budgets')
+    started = time.monotonic()
+    output = []
+    fixtures = budgets.load_fixture_ids(session.get, server_address)
+
+    def check(budget):
+        measurement = budgets.measure(session.get_uncached, server_address, budget, fixtures)
+        return budget, measurement, budgets.violations(budget, measurement)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for budget, measurement, over in executor.map(check, budgets.load_budgets(path)):
+            seconds = sum(measurement.latencies_ms) / 1000.0
+            if over:
+                diff = budgets.format_diff(budget, measurement, over)
+                output.append(diff)
+                outcome = 'error' if over[0][0] == 'error' else 'failure'
+                suite.cases.append(CaseResult('budgets', budget.route, seconds, outcome,
+                                              diff.splitlines()[0], diff))
+            else:
+                output.append(budgets.format_summary(budget, measurement))
+                suite.cases.append(CaseResult('budgets', budget.route, seconds))
+    suite.output = '\n'.join(output) + '\n'
+    suite.seconds = time.monotonic() - started
+    return suite
+
+
+def print_suite(suite):
+    status = 'ok' if suite.ok else 'FAILED'
+    print(f"TESTS:: {suite.name}: {status} ({suite.seconds:.2f}s)")
+    if not suite.ok or os.getenv('TESTS_VERBOSE', 'false').lower() == 'true':
+        print(suite.output.rstrip('\n'))
+        for case in suite.cases:
+            if case.outcome in ('failure', 'error') and case.classname != 'budgets':
+                print(f"  {case.outcome.upper()}: {case.classname}.{case.name}: {case.message}")
+                if case.details:
+                    print(case.details.rstrip('\n'))
+
+
+def write_junit(path, suites, seconds):
+    root = ET.Element('testsuites', name='query_endpoints', time=f"{seconds:.3f}",
+                      tests=str(sum(len(s.cases) for s in suites)),
+                      failures=str(sum(s.count('failure') for s in suites)),
+                      errors=str(sum(s.count('error') for s in suites)),
+                      skipped=str(sum(s.count('skipped') for s in suites)))
+    for suite in suites:
+        element = ET.SubElement(root, 'testsuite', name=suite.name, time=f"{suite.seconds:.3f}",
+                                tests=str(len(suite.cases)), failures=str(suite.count('failure')),
+                                errors=str(suite.count('error')), skipped=str(suite.count('skipped')))
+        for case in suite.cases:
+            testcase = ET.SubElement(element, 'testcase', classname=case.classname,
+                                     name=case.name, time=f"{case.seconds:.3f}")
+            if case.outcome != 'passed':
+                ET.SubElement(testcase, case.outcome, message=case.message).text = case.details or None
+        ET.SubElement(element, 'system-out').text = suite.output
+    ET.indent(root)
+    ET.ElementTree(root).write(path, encoding='utf-8', xml_declaration=True)
+
+
+def discover(patterns):
+    paths = sorted(glob.glob(os.path.join(TESTS_DIR, '*.py')) + glob.glob(os.path.join(TESTS_DIR, '*.sh')))
+    if patterns:
+        paths = [p for p in paths if any(pattern in os.path.basename(p) for pattern in patterns)]
+    return paths
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run the query endpoint tests concurrently.')
+    parser.add_argument('patterns', nargs='*',
+                        help='only run test files whose name contains one of these')
+    parser.add_argument('--workers', type=int, default=16,
+                        help='test files run at the same time (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_REQUEST_TIMEOUT,
+                        help='per request timeout in seconds (default: %(default)s)')
+    parser.add_argument('--junit', default=os.getenv('TESTS_JUNIT_XML'),
+                        help='write a JUnit XML report here (default: $TESTS_JUNIT_XML)')
+    parser.add_argument('--server', default=os.getenv('TESTS_SERVER_ADDRESS', 'http://localhost:8081'),
+                        help='server under test (default: $TESTS_SERVER_ADDRESS)')
+    parser.add_argument('--budgets', default=os.getenv('TESTS_BUDGETS'),
+                        help='check the latency and size budgets in this file after the tests '
+                             '(default: $TESTS_BUDGETS)')
+    parser.add_argument('--budget-workers', type=int, default=4,
+                        help='routes sampled at the same time (default: %(default)s)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    os.environ['TESTS_SERVER_ADDRESS'] = args.server
+    paths = discover(args.patterns)
+    if not paths and not args.budgets:
+        print(f"No tests match {args.patterns}")
+        return 1
+
+    workers = max(1, min(args.workers, max(len(paths), args.budget_workers)))
+    session = SharedSession(args.server, pool_size=workers * 2, timeout=args.timeout)
+    # the modules call requests.get() at call time, so they all end up on the pool
+    requests.get = session.get
+
+    stdout, stderr = ThreadOutput(sys.stdout), ThreadOutput(sys.stderr)
+    sys.stdout, sys.stderr = stdout, stderr
+
+    print(f"TESTS:: Server: {args.server}, Full Tests: {os.getenv('TESTS_FULL', 'false')}, "
+          f"Files: {len(paths)}, Workers: {workers}")
+    started = time.monotonic()
+    suites = []
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            # start the shared lists right away instead of on the first setUpClass
+            session.prefetch(executor)
+            futures = [
+                executor.submit(run_shell_test, path) if path.endswith('.sh')
+                else executor.submit(run_python_test, path, stdout, stderr)
+                for path in paths
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                suites.append(future.result())
+                print_suite(suites[-1])
+    finally:
+        sys.stdout, sys.stderr = stdout.stream, stderr.stream
+
+    if args.budgets:
+        # after the tests, so their load does not end up in the samples
+        suites.append(check_budgets(session, args.server, args.budgets, args.budget_workers))
+        print_suite(suites[-1])
+
+    seconds = time.monotonic() - started
+    suites.sort(key=lambda s: s.name)
+    if args.junit:
+        write_junit(args.junit, suites, seconds)
+
+    counts = {outcome: sum(s.count(outcome) for s in suites) for outcome in ('passed', 'failure', 'error', 'skipped')}
+    print(f"TESTS:: {counts['passed']} passed, {counts['failure']} failed, {counts['error']} errors, "
+          f"{counts['skipped']} skipped, {session.requests} requests in {seconds:.2f}s")
+    failed = [s.name for s in suites if not s.ok]
+    if failed:
+        print(f"TESTS:: Failed: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,572 @@
+#!/usr/bin/env python3
+
+# jsinfo/tests/query_endpoints/schema_check.py
+#
+# Checks query responses against the response schemas of swagger.yml and
+# response_schemas.yml. Each schema is compiled once, and the body is parsed as
+# it streams in: the outer objects and arrays are walked incrementally and the
+# items of an array are decoded and checked one at a time, so a response with
+# thousands of items never sits in memory whole:
+#
+#   python3 schema_check.py --server http://localhost:8081
+#   python3 schema_check.py --route /specStakes/{spec} --route /indexChartsV3 --json /tmp/schemas.json
+#
+# The time spent parsing and validating is counted apart from the time spent
+# waiting on the network, so a slow check does not read as a slow server.
+# Supported schema keywords: type (one or a list), properties, required,
+# additionalProperties: false, items, enum, format: date-time, x-nullable,
+# anyOf and local $refs to #/definitions.
+
+import argparse
+import codecs
+import json
+import os
+import re
+import sys
+import time
+
+import requests
+import yaml
+
+from bench import DEFAULT_SERVER
+from budgets import load_fixture_ids
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SCHEMA_FILES = (
+    os.path.join(HERE, '..', '..', 'swagger.yml'),
+    os.path.join(HERE, 'response_schemas.yml'),
+)
+CHUNK_SIZE = 64 * 1024
+MAX_ERRORS = 20
+# what a number can still go on with at the end of a chunk
+NUMBER_CHARS = '0123456789.eE+-'
+DATE_TIME = re.compile(r'^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:?\d{2})?$')
+
+_PYTHON_TYPES = {
+    'object': lambda value: isinstance(value, dict),
+    'array': lambda value: isinstance(value, list),
+    'string': lambda value: isinstance(value, str),
+    'boolean': lambda value: isinstance(value, bool),
+    'null': lambda value: value is None,
+    'number': lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    'integer': lambda value: (isinstance(value, int) and not isinstance(value, bool)) or
+                             (isinstance(value, float) and value.is_integer()),
+}
+
+
+class SchemaErrors:
+    """The first MAX_ERRORS problems, and how many there were in all."""
+
+    def __init__(self, limit=MAX_ERRORS):
+        self.limit = limit
+        self.count = 0
+        self.messages = []
+
+    def add(self, path, message):
+        self.count += 1
+        if len(self.messages) < self.limit:
+            self.messages.append('%s: %s' % (path, message))
+
+    def __bool__(self):
+        return self.count > 0
+
+
+class CompiledSchema:
+    """One schema node, with its children compiled and $refs resolved."""
+
+    __slots__ = ('types', 'type_checks', 'properties', 'required', 'additional', 'items', 'enum', 'date_time', 'any_of')
+
+    def __init__(self):
+        self.types = None
+        self.type_checks = None
+        self.properties = {}
+        self.required = ()
+        self.additional = True
+        self.items = None
+        self.enum = None
+        self.date_time = False
+        self.any_of = None
+
+    def type_name(self):
+        return '|'.join(self.types) if self.types else 'any'
+
+    def accepts_type(self, value):
+        return self.type_checks is None or any(check(value) for check in self.type_checks)
+
+    def check(self, value, path, errors):
+        """Checks a decoded value and everything under it."""
+        if not self.accepts_type(value):
+            errors.add(path, 'expected %s, got %s' % (self.type_name(), _json_type(value)))
+            return
+        if self.enum is not None and value not in self.enum:
+            errors.add(path, '%r is not one of %r' % (value, self.enum))
+        if self.date_time and isinstance(value, str) and not DATE_TIME.match(value):
+            errors.add(path, '%r is not a date-time' % value[:50])
+        if self.any_of is not None:
+            for option in self.any_of:
+                option_errors = SchemaErrors(1)
+                option.check(value, path, option_errors)
+                if not option_errors:
+                    break
+            else:
+                errors.add(path, 'matches none of the anyOf schemas')
+        if isinstance(value, dict):
+            for key in self.required:
+                if key not in value:
+                    errors.add(path, 'missing required key %r' % key)
+            for key, child in value.items():
+                self.check_member(key, child, path, errors)
+        elif isinstance(value, list) and self.items is not None:
+            for index, item in enumerate(value):
+                self.items.check(item, '%s[%d]' % (path, index), errors)
+
+    def check_member(self, key, value, path, errors):
+        schema = self.member(key, path, errors)
+        if schema is not None:
+            schema.check(value, '%s.%s' % (path, key), errors)
+
+    def member(self, key, path, errors):
+        """The schema of an object member, None when it is not checked."""
+        schema = self.properties.get(key)
+        if schema is None and not self.additional:
+            errors.add(path, 'unexpected key %r' % key)
+        return schema
+
+
+def _json_type(value):
+    for name in ('null', 'boolean', 'integer', 'number', 'string', 'array', 'object'):
+        if _PYTHON_TYPES[name](value):
+            return name
+    return type(value).__name__
+
+
+def compile_schema(schema, definitions=None, _resolving=()):
+    """A CompiledSchema for a swagger 2.0 / JSON schema dict."""
+    definitions = definitions or {}
+    compiled = CompiledSchema()
+    if not schema:
+        return compiled
+    ref = schema.get('$ref')
+    if ref:
+        name = ref.rsplit('/', 1)[-1]
+        if not ref.startswith('#/definitions/') or name not in definitions:
+            raise ValueError('unresolved $ref %s' % ref)
+        if name in _resolving:
+            return compiled  # a recursive definition is checked one level deep
+        return compile_schema(definitions[name], definitions, _resolving + (name,))
+
+    types = schema.get('type')
+    if types is not None:
+        types = [types] if isinstance(types, str) else list(types)
+        if schema.get('x-nullable') and 'null' not in types:
+            types.append('null')
+        unknown = [name for name in types if name not in _PYTHON_TYPES]
+        if unknown:
+            raise ValueError('unknown schema type %s' % ', '.join(map(str, unknown)))
+        compiled.types = tuple(types)
+        compiled.type_checks = tuple(_PYTHON_TYPES[name] for name in types)
+    compiled.properties = {key: compile_schema(child, definitions, _resolving)
+                           for key, child in (schema.get('properties') or {}).items()}
+    compiled.required = tuple(schema.get('required') or ())
+    compiled.additional = schema.get('additionalProperties', True) is not False
+    if 'items' in schema:
+        compiled.items = compile_schema(schema['items'], definitions, _resolving)
+    if 'enum' in schema:
+        compiled.enum = list(schema['enum'])
+    compiled.date_time = schema.get('format') == 'date-time'
+    if 'anyOf' in schema:
+        compiled.any_of = [compile_schema(option, definitions, _resolving) for option in schema['anyOf']]
+    return compiled
+
+
+def load_schemas(paths=DEFAULT_SCHEMA_FILES):
+    """{route template: CompiledSchema} of the 200 responses, later files overriding earlier ones."""
+    routes = {}
+    for path in paths:
+        with open(path) as f:
+            document = yaml.safe_load(f) or {}
+        definitions = document.get('definitions') or {}
+        for route, methods in (document.get('paths') or {}).items():
+            responses = ((methods or {}).get('get') or {}).get('responses') or {}
+            response = responses.get(200) or responses.get('200')
+            if response and 'schema' in response:
+                routes[route] = compile_schema(response['schema'], definitions)
+    return routes
+
+
+class _Container:
+    __slots__ = ('schema', 'path', 'is_object', 'state', 'key', 'member', 'seen', 'index')
+
+    def __init__(self, schema, path, is_object):
+        self.schema = schema
+        self.path = path
+        self.is_object = is_object
+        self.state = 'first'
+        self.key = None
+        # the schema of the current key's value, resolved once at its ':'
+        self.member = None
+        self.seen = set() if is_object else None
+        self.index = 0
+
+
+class StreamingValidator:
+    """Parses a JSON body fed in chunks and checks it against a CompiledSchema as it goes.
+
+    Objects and arrays are walked incrementally down to the items of an
+    array; each item is then decoded on its own with the C JSON decoder and
+    checked whole. Only the current item and the unparsed tail of the input
+    are held.
+    """
+
+    def __init__(self, schema, max_errors=MAX_ERRORS):
+        self.schema = schema
+        self.errors = SchemaErrors(max_errors)
+        self.items = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._need = 0
+        self._stack = []
+        self._root_done = False
+        self._failed = False
+
+    def feed(self, chunk):
+        started = time.perf_counter()
+        self.bytes += len(chunk)
+        self._buffer += self._decoder.decode(chunk)
+        if not self._failed and len(self._buffer) - self._pos >= self._need:
+            self._parse(final=False)
+        if self._pos > CHUNK_SIZE:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        self.seconds += time.perf_counter() - started
+
+    def close(self):
+        started = time.perf_counter()
+        self._buffer += self._decoder.decode(b'', final=True)
+        if not self._failed:
+            self._parse(final=True)
+            if not self._failed and (self._stack or not self._root_done):
+                self.errors.add('$', 'truncated JSON')
+        self.seconds += time.perf_counter() - started
+
+    def _fail(self, message):
+        self._failed = True
+        self.errors.add(self._stack[-1].path if self._stack else '$', message)
+
+    def _skip_whitespace(self):
+        buffer, pos = self._buffer, self._pos
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+            pos += 1
+        self._pos = pos
+
+    def _decode(self, final):
+        """The JSON value at the current position, or raises _NeedMore."""
+        try:
+            value, end = self._json.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError as e:
+            if final:
+                self._fail('invalid JSON at character %d of the remaining input: %s' % (self._pos, e.msg))
+                raise _Stop()
+            # an unfinished value, retry once there is twice as much left to read
+            self._need = 2 * (len(self._buffer) - self._pos) + 1
+            raise _NeedMore()
+        if not final and isinstance(value, (int, float)) and not self._buffer[end:].strip(NUMBER_CHARS):
+            # a number at the end of the input may go on in the next chunk; raw_decode
+            # also stops before a trailing '.', 'e' or sign, as in '15.' or '1e'
+            self._need = len(self._buffer) - self._pos + 1
+            raise _NeedMore()
+        self._pos = end
+        return value
+
+    def _value(self, schema, path, stream_containers, final):
+        """Opens a container to walk, or decodes and checks a whole value."""
+        char = self._buffer[self._pos]
+        if stream_containers and char in '{[':
+            if schema is not None and not schema.accepts_type({} if char == '{' else []):
+                self.errors.add(path, 'expected %s, got %s' % (schema.type_name(), 'object' if char == '{' else 'array'))
+                schema = None
+            self._pos += 1
+            self._stack.append(_Container(schema, path, char == '{'))
+            return
+        value = self._decode(final)
+        if schema is not None:
+            schema.check(value, path, self.errors)
+        self._closed_value()
+
+    def _closed_value(self):
+        if self._stack:
+            self._stack[-1].state = 'after'
+        else:
+            self._root_done = True
+
+    def _close_container(self, container):
+        self._pos += 1
+        self._stack.pop()
+        if container.is_object and container.schema is not None:
+            for key in container.schema.required:
+                if key not in container.seen:
+                    self.errors.add(container.path, 'missing required key %r' % key)
+        self._closed_value()
+
+    def _parse(self, final):
+        self._need = 0
+        try:
+            while True:
+                self._skip_whitespace()
+                if self._pos >= len(self._buffer):
+                    return
+                if not self._stack:
+                    if self._root_done:
+                        self._fail('extra data after the JSON value')
+                        return
+                    self._value(self.schema, '$', True, final)
+                    continue
+
+                container = self._stack[-1]
+                char = self._buffer[self._pos]
+                if container.is_object:
+                    self._parse_object(container, char, final)
+                else:
+                    self._parse_array(container, char, final)
+        except _NeedMore:
+            return
+        except _Stop:
+            return
+
+    def _parse_object(self, container, char, final):
+        state = container.state
+        if state in ('first', 'key'):
+            if char == '}' and state == 'first':
+                self._close_container(container)
+                return
+            if char != '"':
+                self._fail('expected a key, got %r' % char)
+                raise _Stop()
+            container.key = self._decode(final)
+            container.state = 'colon'
+        elif state == 'colon':
+            if char != ':':
+                self._fail('expected ":", got %r' % char)
+                raise _Stop()
+            self._pos += 1
+            container.seen.add(container.key)
+            container.member = None
+            if container.schema is not None:
+                container.member = container.schema.member(container.key, container.path, self.errors)
+            container.state = 'value'
+        elif state == 'value':
+            # retried from here while the value is split across chunks
+            self._value(container.member, '%s.%s' % (container.path, container.key), True, final)
+        else:
+            if char == ',':
+                self._pos += 1
+                container.state = 'key'
+            elif char == '}':
+                self._close_container(container)
+            else:
+                self._fail('expected "," or "}", got %r' % char)
+                raise _Stop()
+
+    def _parse_array(self, container, char, final):
+        state = container.state
+        if state in ('first', 'value'):
+            if char == ']' and state == 'first':
+                self._close_container(container)
+                return
+            items = container.schema.items if container.schema is not None else None
+            self._value(items, '%s[%d]' % (container.path, container.index), False, final)
+            container.index += 1
+            self.items += 1
+        else:
+            if char == ',':
+                self._pos += 1
+                container.state = 'value'
+            elif char == ']':
+                self._close_container(container)
+            else:
+                self._fail('expected "," or "]", got %r' % char)
+                raise _Stop()
+
+
+class _NeedMore(Exception):
+    pass
+
+
+class _Stop(Exception):
+    pass
+
+
+class _TextValidator:
+    """Checks a text/plain body as one string value, these are small."""
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.errors = SchemaErrors()
+        self.items = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self._chunks = []
+
+    def feed(self, chunk):
+        self.bytes += len(chunk)
+        self._chunks.append(chunk)
+
+    def close(self):
+        started = time.perf_counter()
+        self.schema.check(b''.join(self._chunks).decode('utf-8', 'replace'), '$', self.errors)
+        self.seconds += time.perf_counter() - started
+
+
+class ResponseCheck:
+    """What fetching and checking one URL gave."""
+
+    def __init__(self, url):
+        self.url = url
+        self.status = None
+        self.ttfb_ms = None
+        self.total_ms = None
+        self.validate_ms = 0.0
+        self.bytes = 0
+        self.items = 0
+        self.errors = SchemaErrors()
+        self.error = None
+
+    @property
+    def network_ms(self):
+        return self.total_ms - self.validate_ms if self.total_ms is not None else None
+
+    @property
+    def ok(self):
+        return self.error is None and self.status == 200 and not self.errors
+
+    def problems(self):
+        if self.error:
+            return [self.error]
+        if self.status != 200:
+            return ['status %s' % self.status]
+        problems = list(self.errors.messages)
+        if self.errors.count > len(self.errors.messages):
+            problems.append('... %d more' % (self.errors.count - len(self.errors.messages)))
+        return problems
+
+    def summary(self):
+        if self.error or self.status != 200:
+            return '%s: %s' % (self.url, self.problems()[0])
+        return '%s: %d bytes, %d items, network %.0fms, validation %.1fms, %s' % (
+            self.url, self.bytes, self.items, self.network_ms, self.validate_ms,
+            'ok' if self.ok else '%d schema errors' % self.errors.count)
+
+    def row(self, route=None):
+        return {
+            'route': route,
+            'url': self.url,
+            'status': self.status,
+            'bytes': self.bytes,
+            'items': self.items,
+            'ttfb_ms': self.ttfb_ms,
+            'total_ms': self.total_ms,
+            'network_ms': self.network_ms,
+            'validate_ms': self.validate_ms,
+            'errors': self.errors.count,
+            'problems': self.problems(),
+        }
+
+
+def check_response(get, url, schema, chunk_size=CHUNK_SIZE):
+    """Streams url through `get` (requests.get or a session's) into a StreamingValidator."""
+    result = ResponseCheck(url)
+    validator = StreamingValidator(schema)
+    started = time.monotonic()
+    try:
+        with get(url, stream=True) as response:
+            result.status = response.status_code
+            if response.status_code != 200:
+                return result
+            if 'json' not in response.headers.get('Content-Type', 'application/json'):
+                # a plain text body, like /supply/total, is the string itself
+                validator = _TextValidator(schema)
+            for chunk in response.iter_content(chunk_size):
+                if result.ttfb_ms is None:
+                    result.ttfb_ms = (time.monotonic() - started) * 1000.0
+                validator.feed(chunk)
+            validator.close()
+    except Exception as e:
+        result.error = '%r' % e
+        return result
+    result.total_ms = (time.monotonic() - started) * 1000.0
+    result.validate_ms = validator.seconds * 1000.0
+    result.bytes = validator.bytes
+    result.items = validator.items
+    result.errors = validator.errors
+    return result
+
+
+def print_results(rows, out=sys.stdout):
+    header = '%-44s %6s %10s %7s %10s %11s %6s' % ('route', 'status', 'bytes', 'items', 'network ms', 'validate ms', 'errors')
+    print(header, file=out)
+    print('-' * len(header), file=out)
+    for row in rows:
+        if row['total_ms'] is None:
+            print('%-44s %s' % (row['route'][:44], row['problems'][0] if row['problems'] else '-'), file=out)
+            continue
+        print('%-44s %6s %10d %7d %10.1f %11.1f %6d' % (
+            row['route'][:44], row['status'], row['bytes'], row['items'], row['network_ms'],
+            row['validate_ms'], row['errors']), file=out)
+    for row in rows:
+        if row['errors']:
+            print('\n%s' % row['url'], file=out)
+            for problem in row['problems']:
+                print('  %s' % problem, file=out)
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Check query responses against their swagger schemas, streaming.')
+    parser.add_argument('--server', default=DEFAULT_SERVER,
+                        help='base URL (default: $TESTS_SERVER_ADDRESS or %(default)s)')
+    parser.add_argument('--schemas', action='append', default=[], metavar='PATH',
+                        help='swagger style schema file, can be repeated (default: swagger.yml and response_schemas.yml)')
+    parser.add_argument('--route', action='append', default=[],
+                        help='route template to check, can be repeated (default: every route with a schema)')
+    parser.add_argument('--timeout', type=float, default=120.0,
+                        help='per request timeout in seconds (default: %(default)s)')
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    server = args.server.rstrip('/')
+    schemas = load_schemas(args.schemas or DEFAULT_SCHEMA_FILES)
+    session = requests.Session()
+
+    def get(url, **kwargs):
+        return session.get(url, timeout=args.timeout, **kwargs)
+
+    fixtures = load_fixture_ids(get, server)
+    rows = []
+    for route in args.route or sorted(schemas):
+        if route not in schemas:
+            print('%s: no schema' % route, file=sys.stderr)
+            return 2
+        try:
+            url = server + route.format(**{name: ids[0] for name, ids in fixtures.items() if ids})
+        except KeyError as e:
+            print('%s: no ids for {%s}' % (route, e.args[0]), file=sys.stderr)
+            continue
+        result = check_response(get, url, schemas[route])
+        print(result.summary(), file=sys.stderr)
+        rows.append(result.row(route))
+
+    print_results(rows)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+    return 0 if rows and all(not row['problems'] for row in rows) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
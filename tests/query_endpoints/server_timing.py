@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+# jsinfo/tests/query_endpoints/server_timing.py
+#
+# Where the query server spends the time of each endpoint, from the
+# Server-Timing header it sends with every response (db, redis, serialize and
+# total ms, see src/utils/requestTiming.ts):
+#
+#   python3 server_timing.py --server http://localhost:8081 --mix provider --requests 500
+#   python3 server_timing.py --route /indexChartsV3 --route '/providerHealth/{provider}' --requests 100
+#   python3 server_timing.py --mix default --folded /tmp/query.folded && flamegraph.pl /tmp/query.folded > /tmp/query.svg
+#
+# Requests are drawn from a bench.py mix and sent by --concurrency clients.
+# Every endpoint is reported apart for redis cache hits and misses, from the
+# X-Jsinfo-Cache header. "other" is the server's total less its db, redis and
+# serialize time: the handler's own code, fastify and the event loop. "wire"
+# is what the client measured on top of the server's total: the network and
+# the socket queues. db counts every query, so an endpoint that runs its
+# queries in parallel can show more db than total; its "other" is then 0.
+#
+# --folded writes the same breakdown as folded stacks (endpoint;cache;phase
+# microseconds), the input of flamegraph.pl and speedscope.
+
+import argparse
+import asyncio
+import collections
+import json
+import random
+import sys
+import time
+
+from bench import (DEFAULT_SERVER, CACHE_HEADER, SERVER_TIMING_HEADER, ConnectionPool, LatencyHistogram, Mix,
+                   load_fixtures, load_mix, parse_server_timing)
+
+SERVER_PHASES = ('db', 'redis', 'serialize')
+PHASES = SERVER_PHASES + ('other', 'wire')
+# one character per phase in the bars of the flame summary
+PHASE_MARKS = {'db': 'D', 'redis': 'R', 'serialize': 'S', 'other': 'o', 'wire': '.'}
+BAR_WIDTH = 50
+
+
+class PhaseStats:
+    """The Server-Timing of the responses of one endpoint in one cache state."""
+
+    def __init__(self):
+        self.requests = 0
+        self.without_header = 0
+        self.errors = 0
+        self.total = LatencyHistogram()
+        self.client = LatencyHistogram()
+        self.phase_ms = collections.Counter()
+
+    def record(self, status, client_ms, timings):
+        if status != 200:
+            self.errors += 1
+            return
+        self.requests += 1
+        self.client.record(client_ms * 1000.0)
+        if 'total' not in timings:
+            self.without_header += 1
+            return
+        total = timings['total']
+        self.total.record(total * 1000.0)
+        for phase in SERVER_PHASES:
+            self.phase_ms[phase] += timings.get(phase, 0.0)
+        self.phase_ms['other'] += max(0.0, total - sum(timings.get(phase, 0.0) for phase in SERVER_PHASES))
+        self.phase_ms['wire'] += max(0.0, client_ms - total)
+
+    def row(self, template, cache):
+        timed = self.requests - self.without_header
+        mean = {phase: self.phase_ms[phase] / timed if timed else None for phase in PHASES}
+        accounted = sum(value for value in mean.values() if value is not None)
+        return {
+            'template': template,
+            'cache': cache,
+            'requests': self.requests,
+            'without_header': self.without_header,
+            'errors': self.errors,
+            'total_p50_ms': self.total.percentile(50) / 1000.0 if timed else None,
+            'total_p95_ms': self.total.percentile(95) / 1000.0 if timed else None,
+            'client_p50_ms': self.client.percentile(50) / 1000.0 if self.requests else None,
+            'mean_ms': mean,
+            'share': {phase: mean[phase] / accounted if accounted and mean[phase] is not None else None
+                      for phase in PHASES},
+        }
+
+
+async def run(pool, mix, requests, concurrency):
+    """{(template, cache): PhaseStats} over `requests` paths of the mix."""
+    stats = collections.defaultdict(PhaseStats)
+    remaining = requests
+
+    async def client():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            template, path = mix.next()
+            started = time.monotonic()
+            try:
+                status, headers, _ = await pool.get(path)
+            except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                stats[(template, '-')].record('error', 0.0, {})
+                continue
+            client_ms = (time.monotonic() - started) * 1000.0
+            timings = parse_server_timing(headers.get(SERVER_TIMING_HEADER))
+            stats[(template, headers.get(CACHE_HEADER) or '-')].record(status, client_ms, timings)
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return stats
+
+
+def _fmt(value, pattern='%.1f'):
+    return '-' if value is None else pattern % value
+
+
+def print_breakdown(rows, out=sys.stdout):
+    header = '%-40s %5s %6s %9s %9s' % ('endpoint', 'cache', 'reqs', 'p50 ms', 'p95 ms')
+    header += ''.join(' %9s' % phase for phase in PHASES)
+    print(header, file=out)
+    print('-' * len(header), file=out)
+    for row in rows:
+        line = '%-40s %5s %6d %9s %9s' % (row['template'][:40], row['cache'], row['requests'],
+                                        _fmt(row['total_p50_ms']), _fmt(row['total_p95_ms']))
+        line += ''.join(' %9s' % _fmt(row['mean_ms'][phase]) for phase in PHASES)
+        if row['without_header']:
+            line += '  %d without Server-Timing' % row['without_header']
+        print(line, file=out)
+    print('(phase columns are mean ms per request)', file=out)
+
+
+def print_flame(rows, out=sys.stdout):
+    """Each endpoint's mean request as a bar split by phase, widest first, scaled to the slowest."""
+    timed = [row for row in rows if row['share']['db'] is not None]
+    if not timed:
+        return
+    widest = max(sum(row['mean_ms'][phase] for phase in PHASES) for row in timed)
+    print('\n%s   (%s)' % (' ' * 46, ', '.join('%s %s' % (PHASE_MARKS[phase], phase) for phase in PHASES)), file=out)
+    for row in sorted(timed, key=lambda row: -sum(row['mean_ms'][phase] for phase in PHASES)):
+        mean_total = sum(row['mean_ms'][phase] for phase in PHASES)
+        width = max(1, round(BAR_WIDTH * mean_total / widest)) if widest else 1
+        bar = ''.join(PHASE_MARKS[phase] * round(width * row['share'][phase]) for phase in PHASES)
+        print('%-40s %5s |%-*s| %.1f ms' % (row['template'][:40], row['cache'], BAR_WIDTH, bar[:BAR_WIDTH], mean_total),
+              file=out)
+
+
+def write_folded(rows, path):
+    """endpoint;cache;phase microseconds lines, summed over every request."""
+    with open(path, 'w') as f:
+        for row in rows:
+            timed = row['requests'] - row['without_header']
+            for phase in PHASES:
+                if row['mean_ms'][phase]:
+                    f.write('%s;%s;%s %d\n' % (row['template'].replace(';', ':'), row['cache'], phase,
+                                               round(row['mean_ms'][phase] * timed * 1000)))
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Break the query server\'s time per endpoint down by Server-Timing phase.')
+    parser.add_argument('--server', default=DEFAULT_SERVER,
+                        help='base URL (default: $TESTS_SERVER_ADDRESS or %(default)s)')
+    parser.add_argument('--mix', default='default', help='bench.py mix name or JSON file (default: %(default)s)')
+    parser.add_argument('--route', action='append', default=[],
+                        help='route template to request instead of the mix, can be repeated')
+    parser.add_argument('--requests', type=int, default=300, help='requests to send (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=4, help='clients in flight at once (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=60.0,
+                        help='per request timeout in seconds (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the paths')
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    parser.add_argument('--folded', metavar='PATH', help='also write folded stacks for flamegraph.pl or speedscope')
+    return parser.parse_args(argv)
+
+
+async def _main(args):
+    pool = ConnectionPool(args.server, args.concurrency, args.timeout)
+    try:
+        entries = [(1, route) for route in args.route] or load_mix(args.mix)
+        mix = Mix(entries, await load_fixtures(pool), random.Random(args.seed))
+        return await run(pool, mix, args.requests, args.concurrency)
+    finally:
+        pool.close()
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    started = time.monotonic()
+    stats = asyncio.run(_main(args))
+    print('%d requests in %.0fs' % (args.requests, time.monotonic() - started), file=sys.stderr)
+
+    rows = [stats[key].row(*key) for key in sorted(stats)]
+    print_breakdown(rows)
+    print_flame(rows)
+    if args.folded:
+        write_folded(rows, args.folded)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+    missing = [row['template'] for row in rows if row['requests'] and row['without_header'] == row['requests']]
+    if missing:
+        print('\nno Server-Timing header: %s' % ', '.join(sorted(set(missing))), file=sys.stderr)
+    return 1 if missing or not rows else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
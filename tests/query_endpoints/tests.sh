@@ -5,7 +5,7 @@ cd "$(dirname "$0")"
 
 # Check for mode argument
 if [ $# -eq 0 ]; then
-  echo "No mode specified. Usage: $0 [local|staging|testnet|mainnet]"
+  echo "No mode specified. Usage: $0 [local|staging|testnet|mainnet] [run_tests.py args]"
   exit 1
 fi
 
@@ -35,7 +35,7 @@ case $TESTS_ENV in
     export TESTS_SERVER_ADDRESS=${TESTS_SERVER_ADDRESS_MAINNET}
     ;;
   *)
-    echo "Invalid mode specified. Usage: $0 [local|staging|testnet|mainnet]"
+    echo "Invalid mode specified. Usage: $0 [local|staging|testnet|mainnet] [run_tests.py args]"
     exit 1
     ;;
 esac
@@ -52,38 +52,14 @@ echo "TESTS_ENV: $TESTS_ENV"
 #   exit 1
 # fi
 
-# Define an array of commands to execute
-commands=(
-  "./tests/mainnet_endpoints.sh"
-  "python3 ./tests/ajax_endpoints.py"
-
-  "python3 ./tests/index_page_endpoints.py"
-
-  # TESTS_FULL tests:
-  "python3 ./tests/provider_page_endpoints.py"
-  "python3 ./tests/provider_tabs_endpoints.py"
-  "python3 ./tests/provider_csv_endpoints.py"
-
-  "python3 ./tests/consumer_page_endpoints.py"
-
-  "python3 ./tests/events_page_endpoints.py"
-  "python3 ./tests/events_csv_endpoints.py"
-
-  "python3 ./tests/spec_page_endpoints.py"
-  "python3 ./tests/spec_providerhealth_endpoint.py"
-
-  "python3 ./tests/lava_iprpc_endpoint.py"
-)
-
-# Loop through the commands and execute them
-for cmd in "${commands[@]}"; do
-  echo "TESTS:: Environment: $TESTS_ENV, Full Tests: $TESTS_FULL, Time: $(date)"
-  echo "TESTS:: Executing: $cmd"
-  if ! $cmd; then
-    echo "Error executing: $cmd"
-    exit 1
-  fi
-done
+# Run every file under ./tests concurrently in one interpreter, sharing one
+# pooled HTTP session and the /providers, /consumers and /specs lists. Extra
+# arguments go to the runner, e.g. "./tests.sh local provider_" or
+# "./tests.sh local --junit test-results.xml".
+echo "TESTS:: Environment: $TESTS_ENV, Full Tests: $TESTS_FULL, Time: $(date)"
+if ! python3 ./run_tests.py "${@:2}"; then
+  echo "Error executing query endpoint tests"
+  exit 1
+fi
 
 echo "All tests executed successfully."
-
@@ -6,6 +6,9 @@ import sys
 import requests
 import unittest
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from csv_check import check_csv_export
+
 if os.getenv('TESTS_FULL', 'false').lower() != 'true':
     print("Skipping provider csv tests")
     sys.exit(0)
@@ -16,14 +19,17 @@ server_address = os.getenv('TESTS_SERVER_ADDRESS', 'http://localhost:8081')
 class TestCsvEndpoints(unittest.TestCase):
     def fetch_endpoint_data(self, endpoint):
         url = f"{server_address}{endpoint}"
-        response = requests.get(url)
-        if "Data is unavailable now" in response.text:
+        # streamed, every row is checked against the header's column count as it arrives
+        report = check_csv_export(requests.get, url)
+        if report.error:
+            return '', report.error, 1
+        if report.status != 200:
+            return '', f"status code: {report.status}", report.status
+        if report.unavailable:
             return '', '', 0
-        if response.status_code == 200:
-            # Split response text into lines and return the first 4 lines joined as a single string
-            return '\n'.join(response.text.split('\n')[:4]), '', 0
-        else:
-            return '', response.text, response.status_code
+        print(report.summary())
+        self.assertFalse(report.validator.bad_rows, '\n'.join(report.problems()))
+        return report.validator.header, '', 0
     
     def test_eventsEventsCsv(self):
         stdout, stderr, returncode = self.fetch_endpoint_data("/eventsEventsCsv")
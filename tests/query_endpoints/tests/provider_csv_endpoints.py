@@ -6,6 +6,9 @@ import sys
 import requests
 import random
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from csv_check import check_csv_export
+
 if os.getenv('TESTS_FULL', 'false').lower() != 'true':
     print("Skipping provider csv endpoint tests")
     sys.exit(0)
@@ -35,18 +38,18 @@ for provider in selected_providers:
     ]
 
 def compare_output(url, expected_output):
-    response = requests.get(url)
-    if response.status_code == 200:
-        first_line = response.text.split('\n', 1)[0].strip()
-        if first_line == expected_output:
-            print(f"Match found for: {url}")
-        elif first_line == "Data is unavailable now":
-            print(f"Data is unavailable now for: {url}")
-        else:
-            print(f"Mismatch found for {url}:\nExpected: {expected_output}\nActual: {first_line}\n")
-            sys.exit(1)
+    # streamed, so a large export is checked row by row without holding it in memory
+    report = check_csv_export(requests.get, url)
+    if report.error or report.status != 200:
+        print(f"Error fetching data from {url}, {report.error or f'status code: {report.status}'}")
+    elif report.unavailable:
+        print(f"Data is unavailable now for: {url}")
     else:
-        print(f"Error fetching data from {url}, status code: {response.status_code}")
+        problems = report.problems(expected_output)
+        if problems:
+            print(f"Mismatch found for {url}:\n" + "\n".join(problems) + "\n")
+            sys.exit(1)
+        print(f"Match found for: {report.summary()}")
 
 # Execute and compare
 for command, expected_output in commands_and_expected_outputs:
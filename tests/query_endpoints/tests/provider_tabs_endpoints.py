@@ -127,6 +127,29 @@ class TestProviderEndpoints(unittest.TestCase):
             assert 'datetime' in relay_payments
             assert 'qosSync' in relay_payments
 
+    def test_provider_rewards_cursor_pagination(self):
+        # relay_payments.blockId can be NULL: a cursor crawl has to return every
+        # row once, with the NULL block ids last, in both directions
+        for provider in self.selected_providers:
+            item_count = requests.get(f"{server_address}/item-count/providerRewards/{provider}").json().get('itemCount')
+            if not item_count or item_count > 2000:
+                continue
+            crawled = {}
+            for direction in ('a', 'd'):
+                rows, cursor = [], '-'
+                while cursor:
+                    url = f"{server_address}/providerRewards/{provider}?pagination=relay_payments.blockId,{direction},1,100&cursor={cursor}"
+                    response = self.make_request(url)
+                    assert response.status_code == 200, f"Expected status code 200, got {response.status_code} for url: {url}"
+                    rows.extend(row['relay_payments'] for row in response.json()['data'])
+                    cursor = response.json()['nextCursor']
+                ids = [row['id'] for row in rows]
+                assert len(ids) == len(set(ids)), f"cursor crawl repeated rows for {provider}, direction {direction}"
+                nulls = [row['blockId'] is None for row in rows]
+                assert nulls == sorted(nulls), f"NULL blockId rows are not last for {provider}, direction {direction}"
+                crawled[direction] = set(ids)
+            assert crawled['a'] == crawled['d'], f"ascending and descending cursor crawls differ for {provider}"
+
     def test_provider_reports(self):
         for provider in self.selected_providers:
             response = requests.get(f"{server_address}/providerReports/{provider}")